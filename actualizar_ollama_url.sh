@@ -5,12 +5,14 @@
 # 1. Lanzar ollama serve con OLLAMA_HOST=0.0.0.0
 # 2. Iniciar un túnel con localtunnel
 # 3. Obtener URL del túnel
-# 4. Reemplazar la URL en eva_llama_14.py
-# 5. Hacer commit y push a GitHub
+# 4. Enviar la nueva URL a EVA en caliente (POST /admin/ollama), sin redeploy
+#    o, si no hay EVA_URL, escribirla en el archivo vigilado por los procesos locales
 
 # --- CONFIGURACIÓN ---
 MODEL_NAME="llama3"
-ARCHIVO_EVA="eva_llama_14.py"
+EVA_URL="${EVA_URL:-https://eva-llama-backend.onrender.com}"  # Vacío para usar solo el archivo
+ARCHIVO_URLS="${OLLAMA_URLS_FILE:-ollama_urls.txt}"
+# ADMIN_TOKEN debe estar exportado y coincidir con el configurado en Render
 
 # --- INICIAR OLLAMA ---
 echo "[🧠] Iniciando servidor Ollama en background..."
@@ -31,17 +33,30 @@ if [[ -z "$url" ]]; then
   exit 1
 fi
 
-# --- ACTUALIZAR URL EN CÓDIGO ---
-echo "[✏️] Reemplazando URL anterior en $ARCHIVO_EVA..."
-sed -i '' "s|https://.*\.loca\.lt/api/generate|$url/api/generate|g" "$ARCHIVO_EVA"
-
-# --- PUSH A GITHUB ---
-echo "[📤] Subiendo cambios al repositorio..."
-git add "$ARCHIVO_EVA"
-git commit -m "Actualizar URL de túnel Ollama a $url"
-git push origin main
+# --- ACTUALIZAR URL EN CALIENTE ---
+if [[ -n "$EVA_URL" ]]; then
+  if [[ -z "$ADMIN_TOKEN" ]]; then
+    echo "[❌] Error: Falta la variable ADMIN_TOKEN."
+    exit 1
+  fi
+
+  echo "[🔁] Enviando nueva URL a $EVA_URL/admin/ollama..."
+  respuesta=$(curl -sS -f -X POST "$EVA_URL/admin/ollama" \
+    -H "Content-Type: application/json" \
+    -H "X-Admin-Token: $ADMIN_TOKEN" \
+    -d "{\"urls\": [\"$url\"]}")
+
+  if [[ $? -ne 0 ]]; then
+    echo "[❌] Error: EVA no aceptó la nueva URL."
+    exit 1
+  fi
+  echo "[📡] $respuesta"
+else
+  echo "[✏️] Escribiendo URL en $ARCHIVO_URLS..."
+  echo "$url" > "$ARCHIVO_URLS.tmp" && mv "$ARCHIVO_URLS.tmp" "$ARCHIVO_URLS"
+fi
 
 # --- FINAL ---
 echo "[✅] Nuevo túnel activo: $url"
-echo "[🚀] EVA se redeplegará en Render con la nueva URL."
+echo "[🚀] EVA usa la nueva URL sin reiniciarse."
 echo "[🔁] Ollama sigue corriendo en background (PID: $OLLAMA_PID)"
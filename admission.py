@@ -0,0 +1,274 @@
+"""
+admission.py - Control de admisión para las generaciones de Ollama
+
+Una GPU con Ollama solo atiende bien unas pocas generaciones a la vez; si
+todas las solicitudes entran juntas, todas se vuelven lentas y terminan por
+vencer el timeout de gunicorn. Este módulo limita las generaciones
+simultáneas del proceso y encola el resto:
+
+1. Cola acotada: si está llena, la solicitud se rechaza de inmediato
+2. Equidad por sesión: los turnos se asignan por turnos rotativos entre
+   sesiones, así una sesión con muchas solicitudes no bloquea a las demás
+3. Plazo de espera: si el turno no llega a tiempo, la solicitud se rechaza
+
+Los rechazos se señalan con AdmissionRejected, que indica cuándo reintentar.
+
+La capacidad de Ollama cambia con el equipo y el túnel, así que el límite no
+tiene por qué ser fijo: AIMDLimit lo ajusta con la latencia observada
+(aumento aditivo mientras Ollama responde a tiempo, reducción multiplicativa
+ante errores o latencia alta).
+
+Autor: Antares Innovate
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class AdmissionRejected(Exception):
+    """La solicitud no obtuvo turno para generar (cola llena o plazo vencido)."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("event", "granted", "queued_at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.queued_at = time.monotonic()
+
+
+class AdmissionController:
+    """Limitador de concurrencia con cola acotada y equidad por sesión."""
+
+    def __init__(self, max_concurrency=2, max_queue=32, queue_timeout=15, retry_after=5):
+        """
+        Inicializa el controlador.
+
+        Args:
+            max_concurrency: Generaciones simultáneas permitidas
+            max_queue: Solicitudes que pueden esperar turno
+            queue_timeout: Segundos máximos de espera en la cola
+            retry_after: Segundos sugeridos al cliente para reintentar
+        """
+        self.limit = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._queues = OrderedDict()  # sesión -> cola de _Waiter, en orden de rotación
+        self.in_flight = 0
+        self.queue_depth = 0
+
+        self.admitted = 0
+        self.rejected_full = 0
+        self.timed_out = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def acquire(self, session_key=None, timeout=None) -> float:
+        """
+        Espera un turno para generar.
+
+        Args:
+            session_key: Identifica la sesión para repartir turnos con equidad
+            timeout: Plazo de espera (por defecto, queue_timeout)
+
+        Returns:
+            Segundos esperados en la cola
+
+        Raises:
+            AdmissionRejected: Si la cola está llena o vence el plazo
+        """
+        with self._lock:
+            if self.in_flight < self.limit and not self.queue_depth:
+                self.in_flight += 1
+                self.admitted += 1
+                self._record_wait(0.0)
+                return 0.0
+            if self.queue_depth >= self.max_queue:
+                self.rejected_full += 1
+                raise AdmissionRejected("Cola de generación llena", self.retry_after)
+            waiter = _Waiter()
+            self._queues.setdefault(session_key, deque()).append(waiter)
+            self.queue_depth += 1
+            self.queued += 1
+
+        waiter.event.wait(self.queue_timeout if timeout is None else timeout)
+
+        with self._lock:
+            wait = time.monotonic() - waiter.queued_at
+            if waiter.granted:
+                self._record_wait(wait)
+                return wait
+            # Vencido: retirar de la cola (si se concedió justo ahora, se habría visto arriba)
+            queue = self._queues.get(session_key)
+            if queue is not None:
+                queue.remove(waiter)
+                if not queue:
+                    del self._queues[session_key]
+            self.queue_depth -= 1
+            self.timed_out += 1
+        raise AdmissionRejected("Tiempo de espera en cola agotado", self.retry_after)
+
+    def release(self):
+        """Libera un turno y lo cede a la siguiente sesión en espera."""
+        with self._lock:
+            self.in_flight -= 1
+            self._grant_waiters()
+
+    @contextmanager
+    def slot(self, session_key=None):
+        """Contexto que adquiere y libera un turno."""
+        self.acquire(session_key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def set_limit(self, limit):
+        """Cambia la concurrencia permitida (al subir, admite a quienes esperan)."""
+        with self._lock:
+            self.limit = max(1, int(limit))
+            self._grant_waiters()
+
+    def saturated(self) -> bool:
+        """Indica si la demanda (en curso más en cola) llega al límite actual."""
+        with self._lock:
+            return self.in_flight + self.queue_depth >= self.limit
+
+    def _grant_waiters(self):
+        # Rotación entre sesiones: se atiende la primera y pasa al final de la fila
+        while self.in_flight < self.limit and self._queues:
+            session_key, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_key)
+            else:
+                del self._queues[session_key]
+            self.queue_depth -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            waiter.granted = True
+            waiter.event.set()
+
+    def _record_wait(self, wait):
+        self.total_wait += wait
+        self.last_wait = wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self):
+        """Devuelve los indicadores del controlador."""
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected_full": self.rejected_full,
+                "timed_out": self.timed_out,
+                "avg_wait": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+                "max_wait": round(self.max_wait, 4),
+                "last_wait": round(self.last_wait, 4)
+            }
+
+
+class AIMDLimit:
+    """
+    Ajusta el límite de un AdmissionController según la latencia de Ollama.
+
+    Cada generación aporta una muestra (latencia hasta el primer token y si
+    tuvo éxito):
+    - Éxito bajo el objetivo con el límite saturado: el límite sube 1 por cada
+      `limit` muestras (aumento aditivo, como la ventana de TCP)
+    - Error o latencia sobre el objetivo: el límite se multiplica por `decrease`
+      (reducción multiplicativa), como mucho una vez por `cooldown` segundos,
+      porque las solicitudes ya en curso se admitieron con el límite anterior
+    """
+
+    def __init__(self, controller, min_limit=1, max_limit=8, latency_target=5.0,
+                 decrease=0.5, cooldown=None):
+        """
+        Inicializa el ajuste.
+
+        Args:
+            controller: AdmissionController cuyo límite se ajusta
+            min_limit, max_limit: Rango permitido del límite
+            latency_target: Latencia hasta el primer token considerada sana (segundos)
+            decrease: Factor de reducción ante sobrecarga (entre 0 y 1)
+            cooldown: Segundos mínimos entre reducciones (por defecto, latency_target)
+        """
+        self.controller = controller
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.cooldown = latency_target if cooldown is None else cooldown
+
+        self._lock = threading.Lock()
+        self._limit = float(min(max(controller.limit, min_limit), self.max_limit))
+        self._last_decrease = 0.0
+        controller.set_limit(int(self._limit))
+
+        self.samples = 0
+        self.increases = 0
+        self.decreases = 0
+        self.latency = None  # Media móvil de la latencia hasta el primer token
+
+    def record(self, latency, ok=True):
+        """
+        Registra una generación y ajusta el límite si corresponde.
+
+        Args:
+            latency: Segundos hasta el primer token (None si no llegó ninguno)
+            ok: False si la generación falló
+        """
+        with self._lock:
+            self.samples += 1
+            if latency is not None:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+            overloaded = not ok or (latency is not None and latency > self.latency_target)
+            now = time.monotonic()
+            if overloaded:
+                if now - self._last_decrease < self.cooldown:
+                    return
+                self._last_decrease = now
+                self._limit = max(float(self.min_limit), self._limit * self.decrease)
+                self.decreases += 1
+            elif self.controller.saturated() and self._limit < self.max_limit:
+                # Solo se sube si el límite actual realmente frena la demanda
+                self._limit = min(float(self.max_limit), self._limit + 1.0 / int(self._limit))
+                self.increases += 1
+            else:
+                return
+            limit = int(self._limit)
+
+        if limit != self.controller.limit:
+            self.controller.set_limit(limit)
+
+    def stats(self):
+        """Devuelve el límite vigente y los contadores del ajuste."""
+        with self._lock:
+            return {
+                "limit": self.controller.limit,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "latency_target": self.latency_target,
+                "latency": round(self.latency, 4) if self.latency is not None else None,
+                "samples": self.samples,
+                "increases": self.increases,
+                "decreases": self.decreases
+            }
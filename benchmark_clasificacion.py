@@ -0,0 +1,280 @@
+"""
+benchmark_clasificacion.py - Mide el costo por mensaje de la clasificación por palabras clave
+
+No necesita Ollama ni Postgres: clasifica una lista de mensajes de ejemplo con
+las funciones de EvaAssistant y del servidor, y reporta:
+1. Microsegundos por mensaje de cada función y del turno completo, con el caché
+   de palabras clave vacío (mensajes nuevos) y lleno (mensajes ya vistos)
+2. Una huella (hash) de los resultados, para comprobar que un cambio en la
+   clasificación no altera sus resultados
+3. El costo por turno del análisis de la conversación (agregar el mensaje del
+   usuario y la respuesta, y analizar) según la longitud del historial
+4. Exactitud y mensajes por segundo de las reglas y del clasificador aprendido
+   (intent_classifier.py) sobre mensajes etiquetados a mano, uno por uno y en lote.
+   El modelo se carga de CONFIG["intent_model_path"] o, si no existe, se entrena
+   en memoria como lo hace entrenar_clasificador.py
+"""
+
+import hashlib
+import os
+import sys
+import time
+
+import eva_llama_14
+from eva_llama_14 import CONFIG, EvaAssistant
+
+MENSAJES = [
+    "Hola, me llamo Ana y tengo una tienda de ropa",
+    "¿Cuánto cuesta una tienda online?",
+    "¿Y una app móvil para mis clientes?",
+    "Quiero mejorar mi marca, soy Luis",
+    "¿Qué incluye el branding y el manual de marca?",
+    "Me interesa automatizar procesos de mi empresa",
+    "Necesito una landing page urgente para una campaña",
+    "¿Hacen campañas en Instagram y redes sociales?",
+    "Gracias, eso es todo por hoy",
+    "Buenos días, ¿quiénes son ustedes?",
+    "¿Cómo funciona la integración con mi sistema de inventario y la API de pagos?",
+    "Trabajo en un hospital y necesitamos una plataforma para pacientes",
+    "Tengo un restaurante y quiero un sistema de reservas y delivery",
+    "No entiendo, es demasiado complicado, no me sirve",
+    "¿Podemos agendar una reunión el jueves a las 10?",
+    "Mi correo es ana@ejemplo.com y mi teléfono 55 1234 5678",
+    "Queremos un chatbot con inteligencia artificial para atención 24/7 en whatsapp",
+    "¿Qué framework y arquitectura usan para escalar el backend?",
+    "excelente, me encanta la propuesta, ¿cuál es el presupuesto?",
+    "hola",
+]
+
+# Intención correcta de cada mensaje de MENSAJES, más mensajes que mezclan
+# saludo y pregunta o usan palabras fuera de los vocabularios
+EVALUACION = [
+    ("Hola, me llamo Ana y tengo una tienda de ropa", "greeting"),
+    ("¿Cuánto cuesta una tienda online?", "pricing"),
+    ("¿Y una app móvil para mis clientes?", "technology"),
+    ("Quiero mejorar mi marca, soy Luis", "creativity"),
+    ("¿Qué incluye el branding y el manual de marca?", "creativity"),
+    ("Me interesa automatizar procesos de mi empresa", "consulting"),
+    ("Necesito una landing page urgente para una campaña", "technology"),
+    ("¿Hacen campañas en Instagram y redes sociales?", "services"),
+    ("Gracias, eso es todo por hoy", "farewell"),
+    ("Buenos días, ¿quiénes son ustedes?", "identity"),
+    ("¿Cómo funciona la integración con mi sistema de inventario y la API de pagos?", "technology"),
+    ("Trabajo en un hospital y necesitamos una plataforma para pacientes", "technology"),
+    ("Tengo un restaurante y quiero un sistema de reservas y delivery", "technology"),
+    ("No entiendo, es demasiado complicado, no me sirve", "help"),
+    ("¿Podemos agendar una reunión el jueves a las 10?", "meeting"),
+    ("Mi correo es ana@ejemplo.com y mi teléfono 55 1234 5678", "contact"),
+    ("Queremos un chatbot con inteligencia artificial para atención 24/7 en whatsapp", "technology"),
+    ("¿Qué framework y arquitectura usan para escalar el backend?", "technology"),
+    ("excelente, me encanta la propuesta, ¿cuál es el presupuesto?", "pricing"),
+    ("hola", "greeting"),
+    ("hola, cuánto cuesta una app", "pricing"),
+    ("buenas tardes, quisiera cotizar un sitio web", "pricing"),
+    ("qué precio tiene un logo", "pricing"),
+    ("me pueden llamar mañana", "meeting"),
+    ("quiero agendar una llamada con un asesor", "meeting"),
+    ("¿a qué se dedican?", "identity"),
+    ("¿qué servicios ofrecen?", "services"),
+    ("necesito rediseñar mi identidad visual", "creativity"),
+    ("quiero un video para mi marca", "creativity"),
+    ("¿pueden hacer una consultoría de transformación digital?", "consulting"),
+    ("necesito un diagnóstico de mis procesos", "consulting"),
+    ("¿tienen casos de éxito?", "testimonials"),
+    ("muchas gracias, hasta luego", "farewell"),
+    ("adiós", "farewell"),
+    ("¿me pasas su whatsapp?", "contact"),
+    ("¿dónde queda su oficina?", "contact"),
+    ("lo necesito ya, es urgente", "urgency"),
+    ("hey, ¿quién eres?", "identity"),
+    ("quiero desarrollar un software a medida", "technology"),
+    ("¿cuál es el costo del branding completo?", "pricing"),
+]
+
+RESPUESTA_EJEMPLO = (
+    "¡Hola! Entiendo perfectamente lo que necesitas. Creamos sitios web desde $3,000 USD con "
+    "diseño responsive y optimización SEO. Podemos integrar tu sistema de inventario mediante una API "
+    "y desplegarlo en la nube. Te apoyo en cada paso del proceso, desde el diseño hasta la "
+    "implementación. Con gusto te preparo una propuesta a medida. ¿Tienes web actualmente?"
+)
+
+def limpiar_cache():
+    """Vacía los cachés de palabras clave y de análisis de mensajes, si la versión los tiene"""
+    matcher = getattr(eva_llama_14, "KEYWORD_MATCHER", None)
+    for funcion in (getattr(matcher, "scan", None), getattr(eva_llama_14, "analyze_message", None)):
+        cache_clear = getattr(funcion, "cache_clear", None)
+        if cache_clear:
+            cache_clear()
+
+def medir(funcion, repeticiones, en_frio):
+    """Microsegundos por llamada de `funcion`"""
+    total = 0.0
+    for _ in range(repeticiones):
+        if en_frio:
+            limpiar_cache()
+        inicio = time.perf_counter()
+        funcion()
+        total += time.perf_counter() - inicio
+    return total / repeticiones * 1e6
+
+def costo_por_turno(repeticiones):
+    """Microsegundos por turno de _analyze_conversation_complexity con historiales de distinto largo"""
+    print(f"[INFO] {'Historial (mensajes)':<34} {'por turno':>10}")
+    for largo in (16, 100, 400):
+        eva = EvaAssistant(typing_simulation=False)
+        agregar = getattr(eva, "_append_message", eva.conversation_history.append)
+        for i in range(largo // 2):
+            agregar({"id": i, "rol": "usuario", "contenido": MENSAJES[i % len(MENSAJES)]})
+            agregar({"id": i, "rol": "asistente", "contenido": RESPUESTA_EJEMPLO})
+        eva._analyze_conversation_complexity()
+
+        contador = iter(range(10 ** 9))
+
+        def turno():
+            i = next(contador)
+            agregar({"id": i, "rol": "usuario", "contenido": MENSAJES[i % len(MENSAJES)]})
+            agregar({"id": i, "rol": "asistente", "contenido": RESPUESTA_EJEMPLO})
+            eva._analyze_conversation_complexity()
+
+        print(f"[INFO] {largo:<34} {medir(turno, repeticiones, en_frio=True):7.1f} µs")
+
+def cargar_modelo():
+    """Clasificador aprendido: el artefacto configurado o uno entrenado en memoria"""
+    from intent_classifier import IntentClassifier, build_training_set
+    from knowledge_fragments import SIMULACIONES
+
+    ruta = CONFIG["intent_model_path"]
+    if os.path.exists(ruta):
+        return IntentClassifier.load(ruta), ruta
+    textos, etiquetas = build_training_set(
+        eva_llama_14.INTENT_PATTERNS, SIMULACIONES,
+        labeler=lambda mensaje: eva_llama_14.analyze_message(mensaje).intent
+    )
+    return IntentClassifier.train(textos, etiquetas), "entrenado en memoria"
+
+def comparar_clasificadores(repeticiones):
+    """Exactitud y mensajes por segundo de las reglas y del modelo"""
+    try:
+        modelo, origen = cargar_modelo()
+    except RuntimeError as e:
+        print(f"[INFO] Clasificador aprendido no disponible: {e}")
+        return
+
+    mensajes = [mensaje for mensaje, _ in EVALUACION]
+    esperadas = [intencion for _, intencion in EVALUACION]
+    minimo = CONFIG["intent_model_min_confidence"]
+
+    def reglas():
+        return [eva_llama_14.analyze_message(mensaje).intent for mensaje in mensajes]
+
+    def modelo_uno_a_uno():
+        return [eva_llama_14.select_intent([(clave, p) for clave, p in modelo.predict(mensaje) if p >= minimo], minimo)
+                for mensaje in mensajes]
+
+    def modelo_en_lote():
+        return [intencion if probabilidad >= minimo else "default"
+                for intencion, probabilidad in modelo.predict_batch(
+                    mensajes, secondary=eva_llama_14.SECONDARY_INTENTS, min_probability=minimo)]
+
+    lote = mensajes * 50
+    print(f"[INFO] Clasificadores sobre {len(mensajes)} mensajes etiquetados (modelo: {origen})")
+    print(f"[INFO] {'Clasificador':<34} {'exactitud':>10} {'mensajes/s':>12}")
+    for nombre, funcion in [("Reglas (analyze_message)", reglas),
+                            ("Modelo, uno por uno", modelo_uno_a_uno),
+                            ("Modelo, en lote", modelo_en_lote)]:
+        predichas = funcion()
+        exactitud = sum(1 for p, e in zip(predichas, esperadas) if p == e) / len(esperadas)
+        por_mensaje = medir(funcion, max(1, repeticiones // 10), en_frio=True) / len(mensajes)
+        print(f"[INFO] {nombre:<34} {exactitud:9.1%} {1e6 / por_mensaje:12,.0f}")
+
+    inicio = time.perf_counter()
+    modelo.predict_batch(lote)
+    por_mensaje = (time.perf_counter() - inicio) / len(lote)
+    print(f"[INFO] {'Modelo, lote de ' + str(len(lote)):<34} {'':>10} {1 / por_mensaje:12,.0f}")
+
+def main():
+    CONFIG["debug"] = False
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    import server
+
+    eva = EvaAssistant(typing_simulation=False)
+    historial = []
+    for i, mensaje in enumerate(MENSAJES[:8]):
+        historial.append({"id": i, "rol": "usuario", "contenido": mensaje})
+        historial.append({"id": i, "rol": "asistente", "contenido": RESPUESTA_EJEMPLO})
+    eva.conversation_history = historial
+
+    resultados = []
+    for mensaje in MENSAJES:
+        resultados.append((
+            eva._classify_intent_and_level(mensaje),
+            eva.sentiment_analyzer.analyze(mensaje),
+            server.extraer_info_usuario(mensaje),
+        ))
+        eva._extract_user_info(mensaje)
+        resultados.append(sorted(eva.user_info.items(), key=lambda par: par[0]))
+    complejidad = eva._analyze_conversation_complexity()
+    resultados.append(sorted((clave, sorted(valor) if isinstance(valor, set) else valor)
+                             for clave, valor in complejidad.items()))
+    resultados.append(eva._optimize_response(RESPUESTA_EJEMPLO, 200, is_technical=True))
+    resultados.append(eva._optimize_response(RESPUESTA_EJEMPLO, 200, is_technical=False))
+    huella = hashlib.sha256(repr(resultados).encode("utf-8")).hexdigest()[:16]
+
+    def clasificar():
+        for mensaje in MENSAJES:
+            eva._classify_intent_and_level(mensaje)
+
+    def extraer():
+        for mensaje in MENSAJES:
+            eva._extract_user_info(mensaje)
+
+    def sentimiento():
+        for mensaje in MENSAJES:
+            eva.sentiment_analyzer.analyze(mensaje)
+
+    def perfil_servidor():
+        for mensaje in MENSAJES:
+            server.extraer_info_usuario(mensaje)
+
+    def analizar():
+        for mensaje in MENSAJES:
+            eva_llama_14.analyze_message(mensaje)
+
+    def optimizar():
+        eva._optimize_response(RESPUESTA_EJEMPLO, 200, True)
+
+    funciones = []
+    if hasattr(eva_llama_14, "analyze_message"):
+        # En el turno, el análisis se hace una vez y las demás funciones lo reutilizan
+        funciones.append(("analyze_message", analizar, len(MENSAJES)))
+    funciones += [
+        ("_classify_intent_and_level", clasificar, len(MENSAJES)),
+        ("_extract_user_info", extraer, len(MENSAJES)),
+        ("SentimentAnalyzer.analyze", sentimiento, len(MENSAJES)),
+        ("server.extraer_info_usuario", perfil_servidor, len(MENSAJES)),
+        ("_analyze_conversation_complexity", eva._analyze_conversation_complexity, 1),
+        ("_optimize_response", optimizar, 1),
+    ]
+
+    print(f"[INFO] {len(MENSAJES)} mensajes, {repeticiones} repeticiones, historial de {len(historial)} mensajes")
+    print(f"[INFO] {'Función':<34} {'en frío':>10} {'en caliente':>12}")
+    total_frio = total_caliente = 0.0
+    for nombre, funcion, llamadas in funciones:
+        frio = medir(funcion, repeticiones, en_frio=True) / llamadas
+        caliente = medir(funcion, repeticiones, en_frio=False) / llamadas
+        total_frio += frio
+        total_caliente += caliente
+        print(f"[INFO] {nombre:<34} {frio:7.1f} µs {caliente:9.1f} µs")
+    print(f"[INFO] {'Turno completo (suma)':<34} {total_frio:7.1f} µs {total_caliente:9.1f} µs")
+    print(f"[INFO] Huella de resultados: {huella}")
+
+    costo_por_turno(repeticiones)
+
+    if hasattr(eva_llama_14, "select_intent"):
+        comparar_clasificadores(repeticiones)
+
+    eva_llama_14.get_engine().close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+circuit_breaker.py - Cortacircuitos para las llamadas a Ollama
+
+Cuando el túnel cae, cada mensaje espera el timeout de conexión (más los
+reintentos) antes de terminar respondiendo con una plantilla. El cortacircuitos
+cuenta los fallos consecutivos de generación y, al llegar al umbral, se abre:
+mientras está abierto las generaciones se rechazan al instante con CircuitOpen
+y EVA responde con la plantilla sin esperar.
+
+Estados:
+1. closed: las generaciones pasan normalmente
+2. open: se rechazan todas hasta que pasa reset_timeout
+3. half_open: se deja pasar una generación de prueba; si tiene éxito el
+   circuito se cierra, si falla vuelve a abrirse
+
+Autor: Antares Innovate
+"""
+
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """El circuito está abierto: Ollama no está disponible y no se intenta generar."""
+
+
+class CircuitBreaker:
+    """Cortacircuitos de tres estados con pruebas en semiabierto."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=10, half_open_probes=1):
+        """
+        Inicializa el cortacircuitos.
+
+        Args:
+            failure_threshold: Fallos consecutivos que abren el circuito
+            reset_timeout: Segundos abierto antes de probar de nuevo
+            half_open_probes: Generaciones de prueba simultáneas en semiabierto
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0          # Fallos consecutivos
+        self.opened_at = None
+        self._probes = 0           # Pruebas en curso en semiabierto
+        self._last_probe = 0.0
+
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """
+        Indica si una generación puede intentarse. En semiabierto solo pasan las
+        pruebas; una prueba sin resultado tras reset_timeout se da por perdida.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+
+            if self._probes < self.half_open_probes or now - self._last_probe >= self.reset_timeout:
+                self._probes = min(self._probes + 1, self.half_open_probes)
+                self._last_probe = now
+                return True
+            self.rejected += 1
+            return False
+
+    def is_closed(self) -> bool:
+        """Indica si el circuito está cerrado (no consume pruebas de semiabierto)."""
+        with self._lock:
+            return self.state == CLOSED
+
+    def record_success(self):
+        """Registra una generación exitosa: cierra el circuito."""
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probes = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        """Registra un fallo: abre el circuito al llegar al umbral o si falla una prueba."""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probes = 0
+                self.times_opened += 1
+
+    def stats(self):
+        """Devuelve el estado del circuito y sus contadores."""
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 2)
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "failure_threshold": self.failure_threshold,
+                "retry_in": retry_in,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
@@ -34,5 +34,7 @@ def guardar_conversacion(rol: str, mensaje: str, session_id: str = "default"):
 
         cursor.close()
         conn.close()
+        return True
     except Exception as e:
         print(f"[ERROR DB] {e}")
+        return False
@@ -0,0 +1,66 @@
+"""
+entrenar_clasificador.py - Entrena el clasificador de intenciones aprendido
+
+No necesita Ollama: reúne los ejemplos (frases de INTENT_PATTERNS, mensajes de
+usuario de SIMULACIONES etiquetados con las reglas y mensajes registrados en
+mensajes.intencion de la base local), entrena el modelo TF-IDF + lineal de
+intent_classifier.py y lo guarda en CONFIG["intent_model_path"].
+
+De la base solo se toman los mensajes etiquetados por las reglas o a mano
+(columna mensajes.clasificador "rules" o "manual"): las etiquetas del propio
+modelo lo reentrenarían con sus errores. Los mensajes guardados antes de
+registrar el origen no se usan salvo con --incluir-sin-origen (solo si esa
+base se llenó con EVA_INTENT_CLASSIFIER=rules).
+
+Para usarlo en EVA: EVA_INTENT_CLASSIFIER=model (ver knowledge_fragments.py).
+El artefacto se genera en cada despliegue; no se versiona.
+
+Uso:
+    python entrenar_clasificador.py [--salida intent_model.npz] [--db conversaciones_eva.db] [--epocas 300]
+                                    [--incluir-sin-origen]
+"""
+
+import argparse
+import os
+import time
+
+from eva_llama_14 import CONFIG, INTENT_PATTERNS, DatabaseManager, analyze_message
+from intent_classifier import IntentClassifier, build_training_set
+from knowledge_fragments import SIMULACIONES
+
+def etiquetar_con_reglas(mensaje):
+    """Intención según las reglas de palabras clave"""
+    return analyze_message(mensaje).intent
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrena el clasificador de intenciones de EVA")
+    parser.add_argument("--salida", default=CONFIG["intent_model_path"], help="Archivo .npz del modelo")
+    parser.add_argument("--db", default="conversaciones_eva.db", help="Base SQLite con mensajes.intencion")
+    parser.add_argument("--epocas", type=int, default=300, help="Iteraciones del descenso por gradiente")
+    parser.add_argument("--incluir-sin-origen", action="store_true",
+                        help="Usar también los mensajes sin clasificador registrado")
+    args = parser.parse_args()
+
+    CONFIG["debug"] = False
+    # Las etiquetas débiles salen siempre de las reglas, no de un modelo anterior
+    CONFIG["intent_classifier"] = "rules"
+
+    registrados = []
+    if os.path.exists(args.db):
+        registrados = DatabaseManager(args.db).get_labeled_messages(include_unknown=args.incluir_sin_origen)
+    textos, etiquetas = build_training_set(INTENT_PATTERNS, SIMULACIONES, registrados, etiquetar_con_reglas)
+    print(f"[INFO] {len(textos)} ejemplos ({len(registrados)} de {args.db}), {len(set(etiquetas))} intenciones")
+
+    inicio = time.perf_counter()
+    modelo = IntentClassifier.train(textos, etiquetas, epochs=args.epocas)
+    print(f"[INFO] Entrenado en {time.perf_counter() - inicio:.2f} s: {len(modelo.vocabulary)} rasgos")
+
+    predichas = [etiqueta for etiqueta, _ in modelo.predict_batch(textos)]
+    aciertos = sum(1 for predicha, real in zip(predichas, etiquetas) if predicha == real)
+    print(f"[INFO] Exactitud en entrenamiento: {aciertos / len(etiquetas):.1%}")
+
+    modelo.save(args.salida)
+    print(f"[INFO] Modelo guardado en {args.salida} ({os.path.getsize(args.salida) / 1024:.1f} KB)")
+
+if __name__ == "__main__":
+    main()
@@ -21,14 +21,27 @@ import random
 import argparse
 import time
 import re
+import threading
+import functools
 import requests
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait as futures_wait
 import pytz
 from datetime import datetime, time as timedelta, date, time as datetime_time
-from typing import Dict, List, Optional, Any, Tuple, Union
+from typing import Dict, List, Optional, Any, Tuple, Union, Iterator, NamedTuple
+from types import MappingProxyType
 import sqlite3
 
 # Importar configuración y funciones de conocimiento
-from knowledge_fragments import CONFIG, get_filtered_prompt, get_lienzo_tecnico, get_response_template
+from knowledge_fragments import (CONFIG, build_prompt, format_session_context, get_followup_prompt,
+                                 get_lienzo_tecnico, get_response_template)
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache, hashing_embedding
+from admission import AdmissionController, AdmissionRejected, AIMDLimit
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from keyword_matcher import KeywordMatcher
+from intent_classifier import IntentClassifier
+import metrics
 
 # Importar la base de conocimiento para fallback si es necesario
 try:
@@ -70,24 +83,40 @@ class Colors:
 # o get_lienzo_tecnico("creatividad", "contenido_rrss") si se detecta intención y subtema
 
 # Utilidades para simular escritura humana
-def simulate_thinking(message_length=None):
-    """Simula tiempo de pensamiento antes de responder"""
+def simulate_thinking(message_length=None, pending: Optional[Future] = None):
+    """
+    Simula tiempo de pensamiento antes de responder.
+
+    Con `pending` (la respuesta que se está generando) la simulación corre a la
+    par de la generación: dura lo que tarde la más larga de las dos, en lugar
+    de sumarse a la latencia de la respuesta.
+    """
     base_time = random.uniform(CONFIG["min_response_time"], CONFIG["max_response_time"])
     if message_length:
         complexity_factor = min(message_length / 100, 2.0)
         thinking_time = base_time * (1.0 + (complexity_factor * 0.5))
     else:
         thinking_time = base_time
+    end = time.monotonic() + thinking_time
+
+    def waiting() -> bool:
+        return time.monotonic() < end or (pending is not None and not pending.done())
+
     if CONFIG["show_typing"]:
         thinking_message = random.choice(CONFIG["thinking_messages"])
         print(f"\n{Colors.YELLOW}[{thinking_message}]{Colors.ENDC}", end="", flush=True)
-        steps = int(thinking_time / 0.3)
-        for _ in range(steps):
+        dots = 0
+        while waiting():
             print(".", end="", flush=True)
-            time.sleep(0.3)
-        print("\r" + " " * (len(thinking_message) + 15), end="\r", flush=True)
+            dots += 1
+            remaining = end - time.monotonic()
+            if pending is not None and remaining <= 0:
+                futures_wait([pending], timeout=0.3)
+            else:
+                time.sleep(min(0.3, max(0.0, remaining)))
+        print("\r" + " " * (len(thinking_message) + 15 + dots), end="\r", flush=True)
     else:
-        time.sleep(thinking_time)
+        time.sleep(max(0.0, end - time.monotonic()))
 
 def simulate_typing(text, speed_variation=0.3):
     """Simula escritura humana con velocidad variable"""
@@ -120,19 +149,111 @@ def simulate_typing(text, speed_variation=0.3):
         if i < len(chunks) - 1:
             print(" ", end="", flush=True)
 
+# Cabeceras comunes para las solicitudes a Ollama
+OLLAMA_HEADERS = {
+    "Content-Type": "application/json",
+    "User-Agent": "Mozilla/5.0"
+}
+
+# Frases genéricas que no aportan valor y se eliminan de las respuestas
+FRASES_GENERICAS = [
+    "Estoy aquí para ayudarte",
+    "¿En qué más puedo asistirte?",
+    "No dudes en preguntar si tienes más dudas",
+    "Estoy a tu disposición"
+]
+
+def remove_generic_phrases(text):
+    """Elimina las frases genéricas de FRASES_GENERICAS de un texto"""
+    for frase in FRASES_GENERICAS:
+        if frase.lower() in text.lower():
+            text = text.replace(frase, "")
+    return text
+
+class StreamingResponseFilter:
+    """
+    Versión incremental de la limpieza de frases y del límite de longitud.
+
+    Recibe los tokens de Ollama a medida que llegan, retiene el texto hasta
+    completar una oración y solo entonces la libera, ya limpia. Cuando la
+    siguiente oración no cabe en el límite, o ya se enviaron `max_sentences`
+    oraciones, marca `done` para que quien consume el stream pueda cortar la
+    generación.
+    """
+
+    SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+    def __init__(self, max_length: int, max_sentences: Optional[int] = None):
+        self.max_length = max_length
+        self.max_sentences = max_sentences
+        self.buffer = ""
+        self.emitted_length = 0
+        self.sentences = 0
+        self.done = False
+
+    def feed(self, token: str) -> str:
+        """Añade un token y devuelve el texto listo para enviar (puede ser vacío)."""
+        if self.done:
+            return ""
+        self.buffer += token
+        output = []
+        while not self.done:
+            match = self.SENTENCE_END.search(self.buffer)
+            if not match:
+                break
+            sentence = self.buffer[:match.start()]
+            self.buffer = self.buffer[match.end():]
+            output.append(self._accept(sentence))
+        return "".join(output)
+
+    def finish(self) -> str:
+        """Libera el texto pendiente al terminar el stream."""
+        if self.done:
+            return ""
+        sentence, self.buffer = self.buffer, ""
+        text = self._accept(sentence)
+        self.done = True
+        return text
+
+    def _accept(self, sentence: str) -> str:
+        sentence = remove_generic_phrases(sentence).strip()
+        # Descartar oraciones que quedaron solo con puntuación tras la limpieza
+        if not re.search(r'\w', sentence):
+            return ""
+        separator = " " if self.emitted_length else ""
+        new_length = self.emitted_length + len(separator) + len(sentence)
+        # La primera oración siempre se envía; las demás solo si caben
+        if self.emitted_length and new_length > self.max_length:
+            self.done = True
+            return ""
+        self.emitted_length = new_length
+        self.sentences += 1
+        if self.max_sentences and self.sentences >= self.max_sentences:
+            self.done = True
+        return separator + sentence
+
+def synchronized(method):
+    """Serializa las llamadas a un método usando el candado `self.lock` de la instancia."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class DatabaseManager:
     """Gestor de base de datos para almacenar conversaciones."""
     
     def __init__(self, db_path="conversaciones_eva.db"):
-        """Inicializa la conexión a la base de datos."""
+        """Inicializa la conexión a la base de datos (compartida entre hilos)."""
         self.db_path = db_path
         self.conn = None
+        self.lock = threading.RLock()
         self.init_db()
     
     def init_db(self):
         """Inicializa la estructura de la base de datos."""
         try:
-            self.conn = sqlite3.connect(self.db_path)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
             cursor = self.conn.cursor()
             
             # Crear tabla para usuarios
@@ -165,10 +286,16 @@ class DatabaseManager:
                 rol TEXT,
                 contenido TEXT,
                 intencion TEXT,
+                clasificador TEXT,
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (conversacion_id) REFERENCES conversaciones (id)
             )
             ''')
+
+            # Bases creadas antes de registrar qué clasificador etiquetó cada mensaje
+            cursor.execute("PRAGMA table_info(mensajes)")
+            if "clasificador" not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE mensajes ADD COLUMN clasificador TEXT")
             
             # Nueva tabla para reuniones
             cursor.execute('''
@@ -192,11 +319,13 @@ class DatabaseManager:
         except sqlite3.Error as e:
             print(f"Error al inicializar la base de datos: {e}")
     
+    @synchronized
     def close(self):
         """Cierra la conexión a la base de datos."""
         if self.conn:
             self.conn.close()
     
+    @synchronized
     def save_user(self, user_info):
         """Guarda o actualiza información del usuario."""
         try:
@@ -249,6 +378,7 @@ class DatabaseManager:
             print(f"Error al guardar usuario: {e}")
             return None
     
+    @synchronized
     def start_conversation(self, user_id=None):
         """Inicia una nueva conversación."""
         try:
@@ -261,17 +391,20 @@ class DatabaseManager:
             print(f"Error al iniciar conversación: {e}")
             return None
     
+    @synchronized
     def save_message(self, conversation_id, message):
         """Guarda un mensaje en la base de datos."""
         try:
             cursor = self.conn.cursor()
             cursor.execute(
-                "INSERT INTO mensajes (conversacion_id, rol, contenido, intencion, timestamp) VALUES (?, ?, ?, ?, ?)",
+                "INSERT INTO mensajes (conversacion_id, rol, contenido, intencion, clasificador, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
                 (
                     conversation_id,
                     message.get("rol"),
                     message.get("contenido"),
                     message.get("intencion", ""),
+                    message.get("clasificador"),
                     message.get("timestamp", datetime.now().isoformat())
                 )
             )
@@ -281,6 +414,37 @@ class DatabaseManager:
             print(f"Error al guardar mensaje: {e}")
             return None
     
+    @synchronized
+    def get_labeled_messages(self, classifiers=("rules", "manual"), include_unknown=False, limit=None):
+        """
+        Devuelve pares (contenido, intención) de los mensajes de usuario registrados.
+
+        Args:
+            classifiers: Orígenes de etiqueta aceptados (columna clasificador):
+                         "rules", "model" o "manual" (etiquetado a mano)
+            include_unknown: Incluir los mensajes guardados antes de registrar el origen
+            limit: Máximo de mensajes, los más recientes primero
+        """
+        try:
+            cursor = self.conn.cursor()
+            placeholders = ", ".join("?" for _ in classifiers) or "NULL"
+            origin = f"clasificador IN ({placeholders})"
+            if include_unknown:
+                origin = f"({origin} OR clasificador IS NULL)"
+            query = ("SELECT contenido, intencion FROM mensajes "
+                     "WHERE rol = 'usuario' AND intencion IS NOT NULL AND intencion != '' "
+                     f"AND {origin} ORDER BY id DESC")
+            params = list(classifiers)
+            if limit:
+                query += " LIMIT ?"
+                params.append(limit)
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error al leer mensajes: {e}")
+            return []
+    
+    @synchronized
     def save_meeting(self, user_id, event_data):
         """Guarda información de una reunión agendada."""
         try:
@@ -304,6 +468,7 @@ class DatabaseManager:
             print(f"Error al guardar reunión: {e}")
             return None
     
+    @synchronized
     def save_conversation(self, user_info, messages):
         """Guarda una conversación completa con sus mensajes."""
         try:
@@ -682,224 +847,1242 @@ class GoogleCalendarIntegration:
                 print(f"Error al enviar correo de confirmación: {e}")
             return False
 
+def read_ollama_urls_file(path: str) -> List[str]:
+    """
+    Lee las URLs de Ollama de un archivo (una por línea o separadas por comas;
+    las líneas que empiezan con # se ignoran).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    urls = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        urls.extend(u.strip() for u in line.split(",") if u.strip())
+    return urls
+
+def write_ollama_urls_file(urls: List[str], path: str):
+    """Escribe las URLs de Ollama de forma atómica para que otros procesos nunca lean un archivo a medias."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(urls) + "\n")
+    os.replace(tmp_path, path)
+
+class SingleFlight:
+    """
+    Agrupa llamadas idénticas concurrentes: la primera ejecuta la función y las
+    demás esperan y reciben el mismo resultado (o la misma excepción).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, cancel: Optional[threading.Event] = None) -> Tuple[Any, bool]:
+        """
+        Ejecuta `fn` una sola vez por clave entre los hilos concurrentes.
+
+        Args:
+            key: Clave que identifica las llamadas idénticas
+            fn: Función a ejecutar; recibe un evento compuesto que se activa solo
+                cuando todos los llamadores que comparten la llamada cancelaron
+            cancel: Evento de cancelación de este llamador (None = no cancelable)
+
+        Returns:
+            Tupla (resultado, compartido); compartido es True si el resultado
+            lo produjo otro hilo
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            # Una llamada que todos abandonaron puede entregar un resultado cortado
+            leader = call is None or call["cancel"].is_set()
+            if leader:
+                call = {"event": threading.Event(), "result": None, "error": None,
+                        "cancel": _AllCancelled()}
+                self._calls[key] = call
+            call["cancel"].add(cancel)
+
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], True
+
+        try:
+            call["result"] = fn(call["cancel"])
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call["event"].set()
+        return call["result"], False
+
+class _AllCancelled:
+    """Cancelación de una llamada compartida: activa cuando todos sus llamadores cancelaron."""
+
+    def __init__(self):
+        self._events = []
+
+    def add(self, cancel: Optional[threading.Event]):
+        """Suma un llamador; None indica que su espera no se puede cancelar."""
+        self._events.append(cancel)
+
+    def is_set(self) -> bool:
+        return all(event is not None and event.is_set() for event in tuple(self._events))
+
+class OllamaBackend:
+    """Estado de un servidor de Ollama dentro del pool del cliente."""
+
+    def __init__(self, url: str):
+        """
+        Args:
+            url: URL base del servidor (se aceptan también URLs terminadas en /api/generate)
+        """
+        url = url.strip().rstrip("/")
+        for suffix in ("/api/generate", "/api/tags", "/api"):
+            if url.endswith(suffix):
+                url = url[:-len(suffix)]
+                break
+        self.base_url = url
+        self.healthy = True          # Optimista hasta el primer chequeo
+        self.in_flight = 0           # Solicitudes en curso contra este servidor
+        self.failures = 0            # Fallos consecutivos
+        self.latency = None          # Media móvil de la latencia del chequeo de salud
+        self.last_check = None
+
+    def url(self, path: str) -> str:
+        """Devuelve la URL completa para un endpoint de la API."""
+        return f"{self.base_url}{path}"
+
+    def status(self) -> Dict:
+        """Resumen del estado del servidor."""
+        return {
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "failures": self.failures,
+            "latency": self.latency,
+            "last_check": self.last_check
+        }
+
+class OllamaConversation:
+    """
+    Estado de conversación de una sesión con Ollama.
+
+    Guarda el arreglo `context` que devuelve /api/generate para enviarlo en el
+    siguiente turno: Ollama reutiliza su caché KV y solo evalúa el mensaje nuevo
+    en lugar de volver a procesar todo el prompt de sistema.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None):
+        """
+        Args:
+            max_tokens: Tamaño máximo del contexto antes de reiniciarlo
+                        (por defecto, CONFIG["ollama_context_max_tokens"])
+        """
+        self.max_tokens = max_tokens or CONFIG["ollama_context_max_tokens"]
+        self.context = None          # Tokens devueltos por Ollama en el último turno
+        self.backend_url = None      # Servidor que tiene el contexto en caché
+        self.intents = set()         # Intenciones cuyo conocimiento ya está en el contexto
+        self.session_context = None  # Últimos datos de sesión enviados
+        self.session_key = object()  # Identifica a la sesión ante el control de admisión (las copias la comparten)
+        self.pending = None          # Turno enviado sin `done`: (mensaje, intenciones, datos de sesión)
+        self.turns = 0
+        self.resets = 0
+        self.prompt_tokens = 0       # Tokens de prompt evaluados por Ollama
+        self.tokens_saved = 0        # Tokens de prompt que no hubo que volver a enviar
+
+    @property
+    def active(self) -> bool:
+        """Indica si el siguiente turno puede continuar sobre el contexto guardado."""
+        return bool(self.context)
+
+    def begin_turn(self, message: str, intents: set, session_context: Optional[Dict]):
+        """
+        Anota lo que envía el turno. Las intenciones y los datos de sesión solo se
+        dan por enviados cuando llega `done` con el contexto nuevo (update o
+        adopt): si el stream se corta antes, el contexto de Ollama no los incluye.
+        """
+        self.pending = (message, intents, session_context)
+
+    def discard_turn(self):
+        """Olvida el turno anotado con begin_turn cuando se deshace sin respuesta."""
+        self.pending = None
+
+    @property
+    def missed_message(self) -> Optional[str]:
+        """Mensaje del último turno enviado cuyo `done` no llegó (no está en el contexto)."""
+        return self.pending[0] if self.pending else None
+
+    def _confirm_turn(self, context: List[int], backend_url: str):
+        """Adopta el contexto nuevo y da por enviado el turno anotado con begin_turn."""
+        self.context = context
+        self.backend_url = backend_url
+        if self.pending:
+            _, self.intents, self.session_context = self.pending
+            self.pending = None
+
+    def update(self, data: Dict, backend_url: str, context_sent: Optional[List[int]]):
+        """Registra la respuesta final de Ollama (la que trae `done` y `context`)."""
+        self.turns += 1
+        self.prompt_tokens += data.get("prompt_eval_count", 0) or 0
+        if context_sent:
+            self.tokens_saved += len(context_sent)
+
+        context = data.get("context")
+        if not context:
+            return
+        if len(context) > self.max_tokens:
+            if CONFIG["debug"]:
+                print(f"[DEBUG] Contexto de Ollama reiniciado ({len(context)} tokens)")
+            self.reset()
+            return
+        self._confirm_turn(context, backend_url)
+
+    def adopt(self, context: Optional[List[int]], backend_url: Optional[str]):
+        """Registra un turno cuya generación se compartió con otra sesión."""
+        self.turns += 1
+        if context:
+            self._confirm_turn(context, backend_url)
+
+    def fork(self) -> "OllamaConversation":
+        """
+        Copia el estado para generar un turno que quizá no llegue a usarse: la
+        copia se adopta con commit() solo si la respuesta se entrega.
+        """
+        forked = OllamaConversation(self.max_tokens)
+        forked.__dict__.update(self.__dict__)
+        forked.intents = set(self.intents)
+        forked.session_context = dict(self.session_context) if self.session_context else self.session_context
+        return forked
+
+    def commit(self, forked: "OllamaConversation"):
+        """Adopta el estado de una copia hecha con fork()."""
+        self.__dict__.update(forked.__dict__)
+
+    def reset(self):
+        """Descarta el contexto; el siguiente turno vuelve a enviar el prompt completo."""
+        if self.context:
+            self.resets += 1
+        self.context = None
+        self.backend_url = None
+        self.intents = set()
+        self.session_context = None
+        self.pending = None
+
+    def stats(self) -> Dict:
+        """Contadores de la conversación."""
+        return {
+            "turns": self.turns,
+            "context_tokens": len(self.context) if self.context else 0,
+            "prompt_tokens": self.prompt_tokens,
+            "tokens_saved": self.tokens_saved,
+            "resets": self.resets
+        }
+
 class OllamaClient:
     """Cliente para comunicarse con la API de Ollama."""
     
-    def __init__(self, model_name="llama3", api_url="https://evaollama.loca.lt/api/generate"):
+    def __init__(self, model_name="llama3", api_url=None):
         """
         Inicializa el cliente de Ollama.
         
         Args:
-            model_name: llama3
-            api_url:"https://evaollama.loca.lt/api/generate"
+            model_name: Modelo a usar (ej. llama3)
+            api_url: URL o lista de URLs de servidores de Ollama
+                     (por defecto, CONFIG["ollama_api_urls"])
         """
         self.model_name = model_name
-        self.api_url = "https://evaollama.loca.lt/api/generate"
+        self._backends_lock = threading.Lock()
+        self.backends = []
+
+        # Con la configuración por defecto, el archivo de URLs (si existe) tiene
+        # prioridad y se vuelve a leer cuando cambia
+        self.urls_file = CONFIG["ollama_urls_file"] if api_url is None else None
+        self._urls_file_mtime = None
+        if api_url is None:
+            api_url = CONFIG["ollama_api_urls"]
+        self.set_backends([api_url] if isinstance(api_url, str) else api_url)
+        self._reload_urls_file()
+
+        # Sesión HTTP con pool de conexiones keep-alive: evita un handshake TLS
+        # nuevo con el túnel en cada turno
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=CONFIG["ollama_pool_size"],
+            pool_maxsize=CONFIG["ollama_pool_size"]
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(OLLAMA_HEADERS)
+        self.timeout = (CONFIG["ollama_connect_timeout"], CONFIG["ollama_read_timeout"])
+
+        # Estadísticas de latencia por llamada
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "total_latency": 0.0,
+            "min_latency": None,
+            "max_latency": 0.0,
+            "last_latency": None,
+            "context_tokens_saved": 0,
+            "early_stops": 0,
+            "coalesced": 0,
+            "prompt_tokens": 0,
+            "generated_tokens": 0
+        }
+        # Latencia hasta el primer token y duración total de cada generación
+        self.first_token_latency = metrics.Histogram()
+        self.generation_latency = metrics.Histogram()
+
+        # Agrupación de solicitudes idénticas concurrentes
+        self._single_flight = SingleFlight()
 
+        # Se desactiva para todo el proceso si Ollama no tiene el modelo de embeddings
+        self.embeddings_available = True
 
-        self.check_connection()
+        # Límite de generaciones simultáneas con cola acotada
+        self.admission = AdmissionController(
+            max_concurrency=CONFIG["ollama_max_concurrency"],
+            max_queue=CONFIG["ollama_max_queue"],
+            queue_timeout=CONFIG["ollama_queue_timeout"],
+            retry_after=CONFIG["ollama_retry_after"]
+        )
+        # Ajuste automático del límite según la latencia observada (None = límite fijo)
+        self.concurrency = None
+        if CONFIG["ollama_adaptive_concurrency"]:
+            self.concurrency = AIMDLimit(
+                self.admission,
+                min_limit=CONFIG["ollama_min_concurrency"],
+                max_limit=CONFIG["ollama_max_concurrency_limit"],
+                latency_target=CONFIG["ollama_latency_target"],
+                decrease=CONFIG["ollama_aimd_decrease"]
+            )
+
+        # Cortacircuitos: con Ollama caído se responde con plantilla sin esperar timeouts
+        self.circuit = CircuitBreaker(
+            failure_threshold=CONFIG["ollama_circuit_failures"],
+            reset_timeout=CONFIG["ollama_circuit_reset"],
+            half_open_probes=CONFIG["ollama_circuit_probes"]
+        )
+
+        # Chequeo de salud periódico en segundo plano (el primero, inmediato)
+        self._stop_event = threading.Event()
+        self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+    @property
+    def api_url(self) -> str:
+        """URL de generación del primer servidor (compatibilidad y mensajes de depuración)."""
+        with self._backends_lock:
+            return self.backends[0].url("/api/generate") if self.backends else ""
+
+    def set_backends(self, urls: List[str]) -> List[str]:
+        """
+        Reemplaza en caliente los servidores del pool.
+
+        Las solicitudes en curso terminan en el servidor que ya tenían asignado;
+        las nuevas se reparten entre los servidores nuevos. Los servidores que
+        siguen en la lista conservan su estado de salud.
+
+        Args:
+            urls: Lista de URLs de servidores de Ollama
+
+        Returns:
+            Lista de URLs base activas tras el cambio
+        """
+        new_backends = [OllamaBackend(url) for url in urls if url and url.strip()]
+        if not new_backends:
+            raise ValueError("Se necesita al menos una URL de Ollama")
+
+        with self._backends_lock:
+            current = {backend.base_url: backend for backend in self.backends}
+            backends = []
+            for backend in new_backends:
+                if any(b.base_url == backend.base_url for b in backends):
+                    continue
+                backends.append(current.get(backend.base_url, backend))
+            self.backends = backends
+            active = [backend.base_url for backend in backends]
+
+        if CONFIG["debug"]:
+            print(f"[DEBUG] Servidores de Ollama: {', '.join(active)}")
+        return active
+
+    def _reload_urls_file(self):
+        """Aplica el archivo de URLs si cambió desde la última lectura."""
+        if not self.urls_file:
+            return
+        try:
+            mtime = os.path.getmtime(self.urls_file)
+        except OSError:
+            return
+        if mtime == self._urls_file_mtime:
+            return
+        self._urls_file_mtime = mtime
+        try:
+            urls = read_ollama_urls_file(self.urls_file)
+            if urls:
+                self.set_backends(urls)
+        except Exception as e:
+            print(f"[ERROR] al leer {self.urls_file}: {str(e)}")
+
+    def close(self):
+        """Detiene el chequeo de salud y cierra las conexiones."""
+        self._stop_event.set()
+        self.session.close()
     
-    def check_connection(self) -> bool:
+    def _record_call(self, latency: float, ok: bool):
+        """Acumula la latencia de una llamada en las estadísticas."""
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            if not ok:
+                self.stats["errors"] += 1
+            self.stats["total_latency"] += latency
+            self.stats["last_latency"] = latency
+            self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+            if self.stats["min_latency"] is None or latency < self.stats["min_latency"]:
+                self.stats["min_latency"] = latency
+
+    def get_stats(self) -> Dict:
+        """Devuelve las estadísticas de latencia de las llamadas a Ollama (en segundos)."""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["avg_latency"] = stats["total_latency"] / stats["calls"] if stats["calls"] else None
+        stats["backends"] = self.get_backends_status()
+        stats["admission"] = self.admission.stats()
+        stats["concurrency"] = self.concurrency.stats() if self.concurrency is not None else None
+        stats["circuit"] = self.circuit.stats()
+        stats["embeddings_available"] = self.embeddings_available
+        return stats
+
+    def get_backends_status(self) -> List[Dict]:
+        """Devuelve el estado de cada servidor del pool."""
+        with self._backends_lock:
+            return [backend.status() for backend in self.backends]
+
+    def _request(self, method: str, url: str, max_retries: Optional[int] = None, **kwargs) -> requests.Response:
         """
-        Verifica que Ollama esté disponible.
-        
+        Envía una solicitud por la sesión compartida con timeouts y reintentos.
+
+        Se reintenta ante errores de conexión (incluido el timeout de conexión) y
+        respuestas 5xx, con backoff exponencial y jitter completo. Un timeout de
+        lectura no se reintenta: Ollama podría seguir generando la respuesta.
+
+        Args:
+            method: Método HTTP
+            url: URL de destino
+            max_retries: Reintentos permitidos (por defecto, CONFIG["ollama_max_retries"])
+
         Returns:
-            True si la conexión es exitosa, False en caso contrario
+            Respuesta de Ollama (la última recibida si todos los intentos dieron 5xx)
         """
+        if max_retries is None:
+            max_retries = CONFIG["ollama_max_retries"]
+
+        for attempt in range(max_retries + 1):
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.ConnectionError:
+                self._record_call(time.monotonic() - start, ok=False)
+                if attempt == max_retries:
+                    raise
+            except requests.Timeout:
+                self._record_call(time.monotonic() - start, ok=False)
+                raise
+            else:
+                is_server_error = response.status_code >= 500
+                self._record_call(time.monotonic() - start, ok=not is_server_error)
+                if not is_server_error or attempt == max_retries:
+                    return response
+                response.close()
+
+            # Backoff exponencial con jitter antes del siguiente intento
+            delay = min(CONFIG["ollama_backoff_max"], CONFIG["ollama_backoff_base"] * (2 ** attempt))
+            with self._stats_lock:
+                self.stats["retries"] += 1
+            if CONFIG["debug"]:
+                print(f"[DEBUG] Reintentando solicitud a Ollama ({attempt + 1}/{max_retries})")
+            time.sleep(random.uniform(0, delay))
+
+    def _check_backend(self, backend: OllamaBackend) -> bool:
+        """Consulta /api/tags de un servidor y actualiza su estado de salud."""
+        start = time.monotonic()
         try:
             # Hacemos una solicitud a la API de Ollama para verificar la conexión
-            response = requests.get(self.api_url.replace('/generate', '/tags'))
-            
-            if response.status_code == 200:
-                if CONFIG["debug"]:
-                    available_models = [model.get("name", "") for model in response.json().get("models", [])]
-                    print(f"Modelos disponibles en Ollama: {', '.join(available_models)}")
-                return True
-            else:
-                if CONFIG["debug"]:
-                    print(f"Error al conectar con Ollama: Código {response.status_code}")
-                return False
+            response = self._request("GET", backend.url("/api/tags"), max_retries=0)
+            healthy = response.status_code == 200
+            if healthy and CONFIG["debug"] and backend.last_check is None:
+                available_models = [model.get("name", "") for model in response.json().get("models", [])]
+                print(f"Modelos disponibles en Ollama ({backend.base_url}): {', '.join(available_models)}")
+            elif not healthy and CONFIG["debug"]:
+                print(f"Error al conectar con Ollama ({backend.base_url}): Código {response.status_code}")
+            response.close()
         except Exception as e:
+            healthy = False
             if CONFIG["debug"]:
-                print(f"Error al intentar conectar con Ollama: {str(e)}")
-            return False
-    
-    def generate_response(self, prompt: str, max_tokens: int = 300) -> str:
-        try:
-        # Extraer contexto relevante si está disponible
-            contexto = ""
-            if "[CONTEXTO:" in prompt:
-                partes = prompt.split("[CONTEXTO:", 1)
-                if len(partes) > 1 and "]" in partes[1]:
-                    prompt_limpio = partes[0].strip()
-                    contexto = partes[1].split("]", 1)[0].strip()
-                else:
-                    prompt_limpio = prompt
+                print(f"Error al intentar conectar con Ollama ({backend.base_url}): {str(e)}")
+
+        latency = time.monotonic() - start
+        with self._backends_lock:
+            backend.healthy = healthy
+            backend.last_check = time.time()
+            if healthy:
+                backend.failures = 0
+                backend.latency = latency if backend.latency is None else 0.7 * backend.latency + 0.3 * latency
             else:
-                prompt_limpio = prompt
-            
-        # Instrucciones mejoradas con información de servicios principales
-            instrucciones = f"""
-            <INSTRUCCIONES>
-            Eres EVA, ejecutiva de ventas de Antares Innovate, una agencia de transformación digital premium.
-            Tu misión es CONSEGUIR CLIENTES ofreciendo servicios digitales como:
-            - Desarrollo web: Sitios profesionales desde $3,000 USD
-            - Landing pages: Optimizadas para conversión desde $1,800 USD
-            - Branding: Identidad visual desde $2,500 USD
-            - Apps: Desarrollo de aplicaciones desde $8,000 USD
-            - Automatización: Soluciones de procesos desde $5,000 USD
-        
-            Tu tono es cálido, profesional y DIRECTO. Siempre menciona "nuestro equipo de Antares" 
-            y propón un próximo paso concreto (reunión, llamada, formulario).
-        
-            RECUERDA:
-            - SÉ CONCISA: Respuestas de máximo 350 caracteres
-            - SIEMPRE menciona un precio aproximado si preguntan por cotizaciones
-             - SIEMPRE ofrece agendar una reunión si el cliente muestra interés
-             - NUNCA uses frases genéricas como "estoy aquí para ayudarte"
-            - NUNCA ignores información previa del cliente (nombre, servicio, etc.)
-            </INSTRUCCIONES>
-            """
-        
-        # Información de contexto de la conversación
-            if contexto:
-                instrucciones += f"""
-                <INFORMACIÓN DEL CLIENTE>
-                {contexto}
-                </INFORMACIÓN DEL CLIENTE>
-                """
-            
-        # Armar el mensaje completo
-            mensaje_con_contexto = f"{instrucciones}\n\nUsuario: {prompt_limpio}\nEVA:"
-        
-        # ✅ Limitar el tamaño del prompt (pero asegurando mantener las instrucciones)
-            MAX_PROMPT_CHARS = 7000
-            if len(mensaje_con_contexto) > MAX_PROMPT_CHARS:
-                if CONFIG["debug"]:
-                    print(f"[WARNING] Truncando mensaje (excedía {MAX_PROMPT_CHARS} caracteres)")
-            
-            # Conservar instrucciones + inicio y final del prompt
-                instrucciones_len = len(instrucciones)
-                espacio_disponible = MAX_PROMPT_CHARS - instrucciones_len - 100  # Buffer para "Usuario:" y "EVA:"
-            
-                if espacio_disponible > 100:  # Asegurar espacio mínimo
-                # Truncar solo la parte del prompt del usuario
-                    prompt_truncado = prompt_limpio
-                    if len(prompt_truncado) > espacio_disponible:
-                    # Tomar el inicio y final del prompt para mantener contexto
-                        mitad = espacio_disponible // 2
-                        prompt_truncado = prompt_limpio[:mitad] + "..." + prompt_limpio[-mitad:]
-                
-                    mensaje_con_contexto = f"{instrucciones}\n\nUsuario: {prompt_truncado}\nEVA:"
-                else:
-                # Último recurso: mantener solo instrucciones básicas
-                    instrucciones_basicas = instrucciones[:MAX_PROMPT_CHARS - 200]
-                    mensaje_con_contexto = f"{instrucciones_basicas}\n\nUsuario: {prompt_limpio[-100:]}\nEVA:"
-
-        # Enviar solicitud a Ollama
-            payload = {
-            "model": "llama3",
-            "prompt": mensaje_con_contexto,
-            "stream": False,
-            "max_tokens": max(max_tokens, 300)  # Asegurar al menos 300 tokens
-            }
+                backend.failures += 1
+        return healthy
+
+    def check_connection(self) -> bool:
+        """
+        Verifica que Ollama esté disponible en alguno de los servidores.
         
-            headers = {
-            "Content-Type": "application/json",
-            "User-Agent": "Mozilla/5.0"
+        Returns:
+            True si al menos un servidor responde, False en caso contrario
+        """
+        with self._backends_lock:
+            backends = list(self.backends)
+        results = [self._check_backend(backend) for backend in backends]
+        return any(results)
+
+    def _health_loop(self):
+        """Hilo de fondo que revisa la salud de los servidores periódicamente."""
+        while not self._stop_event.is_set():
+            self._reload_urls_file()
+            self.check_connection()
+            self._stop_event.wait(CONFIG["ollama_health_interval"])
+
+    def _acquire_backend(self, exclude: List[OllamaBackend], prefer: Optional[str] = None) -> Optional[OllamaBackend]:
+        """
+        Elige el servidor sano con menos solicitudes en curso (desempate por latencia).
+        Si ninguno está sano, prueba igualmente con los no descartados. Si se indica
+        `prefer` y ese servidor está sano, se usa (tiene el contexto en caché).
+        """
+        with self._backends_lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            healthy = [b for b in candidates if b.healthy]
+            pool = healthy or candidates
+            if not pool:
+                return None
+            preferred = [b for b in healthy if b.base_url == prefer]
+            if preferred:
+                backend = preferred[0]
+            else:
+                backend = min(pool, key=lambda b: (b.in_flight, b.latency if b.latency is not None else float("inf")))
+            backend.in_flight += 1
+            return backend
+
+    def _release_backend(self, backend: OllamaBackend, failed: bool = False):
+        """Libera un servidor tras una solicitud; si falló, lo marca como no sano."""
+        with self._backends_lock:
+            backend.in_flight -= 1
+            if failed:
+                backend.healthy = False
+                backend.failures += 1
+
+    def _post(self, path: str, payload: Dict, stream: bool = False,
+              prefer: Optional[str] = None) -> Tuple[requests.Response, OllamaBackend]:
+        """
+        Envía un POST al servidor menos cargado (o al preferido), con failover al
+        siguiente ante errores de conexión o 5xx. Los reintentos con backoff solo
+        se aplican al último servidor candidato.
+
+        Returns:
+            Tupla (respuesta, servidor). Quien llama debe liberar el servidor con
+            _release_backend cuando termine de leer la respuesta.
+        """
+        tried = []
+        last_error = None
+        while True:
+            backend = self._acquire_backend(exclude=tried, prefer=prefer)
+            if backend is None:
+                raise last_error or requests.ConnectionError("No hay servidores de Ollama configurados")
+            tried.append(backend)
+            with self._backends_lock:
+                has_alternatives = len(tried) < len(self.backends)
+
+            try:
+                response = self._request("POST", backend.url(path), max_retries=0 if has_alternatives else None,
+                                         json=payload, stream=stream)
+            except requests.ConnectionError as e:
+                self._release_backend(backend, failed=True)
+                last_error = e
+                if CONFIG["debug"]:
+                    print(f"[DEBUG] Failover: {backend.base_url} no responde")
+                continue
+            except Exception:
+                self._release_backend(backend)
+                raise
+
+            if response.status_code >= 500 and has_alternatives:
+                response.close()
+                self._release_backend(backend, failed=True)
+                if CONFIG["debug"]:
+                    print(f"[DEBUG] Failover: {backend.base_url} devolvió {response.status_code}")
+                continue
+
+            return response, backend
+
+    def _build_payload(self, prompt: str, num_predict: Optional[int], stream: bool,
+                       conversation: Optional[OllamaConversation]) -> Dict:
+        """
+        Arma el payload de /api/generate. El prompt llega ya armado desde
+        knowledge_fragments.build_prompt (o get_followup_prompt si la conversación
+        tiene contexto, que se envía junto con él).
+        """
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                # Tope de tokens a generar; Ollama ignora "max_tokens"
+                "num_predict": num_predict or CONFIG["generation_budget"]["default"]["num_predict"]
             }
-        
+        }
+        if conversation is not None and conversation.active:
+            payload["context"] = conversation.context
+        return payload
+
+    def _record_generation(self, latency: Optional[float], ok: bool):
+        """
+        Registra el resultado de una generación (latencia hasta el primer token)
+        en el cortacircuitos y en el límite adaptativo.
+        """
+        if latency is not None:
+            self.first_token_latency.observe(latency)
+
+        previous_state = self.circuit.state
+        if ok:
+            self.circuit.record_success()
+        else:
+            self.circuit.record_failure()
+        if CONFIG["debug"] and self.circuit.state != previous_state:
+            print(f"[DEBUG] Cortacircuitos de Ollama: {previous_state} → {self.circuit.state}")
+
+        if self.concurrency is None:
+            return
+        previous = self.admission.limit
+        self.concurrency.record(latency, ok)
+        if CONFIG["debug"] and self.admission.limit != previous:
+            print(f"[DEBUG] Límite de generaciones simultáneas: {previous} → {self.admission.limit}")
+
+    def _finish_conversation_turn(self, conversation: Optional[OllamaConversation], data: Dict,
+                                  backend: OllamaBackend, payload: Dict):
+        """Actualiza el contexto de la conversación y el contador de tokens ahorrados."""
+        if conversation is None:
+            return
+        context_sent = payload.get("context")
+        conversation.update(data, backend.base_url, context_sent)
+        if context_sent:
+            with self._stats_lock:
+                self.stats["context_tokens_saved"] += len(context_sent)
+
+    def generate_response(self, prompt: str, num_predict: Optional[int] = None,
+                          max_chars: Optional[int] = None, max_sentences: Optional[int] = None,
+                          conversation: Optional[OllamaConversation] = None,
+                          queue_timeout: Optional[float] = None,
+                          cancel: Optional[threading.Event] = None) -> str:
+        """
+        Genera una respuesta completa.
+
+        Internamente usa streaming para poder cortar la generación en cuanto la
+        respuesta limpia cubre el presupuesto de caracteres u oraciones, en lugar
+        de esperar a que Ollama genere texto que después se descarta.
+
+        Las solicitudes idénticas concurrentes (mismo prompt y presupuesto, sin
+        contexto previo de conversación) comparten una sola generación.
+
+        Args:
+            prompt: Prompt del turno armado por EvaAssistant._build_prompt
+            num_predict: Tokens máximos que Ollama puede generar
+            max_chars: Presupuesto de caracteres de la respuesta (None = sin corte)
+            max_sentences: Presupuesto de oraciones de la respuesta (None = sin corte)
+            conversation: Estado de la sesión para reutilizar el contexto de Ollama
+            queue_timeout: Plazo de espera por un turno de generación (por defecto,
+                           CONFIG["ollama_queue_timeout"])
+            cancel: Evento que, al activarse, corta la generación en el siguiente token
+                    (si la generación es compartida, cuando todos cancelaron)
+
+        Returns:
+            Respuesta limpia, o cadena vacía si Ollama no generó nada o falló
+        """
+        # Con contexto previo el prompt efectivo es propio de la sesión: no se comparte
+        if conversation is not None and conversation.active:
+            return self._generate(prompt, num_predict, max_chars, max_sentences, conversation,
+                                  queue_timeout, cancel)
+
+        # La generación compartida solo se corta cuando todos los que la esperan cancelaron
+        def generate(all_cancelled):
+            response = self._generate(prompt, num_predict, max_chars, max_sentences, conversation,
+                                      queue_timeout, all_cancelled)
+            if conversation is not None:
+                return response, conversation.context, conversation.backend_url
+            return response, None, None
+
+        key = (self.model_name, prompt, num_predict, max_chars, max_sentences)
+        (response, context, backend_url), shared = self._single_flight.do(key, generate, cancel)
+
+        if shared:
+            with self._stats_lock:
+                self.stats["coalesced"] += 1
             if CONFIG["debug"]:
-                print(f"[DEBUG] Enviando solicitud a Ollama → {self.api_url}")
-                print(f"[DEBUG] Payload: {payload}")
-        
-            response = requests.post(self.api_url, json=payload, headers=headers)
-        
-            if response.status_code == 200:
-                full_response = response.json().get("response", "").strip()
-            
-                if CONFIG["debug"]:
-                    print(f"[DEBUG] Respuesta original de Ollama: {full_response}")
-                
-                if not full_response:
-                    print("[Advertencia] Respuesta de Llama3 vacía.")
-                    return "Lo siento, no pude generar una respuesta adecuada. ¿Podrías repetir tu mensaje?"
-            
-            # Limpiar frases genéricas comunes que no aportan valor
-                frases_eliminar = [
-                "Estoy aquí para ayudarte",
-                "¿En qué más puedo asistirte?",
-                "No dudes en preguntar si tienes más dudas",
-                "Estoy a tu disposición"
-                ]
-            
-                response_final = full_response
-                for frase in frases_eliminar:
-                    if frase.lower() in response_final.lower():
-                        response_final = response_final.replace(frase, "")
-                    
-            # Asegurar que la respuesta no sea muy corta después de la limpieza
-                if len(response_final.strip()) < 50:
-                    return full_response  # Mantener respuesta original
-                
-                return response_final.strip()
-            else:
-                print(f"[ERROR] Ollama devolvió código: {response.status_code}")
-                print(response.text)
-                return ""
-            
-        except Exception as e:
-            print(f"[ERROR] al generar respuesta con Ollama: {str(e)}")
-            return ""
+                print("[DEBUG] Solicitud idéntica en curso: se comparte su respuesta")
+            # El contexto resultante es el mismo para un prompt idéntico
+            if conversation is not None:
+                conversation.adopt(context, backend_url)
+        return response
+
+    def _generate(self, prompt: str, num_predict: Optional[int], max_chars: Optional[int],
+                  max_sentences: Optional[int], conversation: Optional[OllamaConversation],
+                  queue_timeout: Optional[float] = None, cancel: Optional[threading.Event] = None) -> str:
+        """Generación con corte temprano (ver generate_response)."""
+        response_filter = StreamingResponseFilter(max_chars or float("inf"), max_sentences)
+        raw_parts = []
+        filtered_parts = []
+
+        tokens = self.generate_response_stream(prompt, num_predict=num_predict, conversation=conversation,
+                                               queue_timeout=queue_timeout)
+        try:
+            for token in tokens:
+                if cancel is not None and cancel.is_set():
+                    if CONFIG["debug"]:
+                        print("[DEBUG] Generación cancelada, cortando el stream")
+                    break
+                raw_parts.append(token)
+                filtered_parts.append(response_filter.feed(token))
+                if response_filter.done:
+                    with self._stats_lock:
+                        self.stats["early_stops"] += 1
+                    if CONFIG["debug"]:
+                        print("[DEBUG] Presupuesto de respuesta cubierto, cortando la generación")
+                    break
+        finally:
+            # Cerrar el generador corta la conexión y detiene la generación en Ollama
+            tokens.close()
+        filtered_parts.append(response_filter.finish())
 
+        full_response = "".join(raw_parts).strip()
+        if CONFIG["debug"]:
+            print(f"[DEBUG] Respuesta original de Ollama: {full_response}")
 
+        if not full_response:
+            print("[Advertencia] Respuesta de Llama3 vacía.")
+            return ""
 
+        # Frases genéricas ya eliminadas por el filtro; si la limpieza deja la
+        # respuesta demasiado corta, se mantiene la original
+        response_final = "".join(filtered_parts).strip()
+        if len(response_final) < 50:
+            return full_response
 
+        return response_final
 
-class SentimentAnalyzer:
-    """Analizador de sentimiento para personalizar respuestas según el tono del usuario."""
-    
-    def analyze(self, message: str) -> Dict:
+    def embed(self, text: str, model: Optional[str] = None) -> Optional[List[float]]:
         """
-        Analiza el sentimiento de un mensaje.
-        
+        Calcula el embedding de un texto con /api/embeddings.
+
         Args:
-            message: Mensaje a analizar
-            
+            text: Texto a convertir
+            model: Modelo de embeddings (por defecto, CONFIG["ollama_embed_model"])
+
         Returns:
-            Diccionario con información de sentimiento
+            Vector del texto, o None si Ollama no pudo calcularlo (tras un 404 o
+            un modelo inexistente, siempre None: ver embeddings_available)
         """
-        message_lower = message.lower()
-        
-        # Palabras positivas
-        positive_words = [
-    "gracias", "excelente", "genial", "bueno", "increíble", "perfecto", "fantástico",
-    "maravilloso", "encantado", "feliz", "contento", "alegre", "satisfecho",
-    "me encanta", "muy bien", "todo claro", "qué bien", "buen trabajo", "me gusta", "¡super!"
-]
+        # Con el circuito abierto (o en prueba) no se espera a un Ollama caído
+        if not self.embeddings_available or not self.circuit.is_closed():
+            return None
 
-        
-        # Palabras negativas
-        negative_words = [
-    "malo", "terrible", "pésimo", "horrible", "frustrante", "molesto", "enojado",
-    "inútil", "confuso", "difícil", "problema", "error", "fallo", "no funciona",
-    "mal servicio", "no entiendo", "demasiado complicado", "no me sirve", "desesperante",
-    "decepcionado", "no me gusta"
-]
+        payload = {"model": model or CONFIG["ollama_embed_model"], "prompt": text}
+        try:
+            response, backend = self._post("/api/embeddings", payload)
+        except Exception as e:
+            print(f"[ERROR] al calcular embedding con Ollama: {str(e)}")
+            return None
+        try:
+            if response.status_code != 200:
+                if response.status_code == 404 or "not found" in response.text.lower():
+                    self._disable_embeddings(payload["model"], response.status_code)
+                elif CONFIG["debug"]:
+                    print(f"[ERROR] Ollama devolvió código {response.status_code} en embeddings")
+                return None
+            return response.json().get("embedding") or None
+        finally:
+            response.close()
+            self._release_backend(backend)
 
-        
-        # Palabras urgentes
-        urgency_words = [
-    "urgente", "rápido", "pronto", "ahora", "inmediatamente", "ya", "lo antes posible",
-    "emergencia", "crítico", "prioritario", "plazo", "fecha límite", "lo necesito hoy",
-    "apúrate", "sin demora", "es para ya", "de inmediato"
-]
+    def _disable_embeddings(self, model: str, status_code: int):
+        """Deja de pedir embeddings a Ollama en este proceso (avisa una sola vez)."""
+        with self._stats_lock:
+            if not self.embeddings_available:
+                return
+            self.embeddings_available = False
+        print(f"[Advertencia] Ollama no tiene el modelo de embeddings '{model}' (código {status_code}); "
+              f"el caché semántico usa el embedding local")
 
-        
+    def generate_response_stream(self, prompt: str, num_predict: Optional[int] = None,
+                                 conversation: Optional[OllamaConversation] = None,
+                                 queue_timeout: Optional[float] = None) -> Iterator[str]:
+        """
+        Genera una respuesta con `stream: true`, entregando los tokens a medida que llegan.
+
+        Args:
+            prompt: Prompt del turno armado por EvaAssistant._build_prompt
+            num_predict: Tokens máximos que Ollama puede generar
+            conversation: Estado de la sesión para reutilizar el contexto de Ollama
+            queue_timeout: Plazo de espera por un turno de generación (por defecto,
+                           CONFIG["ollama_queue_timeout"])
+
+        Yields:
+            Fragmentos de texto tal como los produce Ollama. Si el consumidor deja de
+            iterar, la conexión se cierra y Ollama deja de generar. El failover entre
+            servidores solo es posible antes de recibir el primer token. Si el stream
+            se corta antes del final, la conversación conserva el contexto anterior.
+
+        Raises:
+            CircuitOpen: Si el cortacircuitos está abierto (al pedir el primer fragmento)
+            AdmissionRejected: Si no hay turno de generación dentro del plazo (al
+                pedir el primer fragmento)
+        """
+        if not self.circuit.allow():
+            raise CircuitOpen("Ollama no disponible")
+
+        # Turno de generación; la clave de la sesión (compartida por sus copias) reparte
+        # los turnos con equidad
+        self.admission.acquire(conversation.session_key if conversation is not None else None, queue_timeout)
+        try:
+            yield from self._stream_tokens(prompt, num_predict, conversation)
+        finally:
+            self.admission.release()
+
+    def _stream_tokens(self, prompt: str, num_predict: Optional[int],
+                       conversation: Optional[OllamaConversation]) -> Iterator[str]:
+        """
+        Solicitud en streaming a Ollama (ver generate_response_stream).
+
+        Registra un solo resultado por solicitud en el cortacircuitos y el límite
+        adaptativo: éxito si llega `done` o si quien consume cierra el stream a
+        propósito (corte temprano), fallo si hay un error o el stream termina sin `done`.
+        """
+        payload = self._build_payload(prompt, num_predict, True, conversation)
+        prefer = conversation.backend_url if conversation is not None else None
+
+        start = time.monotonic()
+        try:
+            response, backend = self._post("/api/generate", payload, stream=True, prefer=prefer)
+        except Exception as e:
+            print(f"[ERROR] al generar respuesta con Ollama: {str(e)}")
+            self._record_generation(None, ok=False)
+            return
+
+        if CONFIG["debug"]:
+            print(f"[DEBUG] Stream de Ollama ← {backend.base_url}")
+
+        generated = 0
+        first_token_latency = None
+        ok = False
+        try:
+            if response.status_code != 200:
+                print(f"[ERROR] Ollama devolvió código: {response.status_code}")
+                print(response.text)
+                self._record_generation(None, ok=False)
+                return
+
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("response", "")
+                if first_token_latency is None and (token or chunk.get("done")):
+                    # La latencia hasta el primer token refleja la carga de Ollama
+                    first_token_latency = time.monotonic() - start
+                if token:
+                    # Ollama envía un token por fragmento; así se cuentan también
+                    # las generaciones cortadas antes del final
+                    generated += 1
+                    yield token
+                if chunk.get("done"):
+                    ok = True
+                    with self._stats_lock:
+                        self.stats["prompt_tokens"] += chunk.get("prompt_eval_count", 0) or 0
+                    self._finish_conversation_turn(conversation, chunk, backend, payload)
+                    break
+        except GeneratorExit:
+            # Quien consume cerró el stream (presupuesto cubierto): Ollama respondió bien
+            ok = True
+            raise
+        except Exception as e:
+            print(f"[ERROR] durante el stream de Ollama: {str(e)}")
+        finally:
+            if response.status_code == 200:
+                self._record_generation(first_token_latency, ok)
+                self.generation_latency.observe(time.monotonic() - start)
+                with self._stats_lock:
+                    self.stats["generated_tokens"] += generated
+            response.close()
+            self._release_backend(backend)
+
+
+# =============================================================================
+# VOCABULARIOS DE PALABRAS CLAVE - Compartidos por todas las sesiones del proceso
+# =============================================================================
+
+# Palabras positivas
+POSITIVE_WORDS = [
+    "gracias", "excelente", "genial", "bueno", "increíble", "perfecto", "fantástico",
+    "maravilloso", "encantado", "feliz", "contento", "alegre", "satisfecho", "me encanta",
+    "muy bien", "todo claro", "qué bien", "buen trabajo", "me gusta", "¡super!"
+]
+
+# Palabras negativas
+NEGATIVE_WORDS = [
+    "malo", "terrible", "pésimo", "horrible", "frustrante", "molesto", "enojado", "inútil",
+    "confuso", "difícil", "problema", "error", "fallo", "no funciona", "mal servicio",
+    "no entiendo", "demasiado complicado", "no me sirve", "desesperante", "decepcionado",
+    "no me gusta"
+]
+
+# Palabras urgentes
+URGENCY_WORDS = [
+    "urgente", "rápido", "pronto", "ahora", "inmediatamente", "ya", "lo antes posible",
+    "emergencia", "crítico", "prioritario", "plazo", "fecha límite", "lo necesito hoy",
+    "apúrate", "sin demora", "es para ya", "de inmediato"
+]
+
+# Patrones de intenciones ampliados para EVA
+INTENT_PATTERNS = {
+    "greeting": [
+        "hola", "qué tal", "buenos días", "buenas tardes", "buenas noches", "saludos", "hey",
+        "buen día", "qué onda", "holi", "hola eva", "hello", "hi"
+    ],
+    "farewell": [
+        "adiós", "hasta luego", "chao", "bye", "nos vemos", "gracias por todo",
+        "muchas gracias", "eso es todo", "me voy", "hasta pronto", "nos hablamos"
+    ],
+    "identity": [
+        "quién eres", "qué es antares", "quién es eva", "antares innovate", "empresa",
+        "compañía", "ustedes quiénes son", "me hablas como si te conociera",
+        "a qué se dedican", "representas a quién", "qué es esto"
+    ],
+    "services": [
+        "servicios", "qué ofrecen", "qué hacen", "soluciones", "productos", "portafolio",
+        "en qué me pueden ayudar", "pueden hacer esto", "ofrecen", "tienen tal servicio"
+    ],
+    "creativity": [
+        "creatividad", "diseño", "branding", "logo", "identidad visual", "video",
+        "ilustración", "imagen de marca", "naming", "colores", "diseño gráfico", "visual",
+        "mockup", "fotografía", "rebranding"
+    ],
+    "technology": [
+        "tecnología", "desarrollo", "web", "app", "aplicación", "ui", "ux", "chatbot",
+        "software", "sistema", "plataforma", "automatización", "ecommerce", "tienda online",
+        "landing", "sistema web", "integración", "inteligencia artificial", "API"
+    ],
+    "consulting": [
+        "consultoría", "automatización", "proceso", "asesoría", "transformación digital",
+        "optimización", "modelo de negocio", "mentoría", "acompañamiento",
+        "estrategia digital", "análisis", "diagnóstico", "propuesta", "revisión"
+    ],
+    "pricing": [
+        "precio", "costo", "cuánto", "inversión", "presupuesto", "vale", "tarifa", "valores",
+        "cotización", "cuánto me sale", "paquetes", "planes", "promoción"
+    ],
+    "contact": [
+        "contacto", "correo", "teléfono", "llamar", "contactarme", "hablar", "enviar datos",
+        "whatsapp", "email", "cómo los ubico", "redes sociales", "oficina"
+    ],
+    "meeting": [
+        "reunión", "agendar", "cita", "calendario", "llamada", "charlar", "asesoría",
+        "podemos hablar", "me pueden llamar", "agendar una reunión",
+        "quiero hablar con alguien", "disponibilidad", "agenda"
+    ],
+    "help": [
+        "ayuda", "necesito", "cómo", "explicar", "duda", "favor", "no entiendo",
+        "me pueden orientar", "no sé por dónde empezar", "necesito apoyo", "recomiéndame",
+        "me ayudas con esto", "sugerencia"
+    ],
+    "testimonials": [
+        "casos de éxito", "resultados", "clientes", "testimonios",
+        "quiénes han trabajado con ustedes", "experiencia", "pueden mostrarme ejemplos",
+        "tienen referencias"
+    ],
+    "urgency": [
+        "urgente", "lo necesito ya", "es para ya", "apúrate", "tengo poco tiempo",
+        "en cuánto tiempo", "lo más rápido posible"
+    ],
+    "industry_specific": [
+        "restaurante", "moda", "salud", "educación", "hotel", "retail", "agencia", "hospital",
+        "construcción", "ONG", "fintech", "turismo"
+    ]
+}
+
+# Peso de cada intención al puntuarlas (1.0 si no aparece). Las genéricas
+# ("hola", "necesito", "cómo") pesan menos; las peticiones comerciales pesan
+# más que el tema (que ya recoge el pilar), para que "hola, ¿cuánto cuesta
+# una app?" se clasifique como pricing y no como greeting o technology.
+INTENT_WEIGHTS = {
+    "greeting": 0.5,
+    "help": 0.5,
+    "farewell": 0.8,
+    "industry_specific": 0.8,
+    "pricing": 2.0,
+    "meeting": 2.0,
+    "contact": 1.5
+}
+
+# Peso de cada frase encontrada según su especificidad: las frases de varias
+# palabras son más claras que una palabra suelta, y las de uno o dos caracteres
+# ("ui", "hi") aparecen dentro de otras palabras ("quiénes", "archivo")
+PHRASE_WEIGHTS = {"phrase": 1.5, "word": 1.0, "short": 0.5}
+
+# Intenciones que solo se eligen si ninguna otra alcanza MIN_INTENT_SCORE
+SECONDARY_INTENTS = ("greeting",)
+MIN_INTENT_SCORE = 1.0
+
+# Patrones de los pilares estratégicos
+PILLAR_PATTERNS = {
+    "creativity": [
+        "diseño", "branding", "logo", "marca", "identidad visual", "video", "ilustración",
+        "fotografía", "contenido", "visual", "color", "creatividad", "naming", "storytelling",
+        "manual de marca", "diseño gráfico", "mockup", "presentación", "animación"
+    ],
+    "technology": [
+        "desarrollo", "web", "app", "aplicación", "ui", "ux", "chatbot", "programación",
+        "código", "sistema", "automatización", "tecnología", "software", "API", "plataforma",
+        "infraestructura", "base de datos", "integración", "responsive", "framework",
+        "entorno tech"
+    ],
+    "consulting": [
+        "consultoría", "asesoría", "estrategia", "transformación", "negocio", "automatización",
+        "proceso", "modelo", "optimización", "análisis", "mentor", "diagnóstico",
+        "acompañamiento", "cambio organizacional", "alineación", "revisión", "taller",
+        "capacitación"
+    ]
+}
+
+# Palabras clave indicadoras de nivel técnico o profundidad del usuario (1-5)
+LEVEL_INDICATORS = {
+    1: [
+        "quién", "qué es", "cuál es", "qué hacen", "básico", "para qué sirve", "qué significa",
+        "cómo empiezo", "nivel inicial", "empezar", "soy nuevo"
+    ],
+    2: [
+        "servicios", "ofrecen", "qué incluye", "áreas", "pilares", "especialidad",
+        "qué cubren", "tipos de soluciones", "categorías", "en qué se enfocan"
+    ],
+    3: [
+        "cómo funciona", "detalle", "específico", "paso a paso", "flujo", "etapas", "proceso",
+        "cómo lo hacen", "qué pasos siguen", "resultados", "herramientas"
+    ],
+    4: [
+        "implementación", "configuración", "framework", "infraestructura", "metodología",
+        "tecnología usada", "bases de datos", "sistema", "estructura técnica", "entorno"
+    ],
+    5: [
+        "precio", "costo", "inversión", "tiempo estimado", "presupuesto", "cuánto vale",
+        "plazos", "roadmap", "integración", "API", "documentación técnica", "escalabilidad",
+        "arquitectura", "soporte", "automatización avanzada"
+    ]
+}
+
+# Preguntas técnicas específicas
+TECHNICAL_INDICATORS = [
+    "cómo", "implementar", "configurar", "integrar", "desarrollar", "optimizar"
+]
+
+# Palabras clave que indican el sector o industria del cliente
+SECTOR_KEYWORDS = {
+    "inmobiliario": [
+        "inmobiliaria", "bienes raíces", "propiedad", "propiedades", "casa", "apartamento",
+        "inmueble", "renta", "alquiler", "venta de casas", "urbanización",
+        "construcción residencial"
+    ],
+    "salud": [
+        "salud", "hospital", "clínica", "médico", "paciente", "consultorio", "laboratorio",
+        "sanitario", "historia clínica", "terapia", "psicología", "odontología"
+    ],
+    "educación": [
+        "educación", "escuela", "universidad", "academia", "colegio", "alumno", "estudiante",
+        "formación", "e-learning", "clases", "plataforma educativa", "capacitación"
+    ],
+    "financiero": [
+        "banco", "financiero", "finanzas", "inversión", "seguro", "crédito", "hipoteca",
+        "cuenta", "tarjeta", "fintech", "pagos", "billetera digital", "cobros",
+        "transferencias"
+    ],
+    "retail": [
+        "tienda", "retail", "comercio", "venta", "ecommerce", "producto", "carrito de compras",
+        "moda", "ropa", "calzado", "inventario", "stock", "catálogo", "consumidor final"
+    ],
+    "manufactura": [
+        "fábrica", "manufactura", "producción", "industrial", "ensamble",
+        "cadena de suministro", "planta", "maquinaria", "logística", "proceso productivo",
+        "almacén", "inventario industrial"
+    ],
+    "gastronomía": [
+        "restaurante", "bar", "chef", "comida", "menú", "carta", "reservas", "delivery",
+        "domicilio", "pedidos", "cocina", "gourmet", "foodtruck", "gastronomía"
+    ],
+    "turismo": [
+        "hotel", "turismo", "viajes", "agencia de viajes", "guía turístico", "reserva",
+        "hospedaje", "check-in", "check-out", "turistas", "destino", "booking"
+    ],
+    "ONG / impacto social": [
+        "ONG", "organización sin fines de lucro", "fundación", "comunidad", "impacto social",
+        "voluntariado", "proyecto social", "causa", "donación", "sostenibilidad"
+    ],
+    "automotriz": [
+        "concesionaria", "autos", "vehículos", "taller", "mecánico", "repuestos", "automotriz",
+        "transporte", "camiones", "movilidad", "carros", "flota"
+    ],
+    "entretenimiento / cultura": [
+        "teatro", "cine", "concierto", "evento", "boletos", "espectáculo",
+        "producción audiovisual", "entretenimiento", "arte", "festival", "obra"
+    ],
+    "tecnología / software": [
+        "startup", "tecnología", "software", "app", "programación", "desarrollador", "web",
+        "plataforma digital", "sistema", "cloud", "infraestructura tech", "código"
+    ]
+}
+
+# Palabras que elevan el nivel técnico de la conversación
+CONVERSATION_TECHNICAL_WORDS = [
+    "implementación", "integración", "configuración", "arquitectura", "framework",
+    "optimización", "desarrollo", "metodología", "técnico", "programación"
+]
+
+# Menciones de servicios específicos en la conversación
+SERVICE_KEYWORDS = {
+    "branding": [
+        "logo", "marca", "branding", "diseño", "identidad visual", "naming", "colores",
+        "manual de marca", "rebranding", "diseño gráfico", "imagen corporativa"
+    ],
+    "web": [
+        "página web", "sitio web", "web", "desarrollo web", "landing", "frontend", "backend",
+        "hosting", "wordpress", "tienda online", "ecommerce", "web responsive",
+        "formulario web", "experiencia web"
+    ],
+    "automatización": [
+        "automatizar", "robot", "rpa", "proceso", "flujo", "automatización de tareas",
+        "optimizar", "scripts", "bots", "pipeline", "automatización de negocio",
+        "notificaciones automáticas", "integración automática", "automatización de ventas"
+    ],
+    "apps": [
+        "app", "aplicación", "móvil", "ios", "android", "aplicación híbrida",
+        "desarrollo móvil", "app personalizada", "reserva desde app", "apps para clientes",
+        "gestión desde app", "app para empleados"
+    ],
+    "chatbots": [
+        "chatbot", "asistente virtual", "bot", "ia", "chat automático", "soporte virtual",
+        "asistente inteligente", "automatización de atención", "respuesta automática",
+        "chat 24/7", "whatsapp bot", "chat con IA"
+    ],
+    "marketing": [
+        "marketing", "redes sociales", "digital", "publicidad", "seo", "anuncios", "contenido",
+        "community manager", "estrategia digital", "tráfico", "engagement", "campañas",
+        "leads", "embudo", "ads", "social media"
+    ]
+}
+
+# Palabras y frases clave de empatía, calidez y cercanía emocional
+EMPATHY_WORDS = [
+    "entiendo", "comprendo", "tranquilo", "no te preocupes", "te entiendo", "me alegra",
+    "qué bueno", "genial", "fantástico", "excelente", "estupendo", "maravilloso",
+    "qué alegría", "encantada", "cuenta conmigo", "confía", "aquí estoy", "te apoyo",
+    "estoy para ayudarte", "lo resolveremos juntos", "respira", "todo saldrá bien",
+    "gracias por compartirlo", "me emociona escucharlo", "eso suena increíble", "me encanta",
+    "con gusto", "un placer ayudarte", "¡qué emocionante!"
+]
+
+# Palabras clave que indican contenido técnico relevante que debe preservarse
+TECH_KEYWORDS = [
+    "implementar", "desarrollar", "configurar", "programar", "diseñar", "optimizar",
+    "automatizar", "integrar", "conectar", "desplegar", "debuggear", "customizar",
+    "tecnología", "infraestructura", "arquitectura", "entorno", "servidor", "nube",
+    "plataforma", "sistema", "módulo", "motor", "backend", "frontend", "funcionalidad",
+    "componente", "servicio web", "base de datos", "API", "SDK", "framework", "librería",
+    "algoritmo", "token", "encriptación", "middleware", "protocolo", "latencia",
+    "escalabilidad", "performance", "seguridad", "soporte técnico"
+]
+
+# Servicio de interés que el servidor guarda en el perfil del cliente (en orden de prioridad)
+PROFILE_SERVICE_KEYWORDS = {
+    "landing": ["landing page", "landing"],
+    "ecommerce": ["tienda", "ecommerce", "vender"],
+    "web": ["web", "sitio", "página", "pagina"],
+    "app": ["app", "aplicación", "aplicacion", "móvil"],
+    "branding": ["marca", "logo", "branding"],
+    "automatizacion": ["automatizar", "automatización", "proceso", "negocio"],
+    "marketing": ["instagram", "redes", "social", "facebook"]
+}
+
+def group_by_specificity(phrases: List[str]) -> Dict[str, List[str]]:
+    """Agrupa las frases según su especificidad (claves de PHRASE_WEIGHTS)."""
+    groups = {}
+    for phrase in phrases:
+        if " " in phrase.strip():
+            kind = "phrase"
+        elif len(phrase) <= 2:
+            kind = "short"
+        else:
+            kind = "word"
+        groups.setdefault(kind, []).append(phrase)
+    return groups
+
+# Todos los vocabularios compilados en un solo autómata: KEYWORD_MATCHER.scan(texto)
+# recorre el texto una vez y devuelve cuántas frases de cada categoría aparecen.
+# Las categorías son tuplas (vocabulario, clave), por ejemplo ("sector", "salud");
+# las de intenciones y pilares llevan además la especificidad: ("intent", "greeting", "word")
+KEYWORD_MATCHER = KeywordMatcher({
+    ("sentiment", "positive"): POSITIVE_WORDS,
+    ("sentiment", "negative"): NEGATIVE_WORDS,
+    ("sentiment", "urgency"): URGENCY_WORDS,
+    **{("intent", intent, kind): phrases
+       for intent, patterns in INTENT_PATTERNS.items()
+       for kind, phrases in group_by_specificity(patterns).items()},
+    **{("pillar", pillar, kind): phrases
+       for pillar, patterns in PILLAR_PATTERNS.items()
+       for kind, phrases in group_by_specificity(patterns).items()},
+    **{("level", level): indicators for level, indicators in LEVEL_INDICATORS.items()},
+    ("technical", "question"): TECHNICAL_INDICATORS,
+    **{("sector", sector): keywords for sector, keywords in SECTOR_KEYWORDS.items()},
+    ("technical", "conversation"): CONVERSATION_TECHNICAL_WORDS,
+    **{("service", service): keywords for service, keywords in SERVICE_KEYWORDS.items()},
+    ("response", "empathy"): EMPATHY_WORDS,
+    ("response", "technical"): TECH_KEYWORDS,
+    **{("profile_service", service): keywords for service, keywords in PROFILE_SERVICE_KEYWORDS.items()}
+})
+
+class SentimentAnalyzer:
+    """Analizador de sentimiento para personalizar respuestas según el tono del usuario."""
+    
+    def analyze(self, message: str, keyword_hits: Optional[Dict] = None) -> Dict:
+        """
+        Analiza el sentimiento de un mensaje.
+        
+        Args:
+            message: Mensaje a analizar
+            keyword_hits: Resultado de KEYWORD_MATCHER.scan(message.lower()) si ya
+                          se calculó (evita recorrer el mensaje otra vez)
+            
+        Returns:
+            Diccionario con información de sentimiento
+        """
+        if keyword_hits is None:
+            keyword_hits = KEYWORD_MATCHER.scan(message.lower())
+        
         # Contar ocurrencias
-        positive_count = sum(1 for word in positive_words if word in message_lower)
-        negative_count = sum(1 for word in negative_words if word in message_lower)
-        urgency_count = sum(1 for word in urgency_words if word in message_lower)
+        positive_count = keyword_hits.get(("sentiment", "positive"), 0)
+        negative_count = keyword_hits.get(("sentiment", "negative"), 0)
+        urgency_count = keyword_hits.get(("sentiment", "urgency"), 0)
         
         # Analizar longitud y signos de puntuación
         words = message.split()
@@ -938,19 +2121,545 @@ class SentimentAnalyzer:
         }
     
 
+SENTIMENT_ANALYZER = SentimentAnalyzer()
+
+# Datos de contacto que se extraen del mensaje
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+PHONE_PATTERN = re.compile(r'(?:\+?[0-9]{1,3}[-.\s]?)?[0-9]{2,3}[-.\s]?[0-9]{3,4}[-.\s]?[0-9]{4}')
+NAME_PATTERN = re.compile(r'(?:me llamo|soy|mi nombre es)\s+([A-Za-zÁáÉéÍíÓóÚúÑñ]+(?:\s+[A-Za-zÁáÉéÍíÓóÚúÑñ]+)?)')
+COMPANY_PATTERN = re.compile(r'(?:trabajo en|mi empresa|de)\s+([A-Za-zÁáÉéÍíÓóÚúÑñ0-9&.,\-\s]+?)(?:[.\s]|$)')
+# Nombre para el perfil del servidor: una sola palabra tras la presentación
+PROFILE_NAME_PATTERN = re.compile(r'(?:me llamo|soy|mi nombre es) ([A-Za-záéíóúÁÉÍÓÚñÑ]+)')
+
+
+class MessageAnalysis(NamedTuple):
+    """
+    Resultado inmutable del análisis de un mensaje (ver analyze_message).
+
+    Se calcula una vez por turno y lo consumen el servidor (perfil del cliente)
+    y EvaAssistant (clasificación, datos del usuario, sentimiento, reuniones).
+    """
+    text: str                        # Mensaje original
+    lower: str                       # Mensaje en minúsculas
+    tokens: Tuple[str, ...]          # Palabras del mensaje (message.split())
+    hits: MappingProxyType           # KEYWORD_MATCHER.scan(lower)
+    intent: str                      # Intención para el enrutamiento ("default" si no hay)
+    classifier: str                  # Quién dio la intención: "rules" o "model"
+    pillar: str                      # Pilar estratégico ("general" si no hay)
+    intents: Tuple[Tuple[str, float], ...]  # (intención, confianza) de mayor a menor puntaje
+    pillars: Tuple[Tuple[str, float], ...]  # (pilar, confianza) de mayor a menor puntaje
+    level: int                       # Nivel jerárquico de la consulta (1-5)
+    sector: Optional[str]            # Sector o industria del cliente
+    sentiment: MappingProxyType      # Resultado de SentimentAnalyzer.analyze
+    email: Optional[str]
+    phone: Optional[str]
+    name: Optional[str]              # Nombre según EvaAssistant (hasta dos palabras)
+    company: Optional[str]
+    profile_name: Optional[str]      # Nombre para el perfil del servidor (capitalizado, nunca "Eva")
+    service: Optional[str]           # Servicio de interés según PROFILE_SERVICE_KEYWORDS
+
+
+def score_keywords(hits, vocabulary: str, patterns: Dict, weights: Optional[Dict] = None) -> List[Tuple[str, float]]:
+    """
+    Puntúa todas las claves de un vocabulario con las frases encontradas.
+
+    El puntaje de cada clave es la suma de los pesos (PHRASE_WEIGHTS) de sus
+    frases distintas encontradas, multiplicada por el peso de la clave.
+
+    Args:
+        hits: Resultado de KEYWORD_MATCHER.scan
+        vocabulary: Vocabulario de las categorías ("intent", "pillar")
+        patterns: Diccionario de patrones del vocabulario (define el orden)
+        weights: Peso por clave (1.0 si no aparece)
+
+    Returns:
+        Lista de (clave, puntaje) con puntaje positivo, de mayor a menor; los
+        empates conservan el orden del vocabulario
+    """
+    weights = weights or {}
+    # Solo se recorren las categorías encontradas (pocas), no todo el vocabulario
+    totals = {}
+    for category, count in hits.items():
+        if category[0] == vocabulary:
+            totals[category[1]] = totals.get(category[1], 0.0) + count * PHRASE_WEIGHTS[category[2]]
+    scores = [(key, totals[key] * weights.get(key, 1.0)) for key in patterns if key in totals]
+    scores.sort(key=lambda item: item[1], reverse=True)
+    return scores
+
+
+def with_confidence(scores: List[Tuple[str, float]]) -> Tuple[Tuple[str, float], ...]:
+    """Convierte puntajes en confianzas (parte del puntaje total)."""
+    total = sum(score for _, score in scores)
+    return tuple((key, round(score / total, 3)) for key, score in scores)
+
+
+def select_intent(ranked, minimum: float) -> str:
+    """
+    Elige la intención para el enrutamiento: la primera no secundaria
+    (SECONDARY_INTENTS) cuyo puntaje alcanza `minimum`; si no hay, la primera
+    del ranking, o "default" si está vacío.
+    """
+    return next((intent for intent, score in ranked if intent not in SECONDARY_INTENTS and score >= minimum),
+                ranked[0][0] if ranked else "default")
+
+
+_intent_model = None
+_intent_model_source = None   # (CONFIG["intent_classifier"], CONFIG["intent_model_path"]) del último intento de carga
+_intent_model_lock = threading.Lock()
+
+def get_intent_model() -> Optional[IntentClassifier]:
+    """
+    Devuelve el clasificador aprendido si CONFIG["intent_classifier"] es "model",
+    cargándolo de CONFIG["intent_model_path"] en el primer uso (y de nuevo si
+    cambia la configuración). None si se usan las reglas o si el modelo no
+    pudo cargarse.
+    """
+    global _intent_model, _intent_model_source
+    source = (CONFIG["intent_classifier"], CONFIG["intent_model_path"])
+    if _intent_model_source != source:
+        with _intent_model_lock:
+            if _intent_model_source != source:
+                _intent_model = None
+                if source[0] == "model":
+                    try:
+                        _intent_model = IntentClassifier.load(source[1])
+                        if CONFIG["debug"]:
+                            print(f"{Colors.GREEN}[Intenciones] Modelo cargado de {source[1]} "
+                                  f"({len(_intent_model.vocabulary)} rasgos){Colors.ENDC}")
+                    except Exception as e:
+                        print(f"{Colors.YELLOW}[Intenciones] No se pudo cargar el modelo, se usan las reglas: {e}{Colors.ENDC}")
+                _intent_model_source = source
+    return _intent_model
+
+
+def analyze_message(message: str) -> MessageAnalysis:
+    """
+    Analiza un mensaje en una sola pasada: lo pasa a minúsculas y lo separa en
+    palabras una vez, recorre todos los vocabularios con KEYWORD_MATCHER y
+    extrae intención, pilar, nivel, sector, sentimiento, datos de contacto y
+    servicio de interés.
+
+    El resultado se guarda en un caché LRU: el análisis de la conversación
+    vuelve a revisar los mensajes del historial en cada turno. El clasificador
+    activo (get_intent_model) forma parte de la clave, así un cambio de
+    clasificador no devuelve intenciones ni etiquetas del anterior.
+
+    Args:
+        message: Mensaje del usuario
+
+    Returns:
+        MessageAnalysis con todos los datos del mensaje
+    """
+    return _analyze_message(message, get_intent_model())
+
+
+@functools.lru_cache(maxsize=1024)
+def _analyze_message(message: str, intent_model: Optional[IntentClassifier]) -> MessageAnalysis:
+    """Análisis de analyze_message con el clasificador de intenciones indicado (None = reglas)."""
+    lower = message.lower()
+    tokens = tuple(message.split())
+    hits = KEYWORD_MATCHER.scan(lower)
+
+    # Intenciones y pilares puntuados; el enrutamiento usa la mejor intención que
+    # no sea secundaria ("hola, ¿cuánto cuesta?" es pricing, no greeting)
+    # (con CONFIG["intent_classifier"] = "model", las intenciones las da el modelo aprendido)
+    if intent_model is not None:
+        intents = intent_model.predict(message)
+        min_confidence = CONFIG["intent_model_min_confidence"]
+        intent = select_intent([(key, p) for key, p in intents if p >= min_confidence], min_confidence)
+        classifier = "model"
+    else:
+        intent_scores = score_keywords(hits, "intent", INTENT_PATTERNS, INTENT_WEIGHTS)
+        intents = with_confidence(intent_scores)
+        intent = select_intent(intent_scores, MIN_INTENT_SCORE)
+        classifier = "rules"
+    pillar_scores = score_keywords(hits, "pillar", PILLAR_PATTERNS)
+    pillar = pillar_scores[0][0] if pillar_scores else "general"
+
+    # Nivel jerárquico de la consulta (1-5) según palabras clave, longitud y preguntas técnicas
+    # 1: Identidad de marca (muy básico)
+    # 2: Pilares (general)
+    # 3: Servicios por pilar (semi-específico)
+    # 4: Detalles por servicio (específico)
+    # 5: Extremos técnicos (máxima profundidad)
+    level = max([1] + [level for level in LEVEL_INDICATORS if ("level", level) in hits])
+    if len(tokens) > 15:  # Preguntas largas suelen ser más técnicas
+        level = max(level, 3)
+    if ("technical", "question") in hits:
+        level = max(level, 4)
+
+    sector = next((sector for sector in SECTOR_KEYWORDS if ("sector", sector) in hits), None)
+    sentiment = MappingProxyType(SENTIMENT_ANALYZER.analyze(message, hits))
+
+    # Datos de contacto y presentación
+    email_match = EMAIL_PATTERN.search(message)
+    phone_match = PHONE_PATTERN.search(message)
+    name_match = NAME_PATTERN.search(lower)
+    company_match = COMPANY_PATTERN.search(lower)
+    name = name_match.group(1).strip() if name_match and len(name_match.group(1)) > 2 else None
+    company = company_match.group(1).strip() if company_match and len(company_match.group(1)) > 3 else None
+
+    profile_name = None
+    profile_name_match = PROFILE_NAME_PATTERN.search(lower)
+    if profile_name_match:
+        candidate = profile_name_match.group(1).strip().capitalize()
+        # Evitar tomar "Eva" como nombre del cliente
+        if candidate.lower() != "eva":
+            profile_name = candidate
+
+    service = next((service for service in PROFILE_SERVICE_KEYWORDS if ("profile_service", service) in hits), None)
+
+    return MessageAnalysis(
+        text=message,
+        lower=lower,
+        tokens=tokens,
+        hits=hits,
+        intent=intent,
+        classifier=classifier,
+        pillar=pillar,
+        intents=intents,
+        pillars=with_confidence(pillar_scores),
+        level=level,
+        sector=sector,
+        sentiment=sentiment,
+        email=email_match.group(0) if email_match else None,
+        phone=phone_match.group(0) if phone_match else None,
+        name=name,
+        company=company,
+        profile_name=profile_name,
+        service=service
+    )
+
+# analyze_message.cache_clear() vacía el caché del análisis (lo usa benchmark_clasificacion.py)
+analyze_message.cache_clear = _analyze_message.cache_clear
+
+
+class EvaEngine:
+    """
+    Componentes pesados y sin estado de conversación, compartidos por todas las sesiones.
+
+    Construir estos objetos implica abrir la base de datos, verificar la conexión con
+    Ollama a través del túnel y leer los tokens de Google, por lo que se crean una sola
+    vez por proceso (ver get_engine) en lugar de una vez por sesión.
+    """
+
+    def __init__(self):
+        """Inicializa los componentes compartidos."""
+        # Base de datos local (conexión compartida, protegida por un candado)
+        self.db_manager = DatabaseManager()
+
+        # Cliente de Ollama (pool de servidores de CONFIG["ollama_api_urls"] o del
+        # archivo vigilado, que solo se aplica con la configuración por defecto)
+        self.ollama_client = OllamaClient(model_name=CONFIG["ollama_model"])
+
+        # Integración con Google Calendar si está disponible
+        if GOOGLE_INTEGRATION_AVAILABLE:
+            self.google_integration = GoogleCalendarIntegration()
+        else:
+            self.google_integration = None
+
+        # Analizador de sentimiento
+        self.sentiment_analyzer = SENTIMENT_ANALYZER
+
+        # Clasificador de intenciones aprendido (solo si CONFIG["intent_classifier"] es "model")
+        self.intent_model = get_intent_model()
+
+        # Caché de respuestas de Llama3 para mensajes repetidos entre sesiones
+        self.response_cache = ResponseCache(
+            max_entries=CONFIG["response_cache_max_entries"],
+            ttl=CONFIG["response_cache_ttl"]
+        )
+
+        # Caché semántico para paráfrasis (embeddings de Ollama o locales)
+        if CONFIG["semantic_cache_embedder"] == "ollama":
+            embed_fn = self._embed
+        elif CONFIG["semantic_cache_embedder"] == "local":
+            embed_fn = hashing_embedding
+        else:
+            embed_fn = None
+        self.semantic_cache = SemanticCache(
+            embed_fn,
+            thresholds=CONFIG["semantic_cache_thresholds"],
+            default_threshold=CONFIG["semantic_cache_thresholds"]["default"],
+            max_entries=CONFIG["semantic_cache_max_entries"],
+            ttl=CONFIG["response_cache_ttl"],
+            max_words=CONFIG["semantic_cache_max_words"]
+        )
+
+        # Contadores por intención de turnos generados con Llama3 y de turnos
+        # resueltos con plantilla sin llamarlo
+        self._stats_lock = threading.Lock()
+        self.llm_calls = {}
+        self.llm_calls_avoided = {}
+
+        # Generaciones que vencieron el plazo de respuesta y terminan en segundo plano
+        self.executor = ThreadPoolExecutor(max_workers=CONFIG["background_workers"],
+                                           thread_name_prefix="eva-generacion")
+        self.deadline_stats = {"met": 0, "fired": 0, "late_cached": 0, "late_discarded": 0, "late_cancelled": 0}
+        self.late_generations = 0  # En curso tras vencer el plazo (máximo CONFIG["max_late_generations"])
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        """Embedding con Ollama, o el local si Ollama no tiene el modelo de embeddings."""
+        if self.ollama_client.embeddings_available:
+            vector = self.ollama_client.embed(text)
+            if vector is not None or self.ollama_client.embeddings_available:
+                return vector
+        return hashing_embedding(text)
+
+    def record_turn(self, intent: str, used_llm: bool):
+        """Registra si un turno necesitó a Llama3."""
+        counters = self.llm_calls if used_llm else self.llm_calls_avoided
+        with self._stats_lock:
+            counters[intent] = counters.get(intent, 0) + 1
+
+    def record_deadline(self, event: str):
+        """Registra un evento del plazo de respuesta (met, fired, late_cached, late_discarded, late_cancelled)."""
+        with self._stats_lock:
+            self.deadline_stats[event] += 1
+
+    def start_late_generation(self) -> bool:
+        """
+        Reserva un lugar para que una generación que venció el plazo siga en
+        segundo plano. Cada una ocupa un turno de Ollama, así que se limitan.
+
+        Returns:
+            True si hay lugar (liberarlo con finish_late_generation), False si hay que cancelarla
+        """
+        with self._stats_lock:
+            if self.late_generations >= CONFIG["max_late_generations"]:
+                return False
+            self.late_generations += 1
+            return True
+
+    def finish_late_generation(self):
+        """Libera el lugar de una generación en segundo plano."""
+        with self._stats_lock:
+            self.late_generations -= 1
+
+    def get_stats(self) -> Dict:
+        """Devuelve los contadores de uso de Llama3 por intención."""
+        with self._stats_lock:
+            stats = {
+                "llm_calls": dict(self.llm_calls),
+                "llm_calls_avoided": dict(self.llm_calls_avoided),
+                "deadline": dict(self.deadline_stats)
+            }
+            stats["deadline"]["late_in_flight"] = self.late_generations
+        deadline_total = stats["deadline"]["met"] + stats["deadline"]["fired"]
+        stats["deadline"]["fire_rate"] = round(stats["deadline"]["fired"] / deadline_total, 4) if deadline_total else 0.0
+        stats["response_cache"] = self.response_cache.stats()
+        stats["semantic_cache"] = self.semantic_cache.stats()
+        stats["admission"] = self.ollama_client.admission.stats()
+        concurrency = self.ollama_client.concurrency
+        stats["concurrency"] = concurrency.stats() if concurrency is not None else None
+        stats["circuit"] = self.ollama_client.circuit.stats()
+        return stats
+
+    def close(self):
+        """Libera los recursos compartidos."""
+        self.executor.shutdown(wait=False)
+        self.db_manager.close()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> EvaEngine:
+    """Devuelve el motor compartido del proceso, creándolo en el primer uso."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = EvaEngine()
+    return _engine
+
+def split_sentences(text: str) -> List[Tuple[str, set]]:
+    """Oraciones de más de 20 caracteres de un texto en minúsculas, con el conjunto de sus palabras."""
+    sentences = [s.strip() for s in text.split('.') if len(s.strip()) > 20]
+    return [(sentence, set(sentence.split())) for sentence in sentences]
+
+
+def find_repeated_phrases(sentences: List[Tuple[str, set]], previous_sentences: List[Tuple[str, set]]) -> set:
+    """
+    Oraciones de una respuesta que repiten alguna de la respuesta anterior
+    (ambas listas como las devuelve split_sentences).
+    """
+    repeated = set()
+    for last_s, last_words in sentences:
+        for _, penult_words in previous_sentences:
+            # Similitud simplificada: si comparten más del 60% de palabras, considerar repetición
+            common_words = last_words.intersection(penult_words)
+            if len(common_words) > 0.6 * min(len(last_words), len(penult_words)):
+                repeated.add(last_s[:50] + "...")
+    return repeated
+
+
+class ConversationSummary:
+    """
+    Resumen incremental de los últimos mensajes de una conversación.
+
+    Cada mensaje se analiza una sola vez al entrar en la ventana (temas, preguntas,
+    nivel técnico, sentimiento, saludo y presentación de Eva, repeticiones con la
+    respuesta anterior) y los contadores se actualizan al entrar y al salir de la
+    ventana, así que el costo por turno no crece con la conversación.
+    """
+
+    def __init__(self, window: int = 8):
+        """
+        Args:
+            window: Mensajes recientes que se resumen
+        """
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        """Vacía el resumen."""
+        self._entries = deque()
+        self.length = 0              # Mensajes del historial completo
+        self.last_message = None     # Último mensaje agregado (para detectar cambios por fuera)
+        self._questions = 0
+        self._technical = {}         # Nivel técnico -> mensajes de usuario en la ventana
+        self._sentiments = {}        # Sentimiento -> mensajes de usuario en la ventana
+        self._topics = {}            # Tema -> mensajes de usuario en la ventana
+        self._greeted = 0
+        self._introduced = 0
+        self._assistant_messages = 0
+        self._previous_sentences = []  # Oraciones de la última respuesta de Eva
+
+    def rebuild(self, history: List[Dict]):
+        """Reconstruye el resumen a partir del historial completo."""
+        self.reset()
+        for message in history[-self.window:]:
+            self._push(message)
+        self.length = len(history)
+        self.last_message = history[-1] if history else None
+
+    def is_current(self, history: List[Dict]) -> bool:
+        """Indica si el resumen corresponde al historial (no se modificó por fuera)."""
+        return self.length == len(history) and self.last_message is (history[-1] if history else None)
+
+    def append(self, message: Dict):
+        """Agrega un mensaje al final del historial."""
+        self._push(message)
+        self.length += 1
+        self.last_message = message
+        if len(self._entries) > self.window:
+            self._evict()
+
+    def trim(self, length: int):
+        """El historial se recortó a sus últimos `length` mensajes."""
+        self.length = length
+        while len(self._entries) > length:
+            self._evict()
+        if not length:
+            self.last_message = None
+
+    def _push(self, message: Dict):
+        role = message.get("rol")
+        entry = {"rol": role}
+        if role == "usuario":
+            # Análisis del mensaje (en caché desde el turno en que llegó)
+            analysis = analyze_message(message.get("contenido", ""))
+            hits = analysis.hits
+            entry["question"] = "?" in analysis.text
+            entry["technical"] = min(5, hits.get(("technical", "conversation"), 0))
+            entry["sentiment"] = analysis.sentiment["sentiment"]
+            entry["topics"] = tuple(topic for topic in SERVICE_KEYWORDS if ("service", topic) in hits)
+            self._count(entry, 1)
+        elif role == "asistente":
+            content = message.get("contenido", "").lower()
+            sentences = split_sentences(content)
+            entry["content"] = content
+            entry["greeted"] = "hola" in content[:30] or "buen" in content[:30]
+            entry["introduced"] = "soy eva" in content or "me llamo eva" in content
+            # Repeticiones con la respuesta anterior (solo cuenta si ambas están en la ventana)
+            entry["repeated"] = find_repeated_phrases(sentences, self._previous_sentences)
+            self._previous_sentences = sentences
+            self._count(entry, 1)
+        self._entries.append(entry)
+
+    def _evict(self):
+        self._count(self._entries.popleft(), -1)
+
+    def _count(self, entry: Dict, delta: int):
+        if entry["rol"] == "usuario":
+            self._questions += delta * entry["question"]
+            for counter, key in ((self._technical, entry["technical"]), (self._sentiments, entry["sentiment"])):
+                counter[key] = counter.get(key, 0) + delta
+            for topic in entry["topics"]:
+                self._topics[topic] = self._topics.get(topic, 0) + delta
+        elif entry["rol"] == "asistente":
+            self._assistant_messages += delta
+            self._greeted += delta * entry["greeted"]
+            self._introduced += delta * entry["introduced"]
+
+    def snapshot(self, user_name: Optional[str] = None) -> dict:
+        """
+        Metadatos de la ventana (ver EvaAssistant._analyze_conversation_complexity).
+
+        Args:
+            user_name: Nombre del usuario, para detectar si Eva ya lo usó
+        """
+        last_topics = []
+        name_used = False
+        name = user_name.lower() if user_name else None
+        for entry in self._entries:
+            if entry["rol"] == "usuario":
+                for topic in entry["topics"]:
+                    if len(last_topics) < 3 and topic not in last_topics:
+                        last_topics.append(topic)
+            elif entry["rol"] == "asistente" and name and name in entry["content"]:
+                name_used = True
+
+        positive_count = self._sentiments.get("positive", 0)
+        negative_count = self._sentiments.get("negative", 0)
+        if positive_count > negative_count:
+            sentiment_trend = "positive"
+        elif negative_count > positive_count:
+            sentiment_trend = "negative"
+        else:
+            sentiment_trend = "neutral"
+
+        repeated_phrases = set()
+        if self._assistant_messages >= 2:
+            last_assistant = next(entry for entry in reversed(self._entries) if entry["rol"] == "asistente")
+            repeated_phrases = set(last_assistant["repeated"])
+
+        return {
+            "mentioned_topics": {topic for topic, count in self._topics.items() if count > 0},
+            "repeated_phrases": repeated_phrases,
+            "question_count": self._questions,
+            "last_topics": last_topics,
+            "technical_level": max([0] + [level for level, count in self._technical.items() if count > 0]),
+            "conversation_depth": min(5, self.length // 2),
+            "has_greeted": self._greeted > 0,
+            "has_introduced": self._introduced > 0,
+            "name_used": name_used,
+            "sentiment_trend": sentiment_trend
+        }
+
+
 class EvaAssistant:
     """Asistente virtual Eva para Antares Innovate usando Llama3 vía Ollama."""
     
-    def __init__(self, typing_simulation: bool = True):
-        """Inicializa el asistente virtual."""
+    def __init__(self, typing_simulation: bool = True, engine: Optional[EvaEngine] = None):
+        """
+        Inicializa el asistente virtual.
+
+        Args:
+            typing_simulation: Si se simula la escritura al mostrar respuestas
+            engine: Motor con los componentes compartidos (por defecto, el del proceso)
+        """
         if CONFIG["debug"]:
             print(f"{Colors.YELLOW}[Inicialización] Iniciando Eva con Llama3...{Colors.ENDC}")
         
         self.typing_simulation = typing_simulation
+        self.engine = engine or get_engine()
         
         self.conversation_history = []
+        # Resumen de los últimos mensajes, actualizado en cada _append_message
+        self.conversation_summary = ConversationSummary()
         self.message_counter = 0
-        self.db_manager = DatabaseManager()
+        self.db_manager = self.engine.db_manager
         self.conversation_db_id = None
         
         self.user_info = {
@@ -972,430 +2681,91 @@ class EvaAssistant:
         "solicitando_fecha": False,
         "solicitando_hora": False,
         "fecha_propuesta": None,
-        "hora_propuesta": None,
-        "reunion_confirmada": False,  # Nuevo: confirma si ya fue agendada
-        "canal": None                 # Nuevo: Zoom, Meet, WhatsApp, etc.
-    },
-
-    # Nuevo: historial conversacional corto para contexto inmediato
-    "ultimos_mensajes": [],          # Últimos 5 mensajes clave del usuario
-    "intencion_actual": None,        # Última intención detectada (ej: 'pricing', 'branding')
-    "servicio_mencionado": None,     # Servicio que más se ha reiterado
-    "feedback": None                 # Si se recibe retroalimentación explícita
-}
-
-        
-        # Inicializar cliente de Ollama
-        self.ollama_client = OllamaClient(
-            model_name=CONFIG["ollama_model"],
-            api_url=CONFIG["ollama_api_url"]
-        )
-        
-        # Inicializar integración con Google Calendar si está disponible
-        if GOOGLE_INTEGRATION_AVAILABLE:
-            self.google_integration = GoogleCalendarIntegration()
-        else:
-            self.google_integration = None
-            
-        # Inicializar analizador de sentimiento
-        self.sentiment_analyzer = SentimentAnalyzer()
-    
-    def _classify_intent_and_level(self, message: str) -> Tuple[str, str, int]:
-        """
-        Clasifica la intención del mensaje, detecta el pilar relacionado
-        y evalúa su nivel de complejidad técnica.
-        
-        Returns:
-            Tupla con (intención, pilar, nivel_jerarquico)
-        """
-        message_lower = message.lower()
-        
-        # Patrones de intenciones
-# Patrones de intenciones ampliados para EVA
-        intent_patterns = {
-        "greeting": [
-        "hola", "qué tal", "buenos días", "buenas tardes", "buenas noches",
-        "saludos", "hey", "buen día", "qué onda", "holi", "hola eva", "hello", "hi"
-        ],
-        "farewell": [
-        "adiós", "hasta luego", "chao", "bye", "nos vemos", "gracias por todo",
-        "muchas gracias", "eso es todo", "me voy", "hasta pronto", "nos hablamos"
-    ],
-    "identity": [
-        "quién eres", "qué es antares", "quién es eva", "antares innovate",
-        "empresa", "compañía", "ustedes quiénes son", "me hablas como si te conociera",
-        "a qué se dedican", "representas a quién", "qué es esto"
-    ],
-    "services": [
-        "servicios", "qué ofrecen", "qué hacen", "soluciones", "productos", "portafolio",
-        "en qué me pueden ayudar", "pueden hacer esto", "ofrecen", "tienen tal servicio"
-    ],
-    "creativity": [
-        "creatividad", "diseño", "branding", "logo", "identidad visual",
-        "video", "ilustración", "imagen de marca", "naming", "colores", "diseño gráfico",
-        "visual", "mockup", "fotografía", "rebranding"
-    ],
-    "technology": [
-        "tecnología", "desarrollo", "web", "app", "aplicación", "ui", "ux", "chatbot",
-        "software", "sistema", "plataforma", "automatización", "ecommerce", "tienda online",
-        "landing", "sistema web", "integración", "inteligencia artificial", "API"
-    ],
-    "consulting": [
-        "consultoría", "automatización", "proceso", "asesoría", "transformación digital",
-        "optimización", "modelo de negocio", "mentoría", "acompañamiento", "estrategia digital",
-        "análisis", "diagnóstico", "propuesta", "revisión"
-    ],
-    "pricing": [
-        "precio", "costo", "cuánto", "inversión", "presupuesto", "vale", "tarifa",
-        "valores", "cotización", "cuánto me sale", "paquetes", "planes", "promoción"
-    ],
-    "contact": [
-        "contacto", "correo", "teléfono", "llamar", "contactarme", "hablar",
-        "enviar datos", "whatsapp", "email", "cómo los ubico", "redes sociales", "oficina"
-    ],
-    "meeting": [
-        "reunión", "agendar", "cita", "calendario", "llamada", "charlar", "asesoría",
-        "podemos hablar", "me pueden llamar", "agendar una reunión", "quiero hablar con alguien",
-        "disponibilidad", "agenda"
-    ],
-    "help": [
-        "ayuda", "necesito", "cómo", "explicar", "duda", "favor",
-        "no entiendo", "me pueden orientar", "no sé por dónde empezar", "necesito apoyo",
-        "recomiéndame", "me ayudas con esto", "sugerencia"
-    ],
-    "testimonials": [
-        "casos de éxito", "resultados", "clientes", "testimonios", "quiénes han trabajado con ustedes",
-        "experiencia", "pueden mostrarme ejemplos", "tienen referencias"
-    ],
-    "urgency": [
-        "urgente", "lo necesito ya", "es para ya", "apúrate", "tengo poco tiempo",
-        "en cuánto tiempo", "lo más rápido posible"
-    ],
-    "industry_specific": [
-        "restaurante", "moda", "salud", "educación", "hotel", "retail", "agencia",
-        "hospital", "construcción", "ONG", "fintech", "turismo"
-        ]
-            }
-
-        
-        # Detectar intención primaria
-        detected_intent = "default"
-        for intent, patterns in intent_patterns.items():
-            if any(pattern in message_lower for pattern in patterns):
-                detected_intent = intent
-                break
-        
-        # Detectar a qué pilar estratégico corresponde la intención del usuario
-        pillar_patterns = {
-    "creativity": [
-        "diseño", "branding", "logo", "marca", "identidad visual", "video", "ilustración", 
-        "fotografía", "contenido", "visual", "color", "creatividad", "naming", "storytelling", 
-        "manual de marca", "diseño gráfico", "mockup", "presentación", "animación"
-    ],
-    "technology": [
-        "desarrollo", "web", "app", "aplicación", "ui", "ux", "chatbot", "programación", 
-        "código", "sistema", "automatización", "tecnología", "software", "API", "plataforma", 
-        "infraestructura", "base de datos", "integración", "responsive", "framework", "entorno tech"
-    ],
-    "consulting": [
-        "consultoría", "asesoría", "estrategia", "transformación", "negocio", "automatización", 
-        "proceso", "modelo", "optimización", "análisis", "mentor", "diagnóstico", "acompañamiento", 
-        "cambio organizacional", "alineación", "revisión", "taller", "capacitación"
-    ]
-}
-
-        
-        detected_pillar = "general"
-        for pillar, patterns in pillar_patterns.items():
-            if any(pattern in message_lower for pattern in patterns):
-                detected_pillar = pillar
-                break
-        
-        # Evaluar nivel jerárquico de la consulta (1-5)
-        # 1: Identidad de marca (muy básico)
-        # 2: Pilares (general)
-        # 3: Servicios por pilar (semi-específico)
-        # 4: Detalles por servicio (específico)
-        # 5: Extremos técnicos (máxima profundidad)
-        
-            hierarchy_level = 1  # Nivel por defecto
-        
-        # Palabras clave indicadoras de nivel técnico
-        # Palabras clave indicadoras de nivel técnico o profundidad del usuario
-        level_indicators = {
-    1: [
-        "quién", "qué es", "cuál es", "qué hacen", "básico", "para qué sirve", 
-        "qué significa", "cómo empiezo", "nivel inicial", "empezar", "soy nuevo"
-    ],
-    2: [
-        "servicios", "ofrecen", "qué incluye", "áreas", "pilares", "especialidad", 
-        "qué cubren", "tipos de soluciones", "categorías", "en qué se enfocan"
-    ],
-    3: [
-        "cómo funciona", "detalle", "específico", "paso a paso", "flujo", "etapas", 
-        "proceso", "cómo lo hacen", "qué pasos siguen", "resultados", "herramientas"
-    ],
-    4: [
-        "implementación", "configuración", "framework", "infraestructura", "metodología", 
-        "tecnología usada", "bases de datos", "sistema", "estructura técnica", "entorno"
-    ],
-    5: [
-        "precio", "costo", "inversión", "tiempo estimado", "presupuesto", "cuánto vale", 
-        "plazos", "roadmap", "integración", "API", "documentación técnica", 
-        "escalabilidad", "arquitectura", "soporte", "automatización avanzada"
-    ]
+        "hora_propuesta": None,
+        "reunion_confirmada": False,  # Nuevo: confirma si ya fue agendada
+        "canal": None                 # Nuevo: Zoom, Meet, WhatsApp, etc.
+    },
+
+    # Nuevo: historial conversacional corto para contexto inmediato
+    "ultimos_mensajes": [],          # Últimos 5 mensajes clave del usuario
+    "intencion_actual": None,        # Última intención detectada (ej: 'pricing', 'branding')
+    "servicio_mencionado": None,     # Servicio que más se ha reiterado
+    "feedback": None                 # Si se recibe retroalimentación explícita
 }
 
         
-        # Evaluar nivel jerárquico basado en palabras clave
-        max_level = 1
-        for level, indicators in level_indicators.items():
-            if any(indicator in message_lower for indicator in indicators):
-                max_level = max(max_level, level)
+        # Componentes compartidos del motor
+        self.ollama_client = self.engine.ollama_client
+        # Contexto de Ollama de esta sesión (reutiliza la caché KV entre turnos)
+        self.ollama_conversation = OllamaConversation()
+        self.google_integration = self.engine.google_integration
+        self.sentiment_analyzer = self.engine.sentiment_analyzer
+    
+    def _classify_intent_and_level(self, message: str, analysis: Optional[MessageAnalysis] = None) -> Tuple[str, str, int]:
+        """
+        Clasifica la intención del mensaje, detecta el pilar relacionado
+        y evalúa su nivel de complejidad técnica.
         
-        # Ajustar según longitud y complejidad de la pregunta
-        if len(message.split()) > 15:  # Preguntas largas suelen ser más técnicas
-            max_level = max(max_level, 3)
+        Args:
+            message: Mensaje del usuario
+            analysis: Resultado de analyze_message(message) si ya se calculó
         
-        # Detectar preguntas técnicas específicas
-        technical_indicators = ["cómo", "implementar", "configurar", "integrar", "desarrollar", "optimizar"]
-        if any(indicator in message_lower for indicator in technical_indicators):
-            max_level = max(max_level, 4)
+        Returns:
+            Tupla con (intención, pilar, nivel_jerarquico)
+        """
+        if analysis is None:
+            analysis = analyze_message(message)
         
         # Actualizar nivel técnico del usuario si es una consulta técnica
-        if max_level >= 4:
+        if analysis.level >= 4:
             self.user_info["nivel_tecnico"] = "alto"
         
-        return detected_intent, detected_pillar, max_level
-    
-    def _extract_user_info(self, message: str):
-        """Extrae información del usuario y pistas emocionales."""
-        message_lower = message.lower()
-    
-        # Extraer correo
-        email_match = re.search(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', message)
-        if email_match and not self.user_info["email"]:
-            self.user_info["email"] = email_match.group(0)
+        return analysis.intent, analysis.pillar, analysis.level
     
-        # Extraer teléfono
-        phone_match = re.search(r'(?:\+?[0-9]{1,3}[-.\s]?)?[0-9]{2,3}[-.\s]?[0-9]{3,4}[-.\s]?[0-9]{4}', message)
-        if phone_match and not self.user_info["telefono"]:
-            self.user_info["telefono"] = phone_match.group(0)
+    def _extract_user_info(self, message: str, analysis: Optional[MessageAnalysis] = None):
+        """
+        Extrae información del usuario y pistas emocionales.
+        
+        Args:
+            message: Mensaje del usuario
+            analysis: Resultado de analyze_message(message) si ya se calculó
+        """
+        if analysis is None:
+            analysis = analyze_message(message)
     
-        # Extraer nombre con más sensibilidad
-        name_match = re.search(r'(?:me llamo|soy|mi nombre es)\s+([A-Za-zÁáÉéÍíÓóÚúÑñ]+(?:\s+[A-Za-zÁáÉéÍíÓóÚúÑñ]+)?)', message_lower)
-        if name_match and len(name_match.group(1)) > 2:
-            self.user_info["nombre"] = name_match.group(1).strip()
+        # Correo y teléfono: se conserva el primero que dio el usuario
+        if analysis.email and not self.user_info["email"]:
+            self.user_info["email"] = analysis.email
+        if analysis.phone and not self.user_info["telefono"]:
+            self.user_info["telefono"] = analysis.phone
     
-        # Extraer empresa
-        company_match = re.search(r'(?:trabajo en|mi empresa|de)\s+([A-Za-zÁáÉéÍíÓóÚúÑñ0-9&.,\-\s]+?)(?:[.\s]|$)', message_lower)
-        if company_match and len(company_match.group(1)) > 3:
-            self.user_info["empresa"] = company_match.group(1).strip()
+        if analysis.name:
+            self.user_info["nombre"] = analysis.name
+        if analysis.company:
+            self.user_info["empresa"] = analysis.company
     
-        # Palabras clave que indican el sector o industria del cliente
-        sector_keywords = {
-    "inmobiliario": [
-        "inmobiliaria", "bienes raíces", "propiedad", "propiedades", "casa", "apartamento",
-        "inmueble", "renta", "alquiler", "venta de casas", "urbanización", "construcción residencial"
-    ],
-    "salud": [
-        "salud", "hospital", "clínica", "médico", "paciente", "consultorio", "laboratorio",
-        "sanitario", "historia clínica", "terapia", "psicología", "odontología"
-    ],
-    "educación": [
-        "educación", "escuela", "universidad", "academia", "colegio", "alumno", "estudiante",
-        "formación", "e-learning", "clases", "plataforma educativa", "capacitación"
-    ],
-    "financiero": [
-        "banco", "financiero", "finanzas", "inversión", "seguro", "crédito", "hipoteca",
-        "cuenta", "tarjeta", "fintech", "pagos", "billetera digital", "cobros", "transferencias"
-    ],
-    "retail": [
-        "tienda", "retail", "comercio", "venta", "ecommerce", "producto", "carrito de compras",
-        "moda", "ropa", "calzado", "inventario", "stock", "catálogo", "consumidor final"
-    ],
-    "manufactura": [
-        "fábrica", "manufactura", "producción", "industrial", "ensamble", "cadena de suministro",
-        "planta", "maquinaria", "logística", "proceso productivo", "almacén", "inventario industrial"
-    ],
-    "gastronomía": [
-        "restaurante", "bar", "chef", "comida", "menú", "carta", "reservas", "delivery",
-        "domicilio", "pedidos", "cocina", "gourmet", "foodtruck", "gastronomía"
-    ],
-    "turismo": [
-        "hotel", "turismo", "viajes", "agencia de viajes", "guía turístico", "reserva", "hospedaje",
-        "check-in", "check-out", "turistas", "destino", "booking"
-    ],
-    "ONG / impacto social": [
-        "ONG", "organización sin fines de lucro", "fundación", "comunidad", "impacto social",
-        "voluntariado", "proyecto social", "causa", "donación", "sostenibilidad"
-    ],
-    "automotriz": [
-        "concesionaria", "autos", "vehículos", "taller", "mecánico", "repuestos", "automotriz",
-        "transporte", "camiones", "movilidad", "carros", "flota"
-    ],
-    "entretenimiento / cultura": [
-        "teatro", "cine", "concierto", "evento", "boletos", "espectáculo", "producción audiovisual",
-        "entretenimiento", "arte", "festival", "obra"
-    ],
-    "tecnología / software": [
-        "startup", "tecnología", "software", "app", "programación", "desarrollador", "web",
-        "plataforma digital", "sistema", "cloud", "infraestructura tech", "código"
-    ]
-}
-
-        
-        for sector, keywords in sector_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                self.user_info["sector"] = sector
-                break
+        # Sector o industria del cliente
+        if analysis.sector:
+            self.user_info["sector"] = analysis.sector
         
-        # Analizar sentimiento
-        sentiment_data = self.sentiment_analyzer.analyze(message)
-        self.user_info["sentimiento"] = sentiment_data["sentiment"]
+        self.user_info["sentimiento"] = analysis.sentiment["sentiment"]
     
     def _analyze_conversation_complexity(self) -> dict:
         """
         Analiza el historial de conversación para evaluar complejidad y evitar repeticiones.
         
-        Returns:
-            Diccionario con metadatos sobre el historial de conversación
-        """
-        # Inicializar datos
-        metadata = {
-            "mentioned_topics": set(),
-            "repeated_phrases": set(),
-            "question_count": 0,
-            "last_topics": [],
-            "technical_level": 0,  # 0-5 nivel de complejidad técnica
-            "conversation_depth": 0,  # 0-5 profundidad de la conversación
-            "has_greeted": False,  # Si ya se ha saludado
-            "has_introduced": False,  # Si ya se ha presentado
-            "name_used": False,  # Si ya se ha usado el nombre del usuario
-            "sentiment_trend": "neutral"  # Tendencia del sentimiento del usuario
-        }
-    
-        # Solo analizar mensajes recientes
-        recent_messages = self.conversation_history[-min(8, len(self.conversation_history)):]
-        
-        # Detectar si ya se ha saludado e introducido
-        assistant_messages = [msg for msg in recent_messages if msg.get("rol") == "asistente"]
-        for msg in assistant_messages:
-            content = msg.get("contenido", "").lower()
-            
-            # Detectar saludos
-            if "hola" in content[:30] or "buen" in content[:30]:
-                metadata["has_greeted"] = True
-                
-            # Detectar presentaciones
-            if "soy eva" in content or "me llamo eva" in content:
-                metadata["has_introduced"] = True
-                
-            # Detectar uso del nombre
-            if self.user_info["nombre"] and self.user_info["nombre"].lower() in content:
-                metadata["name_used"] = True
-        
-        # Contar preguntas y analizar complejidad técnica
-        technical_words = ["implementación", "integración", "configuración", "arquitectura", "framework", 
-                          "optimización", "desarrollo", "metodología", "técnico", "programación"]
-        
-        sentiment_values = []
-        
-        for msg in recent_messages:
-            if msg.get("rol") == "usuario":
-                content = msg.get("contenido", "").lower()
-                # Contar preguntas
-                if "?" in content:
-                    metadata["question_count"] += 1
-                
-                # Evaluar nivel técnico
-                technical_score = sum(1 for word in technical_words if word in content)
-                metadata["technical_level"] = max(metadata["technical_level"], min(5, technical_score))
-                
-                # Rastrear sentimiento
-                sentiment_data = self.sentiment_analyzer.analyze(content)
-                sentiment_values.append(sentiment_data["sentiment"])
-                
-                # Detectar menciones de servicios específicos
-                service_keywords = {
-    "branding": [
-        "logo", "marca", "branding", "diseño", "identidad visual", "naming", "colores", 
-        "manual de marca", "rebranding", "diseño gráfico", "imagen corporativa"
-    ],
-    "web": [
-        "página web", "sitio web", "web", "desarrollo web", "landing", "frontend", 
-        "backend", "hosting", "wordpress", "tienda online", "ecommerce", "web responsive", 
-        "formulario web", "experiencia web"
-    ],
-    "automatización": [
-        "automatizar", "robot", "rpa", "proceso", "flujo", "automatización de tareas", 
-        "optimizar", "scripts", "bots", "pipeline", "automatización de negocio", 
-        "notificaciones automáticas", "integración automática", "automatización de ventas"
-    ],
-    "apps": [
-        "app", "aplicación", "móvil", "ios", "android", "aplicación híbrida", 
-        "desarrollo móvil", "app personalizada", "reserva desde app", "apps para clientes", 
-        "gestión desde app", "app para empleados"
-    ],
-    "chatbots": [
-        "chatbot", "asistente virtual", "bot", "ia", "chat automático", "soporte virtual", 
-        "asistente inteligente", "automatización de atención", "respuesta automática", 
-        "chat 24/7", "whatsapp bot", "chat con IA"
-    ],
-    "marketing": [
-        "marketing", "redes sociales", "digital", "publicidad", "seo", "anuncios", 
-        "contenido", "community manager", "estrategia digital", "tráfico", "engagement", 
-        "campañas", "leads", "embudo", "ads", "social media"
-    ]
-}
-
-                
-                for topic, keywords in service_keywords.items():
-                    if any(keyword in content for keyword in keywords):
-                        metadata["mentioned_topics"].add(topic)
-                        if len(metadata["last_topics"]) < 3:
-                            if topic not in metadata["last_topics"]:
-                                metadata["last_topics"].append(topic)
-        
-        # Calcular profundidad de conversación
-        metadata["conversation_depth"] = min(5, len(self.conversation_history) // 2)
-        
-        # Determinar tendencia del sentimiento
-        if sentiment_values:
-            positive_count = sum(1 for s in sentiment_values if s == "positive")
-            negative_count = sum(1 for s in sentiment_values if s == "negative")
-            
-            if positive_count > negative_count:
-                metadata["sentiment_trend"] = "positive"
-            elif negative_count > positive_count:
-                metadata["sentiment_trend"] = "negative"
-            else:
-                metadata["sentiment_trend"] = "neutral"
-        
-        # Detectar frases repetidas en respuestas recientes
-        assistant_messages = [msg for msg in recent_messages if msg.get("rol") == "asistente"]
-        if len(assistant_messages) >= 2:
-            # Comparar respuestas recientes para detectar repeticiones
-            last_resp = assistant_messages[-1].get("contenido", "").lower()
-            penult_resp = assistant_messages[-2].get("contenido", "").lower()
-            
-            # Dividir en frases
-            last_sentences = [s.strip() for s in last_resp.split('.') if len(s.strip()) > 20]
-            penult_sentences = [s.strip() for s in penult_resp.split('.') if len(s.strip()) > 20]
-            
-            # Buscar similitud entre frases
-            for last_s in last_sentences:
-                for penult_s in penult_sentences:
-                    # Similitud simplificada: si comparten muchas palabras
-                    last_words = set(last_s.split())
-                    penult_words = set(penult_s.split())
-                    common_words = last_words.intersection(penult_words)
-                    
-                    # Si comparten más del 60% de palabras, considerar repetición
-                    if len(common_words) > 0.6 * min(len(last_words), len(penult_words)):
-                        metadata["repeated_phrases"].add(last_s[:50] + "...")
+        Usa el resumen incremental de los últimos 8 mensajes (ConversationSummary);
+        si el historial se modificó sin _append_message/trim_history, lo reconstruye.
         
-        return metadata
+        Returns:
+            Diccionario con metadatos sobre el historial de conversación:
+            mentioned_topics, repeated_phrases, question_count, last_topics,
+            technical_level (0-5), conversation_depth (0-5), has_greeted,
+            has_introduced, name_used y sentiment_trend
+        """
+        if not self.conversation_summary.is_current(self.conversation_history):
+            self.conversation_summary.rebuild(self.conversation_history)
+        return self.conversation_summary.snapshot(self.user_info["nombre"])
     
     def _extract_datetime_from_message(self, message: str) -> Tuple[Optional[Union[datetime, date, datetime_time]], bool, str]:
         """
@@ -1727,8 +3097,7 @@ class EvaAssistant:
             return ("Me encantaría coordinar una reunión contigo. Escríbenos a " + 
                     f"{CONFIG['company_email']} o llámanos al +52 (55) 1234-5678 para agendar un horario conveniente."), False
         
-        # Extraer información del usuario si no la tenemos
-        self._extract_user_info(message)
+        # La información del usuario (correo, nombre, empresa) ya se extrajo en _start_turn
         
         # Estado de la solicitud de reunión (almacenado en el contexto del usuario)
         reunion_state = self.user_info.get("reunion_state", {
@@ -1978,37 +3347,61 @@ class EvaAssistant:
                    f"¿Qué día te gustaría agendar nuestra reunión? "
                    f"Tenemos disponibilidad para {', '.join(dates_str)}."), False
     
-    def _build_prompt(self, message: str, intent: str, pillar: str, level: int) -> str:
+    def _session_context(self, perfil_cliente: Optional[Dict] = None) -> Dict:
         """
-        Construye el prompt para Llama3 usando la función centralizada de knowledge_fragments.
+        Datos dinámicos de la sesión que van al final del prompt.
+
+        Args:
+            perfil_cliente: Perfil que mantiene el servidor (nombre, servicio)
         """
-         # Analizar el historial de conversación
-        conversation_metadata = self._analyze_conversation_complexity()
-    
-    # Preparar contexto adicional para el prompt
-        context_info = {
-        "technical_level": conversation_metadata["technical_level"],
-        "conversation_depth": conversation_metadata["conversation_depth"],
-        "sentiment": self.user_info["sentimiento"],
-        "mentioned_topics": conversation_metadata["mentioned_topics"],
-        "user_name": self.user_info["nombre"],
-        "repeated_phrases": conversation_metadata["repeated_phrases"],
-        "has_greeted": conversation_metadata.get("has_greeted", False),
-        "has_introduced": conversation_metadata.get("has_introduced", False)
+        with metrics.stage("complejidad"):
+            conversation_metadata = self._analyze_conversation_complexity()
+        perfil = perfil_cliente or {}
+        return {
+            "nombre": perfil.get("nombre") or self.user_info["nombre"],
+            "empresa": self.user_info["empresa"],
+            "sector": self.user_info["sector"],
+            "servicio": perfil.get("servicio") or self.user_info["servicio_mencionado"],
+            "temas": sorted(conversation_metadata["mentioned_topics"]),
+            "ya_saludo": conversation_metadata["has_greeted"]
         }
-    
-         # Obtener el prompt optimizado desde knowledge_fragments
-        # Opcional: armar texto de contexto combinando variables que antes pasabas por separado
-        extra_context = context_info  # Podés incluir aquí más info si querés
 
-        prompt = get_filtered_prompt(
-        message, intent, nivel=level, 
-        contexto_extra=extra_context
-)
+    def _build_prompt(self, message: str, intent: str, level: int,
+                      perfil_cliente: Optional[Dict] = None,
+                      conversation: Optional[OllamaConversation] = None,
+                      session_context: Optional[Dict] = None) -> str:
+        """
+        Construye el prompt del turno para Llama3 usando el armado centralizado de
+        knowledge_fragments.
+
+        El primer turno lleva el prompt completo (prefijo estático, conocimiento y
+        datos de sesión). Los siguientes continúan sobre el contexto de Ollama y
+        solo agregan el conocimiento de una intención nueva y los datos de sesión
+        que hayan cambiado. Un turno cuyo stream se cortó antes de `done` no
+        quedó en el contexto: el siguiente reenvía su mensaje y lo que no llegó a
+        confirmarse.
+
+        `conversation` permite armar el prompt sobre una copia del estado (ver
+        _generate_within_deadline); por defecto se usa el de la sesión.
+        `session_context` evita recalcular los datos de sesión si el llamador ya
+        los tiene (ver _cached_response).
+        """
+        if session_context is None:
+            session_context = self._session_context(perfil_cliente)
+        conversation = conversation or self.ollama_conversation
+
+        with metrics.stage("prompt"):
+            if not conversation.active:
+                conversation.begin_turn(message, {intent}, session_context)
+                return build_prompt(message, intent, nivel=level, session_context=session_context)
+
+            missed_message = conversation.missed_message
+            include_knowledge = intent not in conversation.intents
+            changed_context = session_context if session_context != conversation.session_context else None
+            conversation.begin_turn(message, conversation.intents | {intent}, session_context)
+            return get_followup_prompt(message, intent, nivel=level, include_knowledge=include_knowledge,
+                                       session_context=changed_context, previous_message=missed_message)
 
-    
-        return prompt
-    
     def _optimize_response(self, response: str, max_length: int, is_technical: bool = False) -> str:
         """
         Optimiza la respuesta manteniendo su valor y tono amigable.
@@ -2025,48 +3418,24 @@ class EvaAssistant:
         if len(response) <= max_length:
             return response
 
-       # Palabras y frases clave de empatía, calidez y cercanía emocional
-        empathy_words = [
-    "entiendo", "comprendo", "tranquilo", "no te preocupes", "te entiendo",
-    "me alegra", "qué bueno", "genial", "fantástico", "excelente", "estupendo", "maravilloso",
-    "qué alegría", "encantada", "cuenta conmigo", "confía", "aquí estoy", "te apoyo",
-    "estoy para ayudarte", "lo resolveremos juntos", "respira", "todo saldrá bien",
-    "gracias por compartirlo", "me emociona escucharlo", "eso suena increíble", 
-    "me encanta", "con gusto", "un placer ayudarte", "¡qué emocionante!"
-]
-
-        
         # Dividir en oraciones
         sentences = re.split(r'(?<=[.!?])\s+', response.strip())
         
         # Para respuestas técnicas, preservar más detalles
         if is_technical:
-            # Palabras clave que indican contenido técnico relevante que debe preservarse
-            tech_keywords = [
-    "implementar", "desarrollar", "configurar", "programar", "diseñar", "optimizar",
-    "automatizar", "integrar", "conectar", "desplegar", "debuggear", "customizar",
-
-    "tecnología", "infraestructura", "arquitectura", "entorno", "servidor", "nube",
-    "plataforma", "sistema", "módulo", "motor", "backend", "frontend",
-
-    "funcionalidad", "componente", "servicio web", "base de datos", "API", "SDK",
-    "framework", "librería", "algoritmo", "token", "encriptación", "middleware",
-
-    "protocolo", "latencia", "escalabilidad", "performance", "seguridad", "soporte técnico"
-]
-
             priority_sentences = []
             normal_sentences = []
             
             for sentence in sentences:
+                hits = KEYWORD_MATCHER.scan(sentence.lower())
                 # Las oraciones iniciales siempre tienen prioridad
                 if sentences.index(sentence) == 0:
                     priority_sentences.append(sentence)
                 # Las oraciones con palabras técnicas tienen prioridad
-                elif any(keyword in sentence.lower() for keyword in tech_keywords):
+                elif ("response", "technical") in hits:
                     priority_sentences.append(sentence)
                 # También preservar oraciones con empatía
-                elif any(word in sentence.lower() for word in empathy_words):
+                elif ("response", "empathy") in hits:
                     priority_sentences.append(sentence)
                 # Las oraciones con números o datos específicos son prioritarias
                 elif re.search(r'\d+', sentence) or '%' in sentence:
@@ -2107,7 +3476,7 @@ class EvaAssistant:
             for sentence in sentences[1:-1]:
                 if self.user_info["nombre"] and self.user_info["nombre"].lower() in sentence.lower():
                     personalized_sentences.append(sentence)
-                elif any(word in sentence.lower() for word in empathy_words):
+                elif ("response", "empathy") in KEYWORD_MATCHER.scan(sentence.lower()):
                     personalized_sentences.append(sentence)
             
             # Añadir oraciones personalizadas (limitando a 2)
@@ -2147,65 +3516,92 @@ class EvaAssistant:
         
         return optimized.strip()
 
-    def get_response(self, message: str) -> str:
-        """Genera una respuesta al mensaje del usuario."""
+    def _start_turn(self, message: str, analysis: Optional[MessageAnalysis] = None) -> Tuple[str, str, int]:
+        """
+        Clasifica el mensaje, extrae datos del usuario y lo registra en el historial.
+
+        El mensaje se analiza una sola vez (analyze_message); si el servidor ya lo
+        analizó para el perfil del cliente, se reutiliza su resultado.
+        """
         if CONFIG["debug"]:
             print(f"\n{Colors.BLUE}[Procesando] Mensaje: '{message}'{Colors.ENDC}")
 
         self.message_counter += 1
-        intent, pillar, level = self._classify_intent_and_level(message)
+        with metrics.stage("clasificacion"):
+            if analysis is None:
+                analysis = analyze_message(message)
+            intent, pillar, level = self._classify_intent_and_level(message, analysis)
 
         if CONFIG["debug"]:
-            print(f"{Colors.BLUE}[Procesando] Intención: {intent}, Pilar: {pillar}, Nivel: {level}{Colors.ENDC}")
-
-    # Extraer información del usuario del mensaje
-        self._extract_user_info(message)
-
-    # Guardar el mensaje en el historial
-        self.conversation_history.append({
-        "id": self.message_counter,
-        "rol": "usuario", 
-        "contenido": message,
-        "timestamp": datetime.now().isoformat(),
-        "intencion": intent
-    })
+            print(f"{Colors.BLUE}[Procesando] Intención: {intent}, Pilar: {pillar}, Nivel: {level} "
+                  f"(intenciones: {list(analysis.intents)}){Colors.ENDC}")
 
-    # Simular tiempo de pensamiento
-        simulate_thinking(len(message))
+        # Extraer información del usuario del mensaje
+        with metrics.stage("extraccion"):
+            self._extract_user_info(message, analysis)
 
-    # Manejar solicitudes de reunión si se detecta esa intención
-        if intent == "meeting":
-            meeting_response, meeting_processed = self._handle_meeting_request(message)
+        # Guardar el mensaje en el historial
+        self._append_message({
+            "id": self.message_counter,
+            "rol": "usuario",
+            "contenido": message,
+            "timestamp": datetime.now().isoformat(),
+            "intencion": intent,
+            "clasificador": analysis.classifier
+        })
 
-            if meeting_processed or "reunión" in meeting_response.lower():
-                self.conversation_history.append({
-                "id": self.message_counter,
-                "rol": "asistente", 
-                "contenido": meeting_response,
-                "timestamp": datetime.now().isoformat(),
-                "intencion": intent
-                })
+        return intent, pillar, level
 
-                if self.typing_simulation:
-                    simulate_typing(meeting_response)
-                else:
-                    print(f"\n{Colors.GREEN}Eva:{Colors.ENDC} {meeting_response}")
+    def _append_message(self, message: Dict):
+        """Agrega un mensaje al historial y al resumen de la conversación."""
+        self.conversation_history.append(message)
+        self.conversation_summary.append(message)
 
-                return meeting_response
+    def trim_history(self, max_messages: int):
+        """Conserva solo los últimos `max_messages` mensajes del historial."""
+        if len(self.conversation_history) > max_messages:
+            del self.conversation_history[:len(self.conversation_history) - max_messages]
+            self.conversation_summary.trim(len(self.conversation_history))
 
-    # Definir is_technical antes del llamado a Ollama
-        is_technical = level >= 4 or (intent in ["consulting", "technology", "creativity"] and level >= 3)
+    def _abort_turn(self):
+        """Deshace el registro del mensaje del usuario cuando el turno se rechaza sin respuesta."""
+        # Sin respuesta el mensaje tampoco debe reenviarse como ya respondido
+        self.ollama_conversation.discard_turn()
+        if self.conversation_history and self.conversation_history[-1]["rol"] == "usuario":
+            self.conversation_history.pop()
+            # El mensaje que había salido de la ventana vuelve a entrar
+            self.conversation_summary.rebuild(self.conversation_history)
 
-    # Construir el prompt para Llama3
-        prompt = get_filtered_prompt(message, intent, nivel=level)
+    def _finish_turn(self, response: str, intent: str):
+        """Registra la respuesta de Eva en el historial."""
+        self._append_message({
+            "id": self.message_counter,
+            "rol": "asistente",
+            "contenido": response,
+            "timestamp": datetime.now().isoformat(),
+            "intencion": intent
+        })
 
-    # Generar respuesta con Llama3
-        llama_response = self.ollama_client.generate_response(prompt)
+        if CONFIG["debug"]:
+            print(f"{Colors.GREEN}[Procesando] Respuesta lista ({len(response)} caracteres){Colors.ENDC}")
 
-        if not llama_response or len(llama_response) < 20:
-            if CONFIG["debug"]:
-                print(f"{Colors.YELLOW}[Advertencia] Respuesta de Llama3 vacía o muy corta, usando fallback{Colors.ENDC}")
+    def _generation_budget(self, intent: str, level: int) -> Dict:
+        """
+        Presupuesto de generación del turno: si es técnico, caracteres y oraciones
+        máximas de la respuesta y tokens que Ollama puede generar (num_predict).
+        """
+        is_technical = level >= 4 or (intent in ["consulting", "technology", "creativity"] and level >= 3)
+        budgets = CONFIG["generation_budget"]
+        budget = budgets["technical"] if is_technical else budgets.get(intent, budgets["default"])
+        return {
+            "is_technical": is_technical,
+            "max_length": CONFIG["max_response_length"] if is_technical else CONFIG["short_response_length"],
+            "max_sentences": budget["max_sentences"],
+            "num_predict": budget["num_predict"]
+        }
 
+    def _fallback_response(self, intent: str, level: int) -> str:
+        """Respuesta de plantilla para la intención, personalizada con el nombre si lo tenemos."""
         fallback_response = get_response_template(intent, nivel=level)
 
         if self.user_info["nombre"]:
@@ -2213,42 +3609,382 @@ class EvaAssistant:
             fallback_response = f"{warm_expression} {self.user_info['nombre']}, {fallback_response}"
 
         if not fallback_response:
-            response = "Lo siento, no pude generar una respuesta adecuada. ¿Podrías reformular tu pregunta?"
-        else:
-            response = fallback_response
+            return "Lo siento, no pude generar una respuesta adecuada. ¿Podrías reformular tu pregunta?"
+        return fallback_response
 
-        if intent in ["pricing", "meeting", "contact"] and "contacto@antaresinnovate.com" not in response:
-            if len(response) + 30 <= CONFIG["short_response_length"]:
-                response += "\n\nContacto: contacto@antaresinnovate.com"
-        else:
-            max_length = CONFIG["max_response_length"] if is_technical else CONFIG["short_response_length"]
-            response = self._optimize_response(llama_response, max_length, is_technical)
+    def _uses_template(self, intent: str, fallback_response: str) -> bool:
+        """Indica si la intención se responde con la plantilla en lugar de la respuesta de Llama3."""
+        return intent in ["pricing", "meeting", "contact"] and CONFIG["company_email"] not in fallback_response
+
+    def _template_fast_path(self, message: str, intent: str, level: int) -> bool:
+        """Indica si las reglas de CONFIG["template_fast_path"] permiten responder sin Llama3."""
+        rule = CONFIG["template_fast_path"].get(intent)
+        if rule is None:
+            return False
+        max_words = rule.get("max_words")
+        if max_words is not None and len(message.split()) > max_words:
+            return False
+        max_level = rule.get("max_level")
+        if max_level is not None and level > max_level:
+            return False
+        return True
+
+    def _template_response(self, message: str, intent: str, level: int,
+                           fallback_response: str) -> Optional[str]:
+        """
+        Respuesta de plantilla si el turno no necesita a Llama3, o None si hay que generar.
+        Cubre el atajo configurable y las intenciones que siempre usan su plantilla.
+        """
+        if not (self._template_fast_path(message, intent, level) or
+                self._uses_template(intent, fallback_response)):
+            return None
+        if CONFIG["debug"]:
+            print(f"{Colors.BLUE}[Procesando] Respuesta de plantilla para '{intent}', sin llamar a Llama3{Colors.ENDC}")
+        self.engine.record_turn(intent, used_llm=False)
+        return self._add_contact_info(fallback_response, intent)
+
+    def _cached_response(self, message: str, intent: str, pillar: str, level: int,
+                         perfil_cliente: Optional[Dict] = None) -> Tuple[Dict, Optional[str]]:
+        """
+        Busca una respuesta ya generada: primero por mensaje exacto y después por
+        similitud semántica.
+
+        Los cachés son compartidos entre sesiones, así que solo se usan cuando la
+        respuesta depende únicamente del prompt completo (conversación de Ollama
+        sin contexto previo): mensaje, clasificación y datos de sesión, que van
+        en la clave. Los turnos que continúan el contexto de Ollama no se cachean.
+
+        Returns:
+            Tupla (claves para guardar la respuesta después, respuesta o None)
+        """
+        keys = {"exact": None, "vector": None, "pillar": pillar, "session_context": None, "context": ""}
+        if self.ollama_conversation.active:
+            return keys, None
 
-        if intent in ["pricing", "meeting", "contact"] and "contacto@antaresinnovate.com" not in response:
+        keys["session_context"] = self._session_context(perfil_cliente)
+        keys["context"] = format_session_context(keys["session_context"])
+        keys["exact"] = ResponseCache.make_key(message, intent, pillar, level, keys["context"])
+        cached = self.engine.response_cache.get(keys["exact"])
+        source = "caché"
+
+        if cached is None:
+            keys["vector"] = self.engine.semantic_cache.embed(message)
+            cached = self.engine.semantic_cache.get(keys["vector"], intent, pillar, level, keys["context"])
+            source = "caché semántico"
+
+        if cached is not None:
+            if CONFIG["debug"]:
+                print(f"{Colors.BLUE}[Procesando] Respuesta desde {source} para '{intent}'{Colors.ENDC}")
+            self.engine.record_turn(intent, used_llm=False)
+        return keys, cached
+
+    def _store_response(self, keys: Dict, intent: str, level: int, response: str,
+                        perfil_cliente: Optional[Dict] = None):
+        """Guarda la respuesta en los cachés salvo que mencione datos de este cliente."""
+        perfil = perfil_cliente or {}
+        personal = [self.user_info["nombre"], self.user_info["empresa"], perfil.get("nombre")]
+        response_lower = response.lower()
+        if any(value and value.lower() in response_lower for value in personal):
+            return
+        self.engine.response_cache.put(keys["exact"], response)
+        self.engine.semantic_cache.put(keys["vector"], intent, keys["pillar"], level, response, keys["context"])
+
+    def _add_contact_info(self, response: str, intent: str) -> str:
+        """Añade el correo de contacto a las intenciones comerciales si cabe en la respuesta."""
+        if intent in ["pricing", "meeting", "contact"] and CONFIG["company_email"] not in response:
             if len(response) + 30 <= CONFIG["short_response_length"]:
-                response += "\n\nContacto: contacto@antaresinnovate.com"
+                response += f"\n\nContacto: {CONFIG['company_email']}"
+        return response
+
+    def _generate(self, prompt: str, budget: Dict, conversation: OllamaConversation,
+                  queue_timeout: Optional[float] = None, cancel: Optional[threading.Event] = None) -> str:
+        """Genera la respuesta del turno con Llama3 dentro del presupuesto."""
+        return self.ollama_client.generate_response(
+            prompt,
+            num_predict=budget["num_predict"],
+            max_chars=budget["max_length"],
+            max_sentences=budget["max_sentences"],
+            conversation=conversation,
+            queue_timeout=queue_timeout,
+            cancel=cancel
+        )
 
-        if not 'response' in locals():
-            response = "Lo siento, algo salió mal al procesar tu mensaje. ¿Podrías repetirlo?"
+    def _generate_within_deadline(self, message: str, intent: str, level: int, budget: Dict,
+                                  deadline: float, cache_keys: Dict,
+                                  perfil_cliente: Optional[Dict] = None) -> Optional[str]:
+        """
+        Genera en un hilo de fondo y espera como mucho `deadline` segundos.
 
-        self.conversation_history.append({
-        "id": self.message_counter,
-        "rol": "asistente", 
-        "contenido": response,
-        "timestamp": datetime.now().isoformat(),
-        "intencion": intent
-    })
+        La generación trabaja sobre una copia de la conversación de Ollama, que se
+        adopta solo si la respuesta llega a tiempo. La espera por un turno de
+        generación se limita a una parte del plazo, así la saturación se señala con
+        AdmissionRejected antes de que venza. Si el plazo vence, la generación
+        sigue en segundo plano (hasta CONFIG["max_late_generations"] a la vez; si
+        no hay lugar, se cancela) y su respuesta solo se guarda en los cachés para
+        el próximo visitante que pregunte lo mismo.
 
-        if CONFIG["debug"]:
-            print(f"{Colors.GREEN}[Procesando] Respuesta lista ({len(response)} caracteres){Colors.ENDC}")
+        Returns:
+            Respuesta de Llama3, o None si venció el plazo (se usa la plantilla)
+
+        Raises:
+            CircuitOpen, AdmissionRejected: Si ocurren antes del plazo
+        """
+        conversation = self.ollama_conversation.fork()
+        prompt = self._build_prompt(message, intent, level, perfil_cliente, conversation,
+                                    cache_keys["session_context"])
+        queue_timeout = min(CONFIG["ollama_queue_timeout"], deadline * CONFIG["deadline_queue_share"])
+        cancel = threading.Event()
+        future = self.engine.executor.submit(self._generate, prompt, budget, conversation, queue_timeout, cancel)
+
+        try:
+            with metrics.stage("ollama"):
+                response = future.result(timeout=deadline)
+        except FuturesTimeout:
+            self.engine.record_deadline("fired")
+            if not self.engine.start_late_generation():
+                # Sin lugar para otra generación en segundo plano: liberar Ollama
+                cancel.set()
+                future.cancel()
+                self.engine.record_deadline("late_cancelled")
+                if CONFIG["debug"]:
+                    print(f"[DEBUG] Plazo de {deadline}s vencido: respuesta con plantilla, generación cancelada")
+                return None
+            if CONFIG["debug"]:
+                print(f"[DEBUG] Plazo de {deadline}s vencido: respuesta con plantilla, generación en segundo plano")
+            future.add_done_callback(
+                lambda f: self._finish_late_generation(f, intent, level, budget, cache_keys, perfil_cliente)
+            )
+            return None
+
+        self.engine.record_deadline("met")
+        self.ollama_conversation.commit(conversation)
+        return response
+
+    def _finish_late_generation(self, future, intent: str, level: int, budget: Dict,
+                                cache_keys: Dict, perfil_cliente: Optional[Dict] = None):
+        """Guarda en los cachés una respuesta que llegó después del plazo."""
+        try:
+            try:
+                llama_response = future.result()
+            except Exception:
+                llama_response = ""
+            if not llama_response or len(llama_response) < 20:
+                self.engine.record_deadline("late_discarded")
+                return
+            response = self._optimize_response(llama_response, budget["max_length"], budget["is_technical"])
+            self._store_response(cache_keys, intent, level, response, perfil_cliente)
+            self.engine.record_deadline("late_cached")
+        finally:
+            self.engine.finish_late_generation()
+
+    def get_response(self, message: str, perfil_cliente: Optional[Dict] = None,
+                     deadline: Optional[float] = None,
+                     analysis: Optional[MessageAnalysis] = None) -> str:
+        """
+        Genera una respuesta al mensaje del usuario.
+
+        No introduce demoras ni imprime nada: los efectos de presentación
+        (pensamiento y escritura simulada) los aplica la CLI con respond.
+
+        Args:
+            message: Mensaje del usuario, sin instrucciones añadidas
+            perfil_cliente: Perfil del cliente que mantiene el servidor, si lo hay
+            deadline: Segundos de espera por Llama3 antes de responder con la
+                      plantilla (por defecto, CONFIG["response_deadline"]; 0 = sin plazo)
+            analysis: Resultado de analyze_message(message) si el llamador ya lo calculó
+        """
+        intent, pillar, level = self._start_turn(message, analysis)
+
+        # Manejar solicitudes de reunión si se detecta esa intención
+        if intent == "meeting":
+            with metrics.stage("reunion"):
+                meeting_response, meeting_processed = self._handle_meeting_request(message)
+
+            if meeting_processed or "reunión" in meeting_response.lower():
+                self._finish_turn(meeting_response, intent)
+                return meeting_response
+
+        # Intenciones deterministas: responder con la plantilla sin llamar a Ollama
+        fallback_response = self._fallback_response(intent, level)
+        template_response = self._template_response(message, intent, level, fallback_response)
+        if template_response is not None:
+            self._finish_turn(template_response, intent)
+            return template_response
+
+        # Mensajes repetidos o parafraseados: reutilizar una respuesta ya generada
+        with metrics.stage("cache"):
+            cache_keys, cached_response = self._cached_response(message, intent, pillar, level, perfil_cliente)
+        if cached_response is not None:
+            response = self._add_contact_info(cached_response, intent)
+            self._finish_turn(response, intent)
+            return response
+
+        # Definir el presupuesto antes del llamado a Ollama
+        budget = self._generation_budget(intent, level)
 
-        if self.typing_simulation:
-            simulate_typing(response)
+        if deadline is None:
+            deadline = CONFIG["response_deadline"]
+
+        # Generar respuesta con Llama3, cortando en cuanto se cubre el presupuesto
+        try:
+            if deadline:
+                llama_response = self._generate_within_deadline(
+                    message, intent, level, budget, deadline, cache_keys, perfil_cliente
+                )
+                # Con el plazo vencido el turno se respondió con la plantilla
+                self.engine.record_turn(intent, used_llm=llama_response is not None)
+                llama_response = llama_response or ""
+            else:
+                prompt = self._build_prompt(message, intent, level, perfil_cliente,
+                                            session_context=cache_keys["session_context"])
+                with metrics.stage("ollama"):
+                    llama_response = self._generate(prompt, budget, self.ollama_conversation)
+                self.engine.record_turn(intent, used_llm=True)
+        except CircuitOpen:
+            # Ollama caído: plantilla inmediata, sin esperar el timeout de conexión
+            self.engine.record_turn(intent, used_llm=False)
+            llama_response = ""
+        except AdmissionRejected:
+            # Ollama saturado: plantilla o rechazo (el servidor responde 503)
+            if CONFIG["admission_fallback"] != "template":
+                self._abort_turn()
+                raise
+            self.engine.record_turn(intent, used_llm=False)
+            llama_response = ""
+
+        if not llama_response or len(llama_response) < 20:
+            if CONFIG["debug"]:
+                print(f"{Colors.YELLOW}[Advertencia] Respuesta de Llama3 vacía o muy corta, usando fallback{Colors.ENDC}")
+            response = fallback_response
         else:
-            print(f"\n{Colors.GREEN}Eva:{Colors.ENDC} {response}")
+            with metrics.stage("optimizacion"):
+                response = self._optimize_response(llama_response, budget["max_length"], budget["is_technical"])
+            self._store_response(cache_keys, intent, level, response, perfil_cliente)
+
+        response = self._add_contact_info(response, intent)
 
+        self._finish_turn(response, intent)
         return response
 
+    def get_response_stream(self, message: str, perfil_cliente: Optional[Dict] = None,
+                            analysis: Optional[MessageAnalysis] = None) -> Iterator[str]:
+        """
+        Genera la respuesta al mensaje del usuario por partes.
+
+        Aplica la misma lógica que get_response, pero pide a Ollama `stream: true`
+        y entrega cada oración en cuanto está completa y limpia. Cuando se alcanza
+        el límite de longitud se corta la generación en Ollama.
+
+        Args:
+            message: Mensaje del usuario, sin instrucciones añadidas
+            perfil_cliente: Perfil del cliente que mantiene el servidor, si lo hay
+            analysis: Resultado de analyze_message(message) si el llamador ya lo calculó
+
+        Yields:
+            Fragmentos de la respuesta; concatenados forman la respuesta completa
+        """
+        intent, pillar, level = self._start_turn(message, analysis)
+
+        # Las reuniones se resuelven sin Llama3: se entregan de una vez
+        if intent == "meeting":
+            with metrics.stage("reunion"):
+                meeting_response, meeting_processed = self._handle_meeting_request(message)
+
+            if meeting_processed or "reunión" in meeting_response.lower():
+                self._finish_turn(meeting_response, intent)
+                yield meeting_response
+                return
+
+        # Intenciones deterministas: responder con la plantilla sin llamar a Ollama
+        fallback_response = self._fallback_response(intent, level)
+        template_response = self._template_response(message, intent, level, fallback_response)
+        if template_response is not None:
+            self._finish_turn(template_response, intent)
+            yield template_response
+            return
+
+        with metrics.stage("cache"):
+            cache_keys, cached_response = self._cached_response(message, intent, pillar, level, perfil_cliente)
+        if cached_response is not None:
+            response = self._add_contact_info(cached_response, intent)
+            self._finish_turn(response, intent)
+            yield response
+            return
+
+        budget = self._generation_budget(intent, level)
+
+        response_filter = StreamingResponseFilter(budget["max_length"], budget["max_sentences"])
+        prompt = self._build_prompt(message, intent, level, perfil_cliente,
+                                    session_context=cache_keys["session_context"])
+
+        parts = []      # Respuesta de Llama3
+        sent = []       # Fragmentos ya entregados al cliente
+        recorded = False
+        tokens = self.ollama_client.generate_response_stream(
+            prompt,
+            num_predict=budget["num_predict"],
+            conversation=self.ollama_conversation
+        )
+        try:
+            try:
+                # Incluye el tiempo de entrega de cada fragmento al cliente
+                with metrics.stage("ollama"):
+                    for token in tokens:
+                        text = response_filter.feed(token)
+                        if text:
+                            parts.append(text)
+                            sent.append(text)
+                            yield text
+                        if response_filter.done:
+                            break
+            except CircuitOpen:
+                # Ollama caído: sin fragmentos, se responde con la plantilla más abajo
+                pass
+            except AdmissionRejected:
+                # Ollama saturado: sin fragmentos, se responde con la plantilla más abajo
+                if CONFIG["admission_fallback"] != "template":
+                    self._abort_turn()
+                    raise
+            finally:
+                # Cerrar el generador corta la conexión y detiene la generación en Ollama
+                tokens.close()
+
+            text = response_filter.finish()
+            if text:
+                parts.append(text)
+            # Sin texto de Llama3 (caído, saturado o stream vacío) el turno se responde con la plantilla
+            self.engine.record_turn(intent, used_llm=bool(parts))
+            recorded = True
+            if text:
+                sent.append(text)
+                yield text
+
+            response = "".join(parts)
+            if not response:
+                if CONFIG["debug"]:
+                    print(f"{Colors.YELLOW}[Advertencia] Stream de Llama3 vacío, usando fallback{Colors.ENDC}")
+                response = fallback_response
+                sent.append(response)
+                yield response
+            else:
+                # En caché se guarda la misma forma optimizada que en get_response
+                optimized = self._optimize_response(response, budget["max_length"], budget["is_technical"])
+                self._store_response(cache_keys, intent, level, optimized, perfil_cliente)
+
+            completed = self._add_contact_info(response, intent)
+            if completed != response:
+                sent.append(completed[len(response):])
+                yield completed[len(response):]
+        except GeneratorExit:
+            # El cliente se desconectó a mitad de la respuesta: el historial
+            # conserva lo que llegó a recibir (cada fragmento se anota antes de entregarlo)
+            if not recorded:
+                self.engine.record_turn(intent, used_llm=True)
+            self._finish_turn("".join(sent), intent)
+            raise
+
+        self._finish_turn(completed, intent)
+
 
     def save_conversation(self, filename: str = "conversacion_eva.json"):
         """Guarda la conversación actual en un archivo JSON."""
@@ -2276,7 +4012,9 @@ class EvaAssistant:
                 
             self.user_info = data.get("user_info", self.user_info)
             self.conversation_history = data.get("messages", [])
+            self.conversation_summary.rebuild(self.conversation_history)
             self.message_counter = len(self.conversation_history)
+            self.ollama_conversation.reset()
             
             if self.conversation_history and self.user_info["nombre"]:
                 self.user_info["is_returning_user"] = True
@@ -2309,6 +4047,7 @@ class EvaAssistant:
                     "rol": message.get("rol"),
                     "contenido": message.get("contenido"),
                     "intencion": message.get("intencion", ""),
+                    "clasificador": message.get("clasificador"),
                     "timestamp": message.get("timestamp")
                 })
             
@@ -2330,10 +4069,26 @@ class EvaAssistant:
             return False
     
     def close_database(self):
-        """Cierra la conexión a la base de datos."""
+        """Cierra la conexión a la base de datos (compartida por el motor del proceso)."""
         if self.db_manager:
             self.db_manager.close()
 
+def respond(eva: EvaAssistant, message: str) -> str:
+    """
+    Obtiene la respuesta de Eva y la muestra en la terminal con los efectos de
+    presentación. La respuesta se genera en otro hilo mientras se simula el
+    pensamiento, así la simulación no se suma al tiempo de generación.
+    """
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="eva-cli") as executor:
+        pending = executor.submit(eva.get_response, message)
+        simulate_thinking(len(message), pending)
+        response = pending.result()
+    if eva.typing_simulation:
+        simulate_typing(response)
+    else:
+        print(f"\n{Colors.GREEN}Eva:{Colors.ENDC} {response}")
+    return response
+
 async def interactive_chat(load_file: Optional[str] = None, save_file: Optional[str] = None):
     """Inicia una sesión interactiva con el asistente."""
     print("\n" + "=" * 70)
@@ -2367,7 +4122,7 @@ async def interactive_chat(load_file: Optional[str] = None, save_file: Optional[
             )
 
         print(f"\n{Colors.GREEN}Eva:{Colors.ENDC} {mensaje_inicial}")
-        eva.conversation_history.append({
+        eva._append_message({
             "id": 0,
             "rol": "asistente", 
             "contenido": mensaje_inicial,
@@ -2382,7 +4137,8 @@ async def interactive_chat(load_file: Optional[str] = None, save_file: Optional[
             
             # Procesar comandos especiales
             if user_input.lower() in ["/exit", "/salir", "exit", "salir", "quit"]:
-                farewell = eva.get_response("Me despido. Gracias.")
+                farewell_message = "Me despido. Gracias."
+                respond(eva, farewell_message)
                 print(f"\n{Colors.BOLD}Finalizando conversación...{Colors.ENDC}")
                 break
             
@@ -2437,7 +4193,7 @@ async def interactive_chat(load_file: Optional[str] = None, save_file: Optional[
                 continue
             
             # Obtener respuesta a la entrada del usuario
-            response = eva.get_response(user_input)
+            respond(eva, user_input)
             
     except KeyboardInterrupt:
         print(f"\n\n{Colors.YELLOW}[Conversación interrumpida por el usuario]{Colors.ENDC}")
@@ -2488,7 +4244,7 @@ async def main():
         full_message = " ".join(args.message)
         eva = EvaAssistant()
         print(f"\n{Colors.BLUE}Tú:{Colors.ENDC} {full_message}")
-        eva.get_response(full_message)
+        respond(eva, full_message)
         
         # Guardar en base de datos si hay mensaje
         try:
@@ -0,0 +1,260 @@
+"""
+intent_classifier.py - Clasificador de intenciones aprendido (TF-IDF + modelo lineal)
+
+Alternativa opcional a la clasificación por palabras clave de EVA. Cada
+mensaje se convierte en un vector TF-IDF de palabras, pares de palabras y
+trigramas de caracteres, y un modelo lineal (regresión logística multiclase)
+da la probabilidad de cada intención con un producto de matrices de NumPy.
+
+1. build_training_set() reúne los ejemplos: las frases de INTENT_PATTERNS,
+   los mensajes de usuario de SIMULACIONES (etiquetados con las reglas) y los
+   mensajes registrados en mensajes.intencion
+2. IntentClassifier.train() ajusta el modelo; save()/load() lo guardan en un
+   archivo .npz comprimido (sin pickle) que se carga al iniciar
+3. predict() clasifica un mensaje; predict_batch() clasifica muchos por
+   llamada (análisis offline y reproducción de conversaciones)
+
+Sin NumPy el clasificador no está disponible y EVA usa las reglas.
+
+Autor: Antares Innovate
+"""
+
+import math
+
+from response_cache import normalize_message
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+ARTIFACT_VERSION = 1
+
+
+def extract_features(text):
+    """
+    Rasgos de un mensaje: palabras, pares de palabras consecutivas y trigramas
+    de caracteres de cada palabra (reconocen variantes como "automatizar" y
+    "automatización").
+    """
+    words = normalize_message(text).split()
+    features = list(words)
+    features += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        if len(word) > 3:
+            padded = f"<{word}>"
+            features += ["#" + padded[i:i + 3] for i in range(len(padded) - 2)]
+    return features
+
+
+def build_training_set(intent_patterns, simulaciones=None, labeled_messages=(), labeler=None):
+    """
+    Reúne los ejemplos de entrenamiento.
+
+    Args:
+        intent_patterns: Diccionario intención -> frases (cada frase es un ejemplo)
+        simulaciones: Diccionario de conversaciones de ejemplo (SIMULACIONES); sus
+                      mensajes de usuario ("usuario", "usuario2", ...) se etiquetan con `labeler`
+        labeled_messages: Pares (mensaje, intención) ya etiquetados, por ejemplo de mensajes.intencion
+        labeler: Función mensaje -> intención para los ejemplos sin etiqueta
+
+    Returns:
+        Tupla (textos, etiquetas)
+    """
+    texts, labels = [], []
+    for intent, phrases in intent_patterns.items():
+        for phrase in phrases:
+            texts.append(phrase)
+            labels.append(intent)
+
+    if simulaciones and labeler:
+        for conversation in simulaciones.values():
+            for key, message in conversation.items():
+                if key.startswith("usuario") and message:
+                    texts.append(message)
+                    labels.append(labeler(message))
+
+    for message, intent in labeled_messages:
+        if message and intent:
+            texts.append(message)
+            labels.append(intent)
+
+    return texts, labels
+
+
+class IntentClassifier:
+    """TF-IDF + regresión logística multiclase sobre NumPy."""
+
+    def __init__(self, vocabulary, idf, weights, bias, labels):
+        """
+        Args:
+            vocabulary: Lista de rasgos (la posición es la columna de la matriz)
+            idf: Vector IDF por rasgo
+            weights: Matriz rasgos x intenciones
+            bias: Vector de sesgo por intención
+            labels: Intenciones, en el orden de las columnas de `weights`
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("NumPy no está disponible")
+        self.vocabulary = list(vocabulary)
+        self.index = {feature: i for i, feature in enumerate(self.vocabulary)}
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.labels = list(labels)
+
+    @classmethod
+    def train(cls, texts, labels, epochs=300, learning_rate=2.0, l2=1e-4):
+        """
+        Entrena el modelo con descenso por gradiente sobre todo el conjunto.
+
+        Args:
+            texts: Mensajes de ejemplo
+            labels: Intención de cada mensaje
+            epochs: Iteraciones del descenso por gradiente
+            learning_rate: Tamaño del paso
+            l2: Regularización de los pesos
+
+        Returns:
+            IntentClassifier entrenado
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("NumPy no está disponible")
+
+        # Vocabulario e IDF suavizado (los rasgos de un mismo mensaje cuentan una vez)
+        document_frequency = {}
+        for text in texts:
+            for feature in set(extract_features(text)):
+                document_frequency[feature] = document_frequency.get(feature, 0) + 1
+        vocabulary = sorted(document_frequency)
+        idf = [math.log((1 + len(texts)) / (1 + document_frequency[feature])) + 1 for feature in vocabulary]
+
+        label_names = sorted(set(labels))
+        model = cls(vocabulary, idf, np.zeros((len(vocabulary), len(label_names))),
+                    np.zeros(len(label_names)), label_names)
+
+        features = model.transform(texts).astype(np.float64)
+        targets = np.zeros((len(texts), len(label_names)))
+        label_index = {label: i for i, label in enumerate(label_names)}
+        targets[np.arange(len(texts)), [label_index[label] for label in labels]] = 1.0
+
+        weights = np.zeros((len(vocabulary), len(label_names)))
+        bias = np.zeros(len(label_names))
+        for _ in range(epochs):
+            probabilities = _softmax(features @ weights + bias)
+            error = (probabilities - targets) / len(texts)
+            weights -= learning_rate * (features.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+
+        model.weights = weights.astype(np.float32)
+        model.bias = bias.astype(np.float32)
+        return model
+
+    def transform(self, texts):
+        """Matriz TF-IDF (mensajes x rasgos) con filas de norma 1."""
+        rows, columns, values = [], [], []
+        for row, text in enumerate(texts):
+            counts = {}
+            for feature in extract_features(text):
+                column = self.index.get(feature)
+                if column is not None:
+                    counts[column] = counts.get(column, 0) + 1
+            for column, count in counts.items():
+                rows.append(row)
+                columns.append(column)
+                values.append(count)
+
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        if rows:
+            columns = np.asarray(columns)
+            matrix[np.asarray(rows), columns] = np.asarray(values, dtype=np.float32) * self.idf[columns]
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.maximum(norms, 1e-12)
+        return matrix
+
+    def predict_proba(self, texts, batch_size=512):
+        """
+        Probabilidad de cada intención para cada mensaje.
+
+        Args:
+            texts: Mensajes
+            batch_size: Mensajes por producto de matrices (limita la memoria)
+
+        Returns:
+            Matriz mensajes x intenciones (columnas en el orden de self.labels)
+        """
+        texts = list(texts)
+        result = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            features = self.transform(texts[start:start + batch_size])
+            result[start:start + batch_size] = _softmax(features @ self.weights + self.bias)
+        return result
+
+    def predict_batch(self, texts, batch_size=512, secondary=(), min_probability=0.0):
+        """
+        Intención y probabilidad para cada mensaje.
+
+        Args:
+            texts: Mensajes
+            batch_size: Mensajes por producto de matrices
+            secondary: Intenciones que solo se eligen si ninguna otra alcanza
+                       `min_probability` (igual que el enrutamiento de EVA)
+            min_probability: Probabilidad mínima para preferir una intención no secundaria
+
+        Returns:
+            Lista de (intención, probabilidad), una por mensaje
+        """
+        # Redondeadas como en predict(), para que ambos elijan lo mismo en el umbral
+        probabilities = np.round(self.predict_proba(texts, batch_size), 3)
+        best = probabilities.argmax(axis=1)
+        secondary_columns = [i for i, label in enumerate(self.labels) if label in secondary]
+        if secondary_columns:
+            primary = probabilities.copy()
+            primary[:, secondary_columns] = -1.0
+            best_primary = primary.argmax(axis=1)
+            rows = np.arange(len(best))
+            best = np.where(primary[rows, best_primary] >= min_probability, best_primary, best)
+        return [(self.labels[column], float(probabilities[row, column])) for row, column in enumerate(best)]
+
+    def predict(self, text, min_probability=0.05):
+        """
+        Clasifica un mensaje.
+
+        Returns:
+            Tupla de (intención, probabilidad) de mayor a menor, solo las que
+            superan `min_probability`
+        """
+        probabilities = self.predict_proba([text])[0]
+        ranked = sorted(zip(self.labels, probabilities.tolist()), key=lambda item: item[1], reverse=True)
+        return tuple((label, round(probability, 3)) for label, probability in ranked if probability >= min_probability)
+
+    def save(self, path):
+        """Guarda el modelo en un archivo .npz comprimido."""
+        np.savez_compressed(
+            path,
+            version=np.array(ARTIFACT_VERSION),
+            vocabulary=np.array(self.vocabulary, dtype=str),
+            idf=self.idf,
+            weights=self.weights,
+            bias=self.bias,
+            labels=np.array(self.labels, dtype=str)
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Carga un modelo guardado con save()."""
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("NumPy no está disponible")
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != ARTIFACT_VERSION:
+                raise ValueError(f"Versión de modelo no soportada: {int(data['version'])}")
+            return cls(data["vocabulary"].tolist(), data["idf"], data["weights"],
+                       data["bias"], data["labels"].tolist())
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exponentials = np.exp(logits)
+    return exponentials / exponentials.sum(axis=1, keepdims=True)
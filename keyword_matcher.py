@@ -0,0 +1,129 @@
+"""
+keyword_matcher.py - Búsqueda de muchas palabras clave en una sola pasada
+
+La clasificación de EVA revisa cientos de frases en español (intenciones,
+pilares, niveles, sectores, servicios, sentimiento) con `frase in mensaje`,
+una por una, y cada función vuelve a recorrer el mensaje. Este módulo
+compila todas las frases una sola vez en un autómata de Aho-Corasick y
+devuelve, en una pasada sobre el texto, cuántas frases de cada categoría
+aparecen.
+
+La semántica es la misma que `frase in texto`: coincidencia exacta de
+subcadena (incluidas las solapadas), sin normalizar mayúsculas ni acentos.
+Quien llama decide cómo preparar el texto (por ejemplo, `texto.lower()`).
+
+Los resultados se guardan en un caché LRU por texto: el análisis de la
+conversación vuelve a revisar los mismos mensajes del historial en cada turno.
+
+Autor: Antares Innovate
+"""
+
+import functools
+from collections import deque
+from types import MappingProxyType
+
+
+class KeywordMatcher:
+    """Autómata de Aho-Corasick sobre vocabularios agrupados por categoría."""
+
+    def __init__(self, vocabularies, cache_size=2048):
+        """
+        Compila los vocabularios.
+
+        Args:
+            vocabularies: Diccionario categoría -> lista de frases. La categoría
+                puede ser cualquier valor hashable (por ejemplo, ("intent", "greeting")).
+                Una frase repetida cuenta tantas veces como aparezca en la lista,
+                igual que `sum(1 for frase in lista if frase in texto)`.
+            cache_size: Textos cuyos resultados se recuerdan (0 = sin caché)
+        """
+        self.categories = list(vocabularies)
+        self._patterns = []            # id de frase -> frase
+        self._pattern_categories = []  # id de frase -> categorías (con repetición)
+        pattern_ids = {}
+
+        for category, phrases in vocabularies.items():
+            for phrase in phrases:
+                if not phrase:
+                    continue
+                pattern_id = pattern_ids.get(phrase)
+                if pattern_id is None:
+                    pattern_id = pattern_ids[phrase] = len(self._patterns)
+                    self._patterns.append(phrase)
+                    self._pattern_categories.append([])
+                self._pattern_categories[pattern_id].append(category)
+
+        self._build()
+        if cache_size:
+            self.scan = functools.lru_cache(maxsize=cache_size)(self.scan)
+
+    def _build(self):
+        # Trie de las frases
+        goto = [{}]
+        outputs = [[]]
+        for pattern_id, pattern in enumerate(self._patterns):
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(pattern_id)
+
+        # Enlaces de fallo por niveles (BFS); cada estado hereda las salidas de su fallo
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in goto[state].items():
+                queue.append(child)
+                if state:
+                    fallback = fail[state]
+                    while fallback and char not in goto[fallback]:
+                        fallback = fail[fallback]
+                    fail[child] = goto[fallback].get(char, 0)
+                outputs[child].extend(outputs[fail[child]])
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [tuple(output) for output in outputs]
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def find(self, text):
+        """Devuelve el conjunto de frases que aparecen en el texto."""
+        return {self._patterns[pattern_id] for pattern_id in self._find_ids(text)}
+
+    def _find_ids(self, text):
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        found = set()
+        state = 0
+        for char in text:
+            transitions = goto[state]
+            while char not in transitions and state:
+                state = fail[state]
+                transitions = goto[state]
+            state = transitions.get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+    def scan(self, text):
+        """
+        Recorre el texto una vez.
+
+        Returns:
+            Diccionario de solo lectura categoría -> cantidad de frases distintas
+            de la categoría que aparecen en el texto (solo categorías con al menos una)
+        """
+        counts = {}
+        for pattern_id in self._find_ids(text):
+            for category in self._pattern_categories[pattern_id]:
+                counts[category] = counts.get(category, 0) + 1
+        return MappingProxyType(counts)
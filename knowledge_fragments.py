@@ -10,6 +10,8 @@ Este módulo:
 Autor: Antares Innovate
 """
 
+import os
+
 # =============================================================================
 # CONFIGURACIÓN GLOBAL - Reemplaza a CONFIG en eva_llama_14.py
 # =============================================================================
@@ -33,11 +35,126 @@ THINKING_MESSAGES = [
 DEBUG = True
 OLLAMA_MODEL = "llama3"
 OLLAMA_API_URL = "https://evaollama.loca.lt/api/generate"
+# Servidores de Ollama disponibles; las solicitudes se reparten entre los sanos.
+# Se pueden definir por entorno (OLLAMA_API_URLS, separadas por comas) y cambiar en
+# caliente escribiendo el archivo OLLAMA_URLS_FILE (una URL por línea), que cada
+# proceso revisa en su chequeo de salud.
+OLLAMA_API_URLS = [u.strip() for u in os.environ.get("OLLAMA_API_URLS", "").split(",") if u.strip()] or [OLLAMA_API_URL]
+OLLAMA_URLS_FILE = os.environ.get("OLLAMA_URLS_FILE", "ollama_urls.txt")
+OLLAMA_HEALTH_INTERVAL = 15  # Segundos entre chequeos de salud
+# Tokens máximos del contexto reutilizado entre turnos (debe quedar por debajo del
+# num_ctx del modelo); al superarlo se vuelve a enviar el prompt completo
+OLLAMA_CONTEXT_MAX_TOKENS = 3000
+
+# Transporte HTTP hacia Ollama (segundos)
+OLLAMA_CONNECT_TIMEOUT = 5
+OLLAMA_READ_TIMEOUT = 90
+OLLAMA_MAX_RETRIES = 2
+OLLAMA_BACKOFF_BASE = 0.5
+OLLAMA_BACKOFF_MAX = 4
+OLLAMA_POOL_SIZE = 10
+
+# Control de admisión por proceso: generaciones simultáneas contra Ollama, cola de
+# espera y plazo máximo en cola antes de responder con plantilla (o 503)
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", 2))
+OLLAMA_MAX_QUEUE = int(os.environ.get("OLLAMA_MAX_QUEUE", 32))
+OLLAMA_QUEUE_TIMEOUT = float(os.environ.get("OLLAMA_QUEUE_TIMEOUT", 15))  # Segundos
+OLLAMA_RETRY_AFTER = 5  # Segundos sugeridos al cliente en el 503
+ADMISSION_FALLBACK = os.environ.get("EVA_ADMISSION_FALLBACK", "template")  # "template" o "503"
+
+# Límite adaptativo (AIMD): OLLAMA_MAX_CONCURRENCY es el valor inicial y el límite
+# se mueve entre el mínimo y el máximo según la latencia hasta el primer token
+OLLAMA_ADAPTIVE_CONCURRENCY = os.environ.get("OLLAMA_ADAPTIVE_CONCURRENCY", "1") != "0"
+OLLAMA_MIN_CONCURRENCY = 1
+OLLAMA_MAX_CONCURRENCY_LIMIT = int(os.environ.get("OLLAMA_MAX_CONCURRENCY_LIMIT", 8))
+OLLAMA_LATENCY_TARGET = float(os.environ.get("OLLAMA_LATENCY_TARGET", 5))  # Segundos
+OLLAMA_AIMD_DECREASE = 0.5
+
+# Cortacircuitos: fallos consecutivos de generación que lo abren, segundos abierto
+# antes de una generación de prueba, y pruebas simultáneas permitidas
+OLLAMA_CIRCUIT_FAILURES = int(os.environ.get("OLLAMA_CIRCUIT_FAILURES", 3))
+OLLAMA_CIRCUIT_RESET = float(os.environ.get("OLLAMA_CIRCUIT_RESET", 10))
+OLLAMA_CIRCUIT_PROBES = 1
+
+# Plazo de respuesta (segundos) de get_response: si Llama3 no responde a tiempo se
+# entrega la plantilla y la generación termina en segundo plano para llenar el
+# caché. 0 desactiva el plazo. Hilos de fondo para esas generaciones
+RESPONSE_DEADLINE = float(os.environ.get("EVA_RESPONSE_DEADLINE", 8))
+BACKGROUND_WORKERS = int(os.environ.get("EVA_BACKGROUND_WORKERS", 16))
+# Generaciones que pueden seguir tras vencer el plazo (cada una ocupa un turno de
+# Ollama; las que no caben se cancelan) y fracción del plazo que se puede esperar
+# en la cola de admisión antes de rechazar con AdmissionRejected
+MAX_LATE_GENERATIONS = int(os.environ.get("EVA_MAX_LATE_GENERATIONS", 2))
+DEADLINE_QUEUE_SHARE = 0.5
+
+# Tiempos por etapa de cada turno (histogramas en /health) y cabecera de
+# depuración Server-Timing en /chat
+STAGE_TIMING = os.environ.get("EVA_STAGE_TIMING", "1") != "0"
+TIMING_HEADER = os.environ.get("EVA_TIMING_HEADER", "0") == "1"
 
 # Límites de longitud para respuestas
 MAX_RESPONSE_LENGTH = 600  # Límite para respuestas técnicas
 SHORT_RESPONSE_LENGTH = 300  # Límite para respuestas simples
 
+# Presupuesto de generación por intención: tokens que Ollama puede generar
+# (options.num_predict) y oraciones máximas antes de cortar el stream. Las
+# respuestas técnicas usan "technical"; las intenciones sin entrada, "default".
+GENERATION_BUDGET = {
+    "greeting": {"num_predict": 60, "max_sentences": 3},
+    "farewell": {"num_predict": 40, "max_sentences": 2},
+    "identity": {"num_predict": 80, "max_sentences": 3},
+    "contact": {"num_predict": 80, "max_sentences": 3},
+    "meeting": {"num_predict": 80, "max_sentences": 3},
+    "pricing": {"num_predict": 100, "max_sentences": 3},
+    "default": {"num_predict": 150, "max_sentences": 4},
+    "technical": {"num_predict": 300, "max_sentences": 6},
+}
+
+# Intenciones que se responden directamente con su plantilla, sin llamar a Llama3.
+# max_words: solo para mensajes de hasta esa cantidad de palabras (None = cualquiera)
+# max_level: solo hasta ese nivel técnico, para preguntas básicas (None = cualquiera)
+# Un diccionario vacío desactiva el atajo.
+TEMPLATE_FAST_PATH = {
+    "greeting": {"max_words": 6, "max_level": None},
+    "farewell": {"max_words": 8, "max_level": None},
+    "contact": {"max_words": None, "max_level": None},
+    "identity": {"max_words": 12, "max_level": None},
+    "pricing": {"max_words": 12, "max_level": 2},
+}
+
+# Límites del almacén de sesiones del servidor (configurables por entorno)
+SESSION_MAX_COUNT = int(os.environ.get("EVA_SESSION_MAX_COUNT", 500))
+SESSION_IDLE_TTL = int(os.environ.get("EVA_SESSION_IDLE_TTL", 1800))  # Segundos sin actividad
+SESSION_MEMORY_BUDGET_MB = int(os.environ.get("EVA_SESSION_MEMORY_MB", 256))
+
+# Caché de respuestas generadas para mensajes repetidos
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("EVA_RESPONSE_CACHE_MAX", 1000))
+RESPONSE_CACHE_TTL = int(os.environ.get("EVA_RESPONSE_CACHE_TTL", 3600))  # Segundos
+
+# Caché semántico: reutiliza respuestas de paráfrasis de la misma intención.
+# Embeddings con "ollama" (endpoint /api/embeddings; si Ollama no tiene
+# OLLAMA_EMBED_MODEL se pasa a "local" hasta reiniciar), "local" (hashing
+# determinista, sin red) o "off". Requiere NumPy.
+SEMANTIC_CACHE_EMBEDDER = os.environ.get("EVA_SEMANTIC_CACHE", "ollama")
+OLLAMA_EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+SEMANTIC_CACHE_MAX_ENTRIES = 500
+SEMANTIC_CACHE_MAX_WORDS = 20  # Mensajes más largos no se consultan
+# Similitud coseno mínima por intención; las de precios y servicios toleran más
+# variación porque la respuesta no depende de los detalles de la pregunta
+SEMANTIC_CACHE_THRESHOLDS = {
+    "pricing": 0.88,
+    "services": 0.88,
+    "identity": 0.88,
+    "default": 0.93,
+}
+
+# Clasificador de intenciones: "rules" (palabras clave puntuadas) o "model"
+# (TF-IDF + modelo lineal entrenado con entrenar_clasificador.py, requiere
+# NumPy). Si el modelo no puede cargarse se usan las reglas.
+INTENT_CLASSIFIER = os.environ.get("EVA_INTENT_CLASSIFIER", "rules")
+INTENT_MODEL_PATH = os.environ.get("EVA_INTENT_MODEL_PATH", "intent_model.npz")
+INTENT_MODEL_MIN_CONFIDENCE = 0.2  # Probabilidad mínima (entre 15 intenciones); por debajo es "default"
+
 # Configuración del calendario y reuniones
 GOOGLE_CREDENTIALS_FILE = "credentials.json"
 GOOGLE_TOKEN_FILE = "token.json"
@@ -565,30 +682,12 @@ def get_lienzo_tecnico(area, servicio=None):
         
     return result
 
-def get_filtered_prompt(message, intent, nivel=1, user_name=None, time_of_day=None, max_chars=7000):
-    """
-    Construye un prompt optimizado para Llama3 evitando superar el límite de tokens.
-    
-    Args:
-        message: mensaje del usuario
-        intent: intención detectada 
-        nivel: nivel de profundidad técnica (1-5)
-        user_name: nombre del usuario si está disponible
-        time_of_day: momento del día (morning, afternoon, evening, night)
-        max_chars: límite máximo de caracteres
-        
-    Returns:
-        prompt optimizado para Llama3
-    """
-    # Obtener fragmentos relevantes para la intención
-    knowledge = get_fragment_by_intent(intent, nivel)
-    
-    # Personalizar saludo si tenemos el nombre del usuario
-    name_greeting = f", {user_name}" if user_name else ""
-    
-    # Base del prompt con sistema y rol - VERSION FINAL ULTRA RESTRICTIVA
-    system_prompt = f"""<|system|>
-TU ERES EVA, PERO NUNCA TE PRESENTAS MÁS DE UNA VEZ EN LA CONVERSACIÓN.
+# Prefijo estático del prompt: idéntico byte a byte en todas las solicitudes para
+# que Ollama pueda reutilizar su caché de prefijo. No debe contener nada que
+# dependa del usuario, la intención o la hora.
+STATIC_PROMPT_PREFIX = """<|system|>
+TU ERES EVA, EJECUTIVA DE VENTAS DE ANTARES INNOVATE, AGENCIA DE TRANSFORMACIÓN DIGITAL.
+NUNCA TE PRESENTAS MÁS DE UNA VEZ EN LA CONVERSACIÓN.
 
 ⚠️ REGLAS ESTRICTAS DE ABSOLUTO CUMPLIMIENTO ⚠️
 
@@ -601,16 +700,26 @@ TU ERES EVA, PERO NUNCA TE PRESENTAS MÁS DE UNA VEZ EN LA CONVERSACIÓN.
    - NUNCA TE PRESENTES DOS VECES
    - NO USAR "SOY EVA DE ANTARES INNOVATE"
    - NO MENCIONAR "EQUIPO DE ANTARES"
+   - NUNCA USES FRASES GENÉRICAS COMO "ESTOY AQUÍ PARA AYUDARTE"
 
 >> TERCERA REGLA: MANTÉN CONTEXTO
-   - USA LA INFORMACIÓN QUE YA DIO EL USUARIO
+   - USA LA INFORMACIÓN QUE YA DIO EL USUARIO (NOMBRE, SERVICIO, EMPRESA)
    - PREGUNTA SOBRE DETALLES ESPECÍFICOS
    - EVITA PREGUNTAS GENERALES REPETITIVAS
 
+>> CUARTA REGLA: AVANZA LA VENTA
+   - SI PREGUNTAN POR COTIZACIONES, MENCIONA EL PRECIO APROXIMADO
+   - SI EL CLIENTE MUESTRA INTERÉS, OFRECE AGENDAR UNA REUNIÓN
+
 SERVICIOS Y PRECIOS EXACTOS:
-• Tienda online para vender computadoras: $3,000 USD
-• Campañas en redes sociales: $2,000 USD
+• Sitios web profesionales: desde $3,000 USD
+• Tienda online para vender productos: desde $3,000 USD
+• Landing pages optimizadas para conversión: desde $1,800 USD
+• Branding e identidad visual: desde $2,500 USD
 • Mejora de experiencia de usuario: $2,500 USD
+• Campañas en redes sociales: $2,000 USD
+• Desarrollo de aplicaciones: desde $8,000 USD
+• Automatización de procesos: desde $5,000 USD
 
 EJEMPLOS PERFECTOS (IMITA EXACTAMENTE ESTE ESTILO):
 • "Creamos sitios de ecommerce desde $3,000 USD. ¿Tienes web actualmente?"
@@ -618,34 +727,144 @@ EJEMPLOS PERFECTOS (IMITA EXACTAMENTE ESTE ESTILO):
 • "Podemos empezar este mes. ¿Prefieres reunión jueves o viernes?"
 
 RECUERDA: CORTO, DIRECTO, SIN REPETICIONES.
+"""
+
+# Orden fijo de los datos de sesión, para que el mismo estado produzca el mismo texto
+SESSION_CONTEXT_FIELDS = [
+    ("nombre", "Nombre del cliente (dirígete a él/ella por su nombre)"),
+    ("empresa", "Empresa"),
+    ("sector", "Sector"),
+    ("servicio", "Servicio de interés"),
+    ("temas", "Temas ya mencionados"),
+    ("ya_saludo", "Ya saludaste en esta conversación (no vuelvas a saludar)"),
+]
+
+def format_session_context(session_context):
+    """
+    Convierte los datos dinámicos de la sesión en la sección final del prompt.
+
+    Args:
+        session_context: diccionario con los campos de SESSION_CONTEXT_FIELDS
+
+    Returns:
+        texto de la sección, o cadena vacía si no hay datos
+    """
+    if not session_context:
+        return ""
+    lines = []
+    for key, label in SESSION_CONTEXT_FIELDS:
+        value = session_context.get(key)
+        if not value:
+            continue
+        if value is True:
+            lines.append(f"- {label}")
+        elif isinstance(value, (list, tuple, set)):
+            lines.append(f"- {label}: {', '.join(sorted(value))}")
+        else:
+            lines.append(f"- {label}: {value}")
+    if not lines:
+        return ""
+    return "CONTEXTO DEL CLIENTE:\n" + "\n".join(lines) + "\n"
+
+def _user_block(message):
+    return f"<|user|>\n{message}\n<|/user|>\n\n<|assistant|>"
+
+def build_prompt(message, intent, nivel=1, session_context=None, max_chars=7000):
+    """
+    Única etapa de armado del prompt para Llama3.
+
+    El orden va de lo más estable a lo más variable para maximizar el prefijo
+    reutilizable entre solicitudes:
+    1. STATIC_PROMPT_PREFIX (persona, reglas y precios; idéntico siempre)
+    2. Conocimiento de la intención
+    3. Datos dinámicos de la sesión
+    4. Mensaje del usuario
+
+    Args:
+        message: mensaje del usuario
+        intent: intención detectada
+        nivel: nivel de profundidad técnica (1-5)
+        session_context: datos de la sesión (ver format_session_context)
+        max_chars: límite máximo de caracteres
+
+    Returns:
+        prompt completo para Llama3
+    """
+    knowledge = get_fragment_by_intent(intent, nivel)
+    session_section = format_session_context(session_context)
+
+    def assemble(knowledge_text):
+        return (f"{STATIC_PROMPT_PREFIX}\nCONOCIMIENTO DE REFERENCIA:\n{knowledge_text}\n"
+                f"{session_section}<|/system|>\n\n{_user_block(message)}")
+
+    prompt = assemble(knowledge)
+
+    # Verificar si excede el límite: solo se recorta el conocimiento
+    if len(prompt) > max_chars:
+        available_chars = max_chars - len(assemble(""))
 
-CONOCIMIENTO DE REFERENCIA:
-{knowledge}
-<|/system|>\n\n<|user|>\n{message}\n<|/user|>\n\n<|assistant|>"""
-    
-    # Verificar si excede el límite
-    if len(system_prompt) > max_chars:
-        # Reducir el conocimiento manteniendo las partes más relevantes
-        base_prompt = system_prompt.replace(knowledge, "")
-        available_chars = max_chars - len(base_prompt)
-        
-        # Priorizar fragmentos según relevancia
-        knowledge_chunks = knowledge.split("\n\n")
-        prioritized_knowledge = []
-        
         # Usar solo los fragmentos más relevantes que quepan
+        prioritized_knowledge = []
         current_length = 0
-        for chunk in knowledge_chunks:
+        for chunk in knowledge.split("\n\n"):
             if current_length + len(chunk) <= available_chars:
                 prioritized_knowledge.append(chunk)
                 current_length += len(chunk) + 2  # +2 por los saltos de línea
-        
-        # Reconstruir el prompt con los fragmentos que caben
-        reduced_knowledge = "\n\n".join(prioritized_knowledge)
-        system_prompt = system_prompt.replace(knowledge, reduced_knowledge)
-    
-    return system_prompt
 
+        prompt = assemble("\n\n".join(prioritized_knowledge))
+
+    return prompt
+
+def get_filtered_prompt(message, intent, nivel=1, user_name=None, time_of_day=None, max_chars=7000):
+    """
+    Construye un prompt optimizado para Llama3 evitando superar el límite de tokens.
+
+    Se mantiene por compatibilidad; el armado real lo hace build_prompt.
+
+    Args:
+        message: mensaje del usuario
+        intent: intención detectada
+        nivel: nivel de profundidad técnica (1-5)
+        user_name: nombre del usuario si está disponible
+        time_of_day: momento del día (no se usa: rompería el prefijo estable)
+        max_chars: límite máximo de caracteres
+
+    Returns:
+        prompt optimizado para Llama3
+    """
+    session_context = {"nombre": user_name} if user_name else None
+    return build_prompt(message, intent, nivel, session_context=session_context, max_chars=max_chars)
+
+def get_followup_prompt(message, intent, nivel=1, include_knowledge=False, session_context=None,
+                        previous_message=None):
+    """
+    Construye el prompt de un turno que continúa sobre el contexto de Ollama.
+
+    El prefijo estático ya está en el contexto desde el primer turno, así que
+    solo se envían el conocimiento de la intención (si es nueva en la
+    conversación), los datos de sesión que cambiaron y el mensaje.
+
+    Args:
+        message: mensaje del usuario
+        intent: intención detectada
+        nivel: nivel de profundidad técnica (1-5)
+        include_knowledge: si se agrega el conocimiento de la intención
+        session_context: datos de sesión a enviar, o None si no cambiaron
+        previous_message: mensaje de un turno anterior que no quedó en el
+                          contexto (su generación se cortó antes del final)
+
+    Returns:
+        prompt del turno para Llama3
+    """
+    system = ""
+    if previous_message:
+        system += f"MENSAJE ANTERIOR DEL USUARIO (ya respondido):\n{previous_message}\n"
+    if include_knowledge:
+        system += f"CONOCIMIENTO DE REFERENCIA:\n{get_fragment_by_intent(intent, nivel)}\n"
+    system += format_session_context(session_context)
+    if not system:
+        return _user_block(message)
+    return f"<|system|>\n{system}<|/system|>\n\n{_user_block(message)}"
 
 def get_response_template(intent, nivel=1, user_name=None, time_of_day=None):
     """
@@ -777,8 +996,52 @@ CONFIG = {
     "debug": DEBUG,
     "ollama_model": OLLAMA_MODEL,
     "ollama_api_url": OLLAMA_API_URL,
+    "ollama_api_urls": OLLAMA_API_URLS,
+    "ollama_urls_file": OLLAMA_URLS_FILE,
+    "ollama_health_interval": OLLAMA_HEALTH_INTERVAL,
+    "ollama_context_max_tokens": OLLAMA_CONTEXT_MAX_TOKENS,
+    "ollama_connect_timeout": OLLAMA_CONNECT_TIMEOUT,
+    "ollama_read_timeout": OLLAMA_READ_TIMEOUT,
+    "ollama_max_retries": OLLAMA_MAX_RETRIES,
+    "ollama_backoff_base": OLLAMA_BACKOFF_BASE,
+    "ollama_backoff_max": OLLAMA_BACKOFF_MAX,
+    "ollama_pool_size": OLLAMA_POOL_SIZE,
+    "ollama_max_concurrency": OLLAMA_MAX_CONCURRENCY,
+    "ollama_max_queue": OLLAMA_MAX_QUEUE,
+    "ollama_queue_timeout": OLLAMA_QUEUE_TIMEOUT,
+    "ollama_retry_after": OLLAMA_RETRY_AFTER,
+    "admission_fallback": ADMISSION_FALLBACK,
+    "ollama_adaptive_concurrency": OLLAMA_ADAPTIVE_CONCURRENCY,
+    "ollama_min_concurrency": OLLAMA_MIN_CONCURRENCY,
+    "ollama_max_concurrency_limit": OLLAMA_MAX_CONCURRENCY_LIMIT,
+    "ollama_latency_target": OLLAMA_LATENCY_TARGET,
+    "ollama_aimd_decrease": OLLAMA_AIMD_DECREASE,
+    "ollama_circuit_failures": OLLAMA_CIRCUIT_FAILURES,
+    "ollama_circuit_reset": OLLAMA_CIRCUIT_RESET,
+    "ollama_circuit_probes": OLLAMA_CIRCUIT_PROBES,
+    "response_deadline": RESPONSE_DEADLINE,
+    "background_workers": BACKGROUND_WORKERS,
+    "max_late_generations": MAX_LATE_GENERATIONS,
+    "deadline_queue_share": DEADLINE_QUEUE_SHARE,
+    "stage_timing": STAGE_TIMING,
+    "timing_header": TIMING_HEADER,
+    "generation_budget": GENERATION_BUDGET,
+    "template_fast_path": TEMPLATE_FAST_PATH,
     "max_response_length": MAX_RESPONSE_LENGTH,
     "short_response_length": SHORT_RESPONSE_LENGTH,
+    "response_cache_max_entries": RESPONSE_CACHE_MAX_ENTRIES,
+    "response_cache_ttl": RESPONSE_CACHE_TTL,
+    "semantic_cache_embedder": SEMANTIC_CACHE_EMBEDDER,
+    "ollama_embed_model": OLLAMA_EMBED_MODEL,
+    "semantic_cache_max_entries": SEMANTIC_CACHE_MAX_ENTRIES,
+    "semantic_cache_max_words": SEMANTIC_CACHE_MAX_WORDS,
+    "semantic_cache_thresholds": SEMANTIC_CACHE_THRESHOLDS,
+    "intent_classifier": INTENT_CLASSIFIER,
+    "intent_model_path": INTENT_MODEL_PATH,
+    "intent_model_min_confidence": INTENT_MODEL_MIN_CONFIDENCE,
+    "session_max_count": SESSION_MAX_COUNT,
+    "session_idle_ttl": SESSION_IDLE_TTL,
+    "session_memory_budget_mb": SESSION_MEMORY_BUDGET_MB,
     "warm_expressions": WARM_EXPRESSIONS,
     "knowledge_base_content": build_knowledge_base_content(),
     "google_credentials_file": GOOGLE_CREDENTIALS_FILE,
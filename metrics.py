@@ -0,0 +1,319 @@
+"""
+metrics.py - Tiempos por etapa de cada turno y métricas para Prometheus
+
+Un turno lento puede deberse a la clasificación, al análisis de la
+conversación, al armado del prompt, a Ollama, a la optimización de la
+respuesta o a las escrituras en Postgres. Este módulo mide cada etapa:
+
+1. start_turn() abre un cronómetro para el turno en el hilo actual
+2. stage("nombre") mide un bloque dentro del turno (sin turno abierto no hace nada)
+3. finish_turn() acumula las duraciones en histogramas por etapa y devuelve
+   el cronómetro, que puede formatearse como cabecera Server-Timing
+
+El cronómetro vive en un threading.local: cada solicitud de gunicorn se atiende
+en su propio hilo, así que las etapas de EvaAssistant se registran sin pasar
+el cronómetro por todas las llamadas.
+
+También incluye contadores con etiquetas y el formateo en el formato de texto
+de Prometheus para el endpoint /metrics, sin depender de prometheus_client.
+
+Autor: Antares Innovate
+"""
+
+import threading
+import time
+
+# Límites superiores de los buckets de los histogramas (segundos)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """Histograma de duraciones con buckets fijos."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets: Límites superiores de los buckets, en orden creciente
+        """
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # El último bucket es +Inf
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """Registra una duración."""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self):
+        """Devuelve (buckets acumulados [(límite, cantidad)], cantidad, suma)."""
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self.count, self.sum
+        cumulative = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return cumulative, count, total
+
+    def percentile(self, fraction):
+        """Estimación del percentil (límite superior del bucket que lo contiene)."""
+        cumulative, count, _ = self.snapshot()
+        if not count:
+            return None
+        target = fraction * count
+        for bound, running in cumulative:
+            if running >= target:
+                return bound if bound != float("inf") else self.max
+        return self.max
+
+    def stats(self):
+        """Resumen del histograma."""
+        with self._lock:
+            count, total, maximum = self.count, self.sum, self.max
+        return {
+            "count": count,
+            "avg": round(total / count, 4) if count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "max": round(maximum, 4)
+        }
+
+
+class Counter:
+    """Contador acumulativo con etiquetas (tupla de valores -> total)."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        """Suma `amount` al contador de las etiquetas."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def items(self):
+        """Pares (etiquetas, total)."""
+        with self._lock:
+            return list(self._values.items())
+
+
+class HistogramVec:
+    """Histogramas con etiquetas (tupla de valores -> Histogram)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Histograma de las etiquetas (se crea la primera vez)."""
+        histogram = self._histograms.get(values)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(values, Histogram(self.buckets))
+        return histogram
+
+    def items(self):
+        """Pares (etiquetas, Histogram)."""
+        with self._lock:
+            return list(self._histograms.items())
+
+
+class StageTimer:
+    """Cronómetro de las etapas de un turno."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []  # (etapa, segundos) en orden de finalización
+        self.total = None
+
+    def stage(self, name):
+        """Contexto que mide un bloque y lo registra con el nombre de la etapa."""
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        """Registra la duración de una etapa medida por fuera."""
+        self.stages.append((name, seconds))
+
+    def durations(self):
+        """Duraciones por etapa (las etapas repetidas se suman)."""
+        result = {}
+        for name, seconds in self.stages:
+            result[name] = result.get(name, 0.0) + seconds
+        return result
+
+    def server_timing(self):
+        """Valor de la cabecera Server-Timing (duraciones en milisegundos)."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.durations().items()]
+        if self.total is not None:
+            parts.append(f"total;dur={self.total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopStage:
+    """Etapa sin cronómetro: no mide nada."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_STAGE = _NoopStage()
+_local = threading.local()
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def start_turn():
+    """Abre el cronómetro del turno en el hilo actual y lo devuelve."""
+    timer = StageTimer()
+    _local.timer = timer
+    return timer
+
+
+def current_timer():
+    """Cronómetro del turno en curso en este hilo, o None."""
+    return getattr(_local, "timer", None)
+
+
+def stage(name):
+    """Mide un bloque del turno en curso; sin turno abierto no hace nada."""
+    timer = getattr(_local, "timer", None)
+    if timer is None:
+        return _NOOP_STAGE
+    return _Stage(timer, name)
+
+
+def finish_turn():
+    """
+    Cierra el cronómetro del hilo y acumula sus etapas en los histogramas.
+
+    Returns:
+        El cronómetro cerrado, o None si no había turno abierto
+    """
+    timer = getattr(_local, "timer", None)
+    if timer is None:
+        return None
+    _local.timer = None
+    timer.total = time.perf_counter() - timer.started
+
+    for name, seconds in list(timer.durations().items()) + [("total", timer.total)]:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            with _histograms_lock:
+                histogram = _histograms.setdefault(name, Histogram())
+        histogram.observe(seconds)
+    return timer
+
+
+def discard_turn():
+    """Descarta el turno en curso sin registrarlo (por ejemplo, si falló)."""
+    _local.timer = None
+
+
+def stage_histograms():
+    """Histogramas por etapa acumulados en el proceso."""
+    with _histograms_lock:
+        return dict(_histograms)
+
+
+def stage_stats():
+    """Resumen de los histogramas por etapa."""
+    return {name: histogram.stats() for name, histogram in sorted(stage_histograms().items())}
+
+
+# =============================================================================
+# FORMATO DE TEXTO DE PROMETHEUS
+# =============================================================================
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_metric(name, kind, help_text, samples, label_names=()):
+    """
+    Formatea un contador o indicador.
+
+    Args:
+        name: Nombre de la métrica
+        kind: "counter" o "gauge"
+        help_text: Descripción (línea HELP)
+        samples: Pares (valores de etiquetas, valor) o un número sin etiquetas
+        label_names: Nombres de las etiquetas
+    """
+    if not isinstance(samples, (list, tuple)):
+        samples = [((), samples)]
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for values, value in samples:
+        if value is None:
+            continue
+        lines.append(f"{name}{_labels(label_names, values)} {_number(value)}")
+    return "\n".join(lines)
+
+
+def format_histograms(name, help_text, histograms, label_names=()):
+    """
+    Formatea histogramas.
+
+    Args:
+        histograms: Pares (valores de etiquetas, Histogram) o un Histogram sin etiquetas
+    """
+    if isinstance(histograms, Histogram):
+        histograms = [((), histograms)]
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for values, histogram in histograms:
+        cumulative, count, total = histogram.snapshot()
+        for bound, running in cumulative:
+            le = 'le="' + _number(float(bound)) + '"'
+            lines.append(f"{name}_bucket{_labels(label_names, values, le)} {running}")
+        lines.append(f"{name}_sum{_labels(label_names, values)} {_number(total)}")
+        lines.append(f"{name}_count{_labels(label_names, values)} {count}")
+    return "\n".join(lines)
@@ -0,0 +1,104 @@
+"""
+probar_coalescencia.py - Verifica que los primeros turnos idénticos compartan una generación
+
+No necesita Ollama: levanta un servidor local que imita /api/generate con
+streaming lento y envía el mismo primer mensaje desde dos sesiones a la vez,
+con el plazo de respuesta activo (CONFIG["response_deadline"]). Termina con
+error si las dos sesiones no comparten una sola generación.
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eva_llama_14 import CONFIG, EvaAssistant, get_engine
+
+RESPUESTA = ("Creamos sitios web a la medida de cada negocio, con catálogo y pagos integrados. "
+             "Nuestro equipo acompaña el proyecto desde el diseño hasta la publicación.")
+DEMORA_TOKEN = 0.02
+MENSAJE = "necesito una web para mi negocio con catálogo"
+
+generaciones = 0
+
+class OllamaDePrueba(BaseHTTPRequestHandler):
+    """Imita /api/generate con `stream: true`, una palabra por fragmento."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        # El cliente corta la conexión al terminar el stream
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass
+
+    def do_GET(self):
+        body = json.dumps({"models": [{"name": CONFIG["ollama_model"]}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        global generaciones
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        generaciones += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        palabras = RESPUESTA.split(" ")
+        lineas = [{"response": palabra + " ", "done": False} for palabra in palabras]
+        lineas.append({"response": "", "done": True, "context": [1, 2, 3]})
+        try:
+            for linea in lineas:
+                time.sleep(DEMORA_TOKEN)
+                data = (json.dumps(linea) + "\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def main():
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), OllamaDePrueba)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    CONFIG.update(
+        ollama_api_urls=[f"http://127.0.0.1:{servidor.server_port}"],
+        ollama_urls_file="",
+        semantic_cache_embedder="off",
+        response_deadline=8,
+        debug=False
+    )
+    engine = get_engine()
+    asistentes = [EvaAssistant(), EvaAssistant()]
+    barrera = threading.Barrier(len(asistentes))
+    respuestas = [None] * len(asistentes)
+
+    def turno(i):
+        barrera.wait()
+        respuestas[i] = asistentes[i].get_response(MENSAJE)
+
+    hilos = [threading.Thread(target=turno, args=(i,)) for i in range(len(asistentes))]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    servidor.shutdown()
+
+    coalesced = engine.ollama_client.stats["coalesced"]
+    print(f"[INFO] Generaciones en Ollama: {generaciones}")
+    print(f"[INFO] Solicitudes compartidas: {coalesced}")
+    print(f"[INFO] Cumplimiento del plazo: {engine.get_stats()['deadline']}")
+    if coalesced != 1 or generaciones != 1 or respuestas[0] != respuestas[1]:
+        print("[❌] Los primeros turnos idénticos con plazo no comparten la generación")
+        sys.exit(1)
+    print("[✅] Primeros turnos idénticos con plazo coalescidos")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+probar_prompt.py - Mide el tamaño de los prompts y cuánto prefijo comparten
+
+No necesita Ollama: arma los prompts de varias conversaciones de ejemplo con el
+armado actual (knowledge_fragments.build_prompt) y con el armado anterior en
+tres etapas (copiado abajo como línea base) y reporta para ambos:
+1. Cuántos caracteres comparten los primeros prompts de sesiones distintas
+2. Cuántos caracteres comparten los prompts completos de turnos sucesivos de
+   una misma sesión
+3. Cuántos caracteres quedan después del prefijo compartido: es lo que Ollama
+   tiene que evaluar aunque reutilice su caché de prefijo
+4. El tamaño total enviado con prompt completo en cada turno y reutilizando
+   el contexto de Ollama
+
+Los prefijos se miden comparando los prompts entre sí, sin suponer cuál es el
+prefijo estático. Termina con error si el armado actual deja más caracteres
+por evaluar que la línea base.
+"""
+
+import sys
+from knowledge_fragments import STATIC_PROMPT_PREFIX, build_prompt, get_followup_prompt, get_fragment_by_intent
+
+# (mensaje, intención, nivel) por turno, y datos de sesión que se van conociendo
+CONVERSACIONES = {
+    "ana": [
+        ("Hola, me llamo Ana y tengo una tienda de ropa", "greeting", 1, {"nombre": "Ana", "sector": "retail"}),
+        ("¿Cuánto cuesta una tienda online?", "pricing", 2, {"nombre": "Ana", "sector": "retail", "servicio": "ecommerce"}),
+        ("¿Y una app móvil?", "technology", 3, {"nombre": "Ana", "sector": "retail", "servicio": "app", "ya_saludo": True}),
+    ],
+    "luis": [
+        ("Quiero mejorar mi marca, soy Luis", "creativity", 2, {"nombre": "Luis", "servicio": "branding"}),
+        ("¿Qué incluye el branding?", "creativity", 3, {"nombre": "Luis", "servicio": "branding", "ya_saludo": True}),
+        ("Me interesa automatizar procesos", "consulting", 3, {"nombre": "Luis", "servicio": "automatizacion", "ya_saludo": True}),
+    ],
+    "anonimo": [
+        ("Necesito una landing page", "technology", 1, {"servicio": "landing"}),
+        ("¿Hacen campañas en Instagram?", "marketing", 2, {"servicio": "marketing"}),
+        ("Gracias", "farewell", 1, {"servicio": "marketing", "ya_saludo": True}),
+    ],
+}
+
+# =============================================================================
+# ARMADO ANTERIOR (línea base) - Copia de las tres etapas que había antes de
+# build_prompt: el servidor agregaba [INSTRUCCIONES: ...] al mensaje,
+# get_filtered_prompt lo envolvía con su bloque de sistema y OllamaClient
+# anteponía su propio bloque <INSTRUCCIONES>. El conocimiento de cada intención
+# sale de la versión actual, así solo se compara el armado.
+# =============================================================================
+
+def crear_prompt_optimizado(mensaje, perfil):
+    """server.crear_prompt_optimizado: instrucciones del perfil al final del mensaje"""
+    instrucciones = []
+    if perfil.get('nombre'):
+        instrucciones.append(f"El cliente se llama {perfil['nombre']}. Dirígete a él/ella por su nombre.")
+    if perfil.get('servicio'):
+        instrucciones.append(f"Está interesado en nuestro servicio de {perfil['servicio']}.")
+    instrucciones.append("Identifícate como Eva de Antares Innovate.")
+    instrucciones.append("Mantén un tono profesional pero cercano.")
+    return f"{mensaje} [INSTRUCCIONES: {'. '.join(instrucciones)}]"
+
+PROMPT_SISTEMA_ANTERIOR = """<|system|>
+TU ERES EVA, PERO NUNCA TE PRESENTAS MÁS DE UNA VEZ EN LA CONVERSACIÓN.
+
+⚠️ REGLAS ESTRICTAS DE ABSOLUTO CUMPLIMIENTO ⚠️
+
+>> PRIMERA REGLA: RESPUESTAS CORTAS
+   - MÁXIMO 12 PALABRAS TOTAL
+   - UNA SOLA FRASE DE INFORMACIÓN
+   - UNA SOLA PREGUNTA AL FINAL
+
+>> SEGUNDA REGLA: NO REPETICIÓN
+   - NUNCA TE PRESENTES DOS VECES
+   - NO USAR "SOY EVA DE ANTARES INNOVATE"
+   - NO MENCIONAR "EQUIPO DE ANTARES"
+
+>> TERCERA REGLA: MANTÉN CONTEXTO
+   - USA LA INFORMACIÓN QUE YA DIO EL USUARIO
+   - PREGUNTA SOBRE DETALLES ESPECÍFICOS
+   - EVITA PREGUNTAS GENERALES REPETITIVAS
+
+SERVICIOS Y PRECIOS EXACTOS:
+• Tienda online para vender computadoras: $3,000 USD
+• Campañas en redes sociales: $2,000 USD
+• Mejora de experiencia de usuario: $2,500 USD
+
+EJEMPLOS PERFECTOS (IMITA EXACTAMENTE ESTE ESTILO):
+• "Creamos sitios de ecommerce desde $3,000 USD. ¿Tienes web actualmente?"
+• "Nuestras campañas aumentan ventas un 30%. ¿Vendes online o presencial?"
+• "Podemos empezar este mes. ¿Prefieres reunión jueves o viernes?"
+
+RECUERDA: CORTO, DIRECTO, SIN REPETICIONES.
+
+CONOCIMIENTO DE REFERENCIA:
+"""
+
+def get_filtered_prompt(mensaje, intent, nivel=1):
+    """knowledge_fragments.get_filtered_prompt (ningún ejemplo llega al límite de 7000 caracteres)"""
+    conocimiento = get_fragment_by_intent(intent, nivel)
+    return (f"{PROMPT_SISTEMA_ANTERIOR}{conocimiento}\n"
+            f"<|/system|>\n\n<|user|>\n{mensaje}\n<|/user|>\n\n<|assistant|>")
+
+# Copia literal, espacios incluidos: se cuentan los caracteres tal como se enviaban
+INSTRUCCIONES_OLLAMA_ANTERIOR = """
+            <INSTRUCCIONES>
+            Eres EVA, ejecutiva de ventas de Antares Innovate, una agencia de transformación digital premium.
+            Tu misión es CONSEGUIR CLIENTES ofreciendo servicios digitales como:
+            - Desarrollo web: Sitios profesionales desde $3,000 USD
+            - Landing pages: Optimizadas para conversión desde $1,800 USD
+            - Branding: Identidad visual desde $2,500 USD
+            - Apps: Desarrollo de aplicaciones desde $8,000 USD
+            - Automatización: Soluciones de procesos desde $5,000 USD
+        
+            Tu tono es cálido, profesional y DIRECTO. Siempre menciona "nuestro equipo de Antares" 
+            y propón un próximo paso concreto (reunión, llamada, formulario).
+        
+            RECUERDA:
+            - SÉ CONCISA: Respuestas de máximo 350 caracteres
+            - SIEMPRE menciona un precio aproximado si preguntan por cotizaciones
+             - SIEMPRE ofrece agendar una reunión si el cliente muestra interés
+             - NUNCA uses frases genéricas como "estoy aquí para ayudarte"
+            - NUNCA ignores información previa del cliente (nombre, servicio, etc.)
+            </INSTRUCCIONES>
+            """
+
+def prompt_anterior(mensaje, intent, nivel, perfil):
+    """Prompt completo: las tres etapas encadenadas (OllamaClient._build_prompt_text)"""
+    prompt = get_filtered_prompt(crear_prompt_optimizado(mensaje, perfil), intent, nivel)
+    return f"{INSTRUCCIONES_OLLAMA_ANTERIOR}\n\nUsuario: {prompt}\nEVA:"
+
+def seguimiento_anterior(mensaje, intent, nivel, perfil, include_knowledge, perfil_enviado=None):
+    """
+    Turno sobre el contexto de Ollama: get_followup_prompt anterior y el payload
+    de OllamaClient (el perfil se reenviaba en cada turno, cambiara o no)
+    """
+    prompt = crear_prompt_optimizado(mensaje, perfil)
+    if include_knowledge:
+        prompt = f"[CONOCIMIENTO DE REFERENCIA: {get_fragment_by_intent(intent, nivel)}]\n{prompt}"
+    return f"\nUsuario: {prompt}\nEVA:"
+
+def prefijo_comun(a, b):
+    """Longitud del prefijo común entre dos textos"""
+    i = 0
+    limite = min(len(a), len(b))
+    while i < limite and a[i] == b[i]:
+        i += 1
+    return i
+
+def prompt_actual(mensaje, intent, nivel, sesion):
+    return build_prompt(mensaje, intent, nivel, session_context=sesion)
+
+def seguimiento_actual(mensaje, intent, nivel, sesion, include_knowledge, sesion_enviada):
+    return get_followup_prompt(mensaje, intent, nivel, include_knowledge=include_knowledge,
+                               session_context=sesion if sesion != sesion_enviada else None)
+
+def medir(completo, seguimiento):
+    """
+    Arma todos los turnos de CONVERSACIONES con un armado.
+
+    Returns:
+        Diccionario con los primeros prompts, los prefijos compartidos entre
+        sesiones y entre turnos sucesivos, y los totales enviados
+    """
+    primeros = []
+    sucesivos = []
+    nuevos_sucesivos = []
+    total_completo = 0
+    total_con_contexto = 0
+
+    for turnos in CONVERSACIONES.values():
+        intenciones = set()
+        sesion_enviada = None
+        anterior = None
+        for i, (mensaje, intent, nivel, sesion) in enumerate(turnos):
+            prompt = completo(mensaje, intent, nivel, sesion)
+            total_completo += len(prompt)
+            if anterior is not None:
+                compartido = prefijo_comun(anterior, prompt)
+                sucesivos.append(compartido)
+                nuevos_sucesivos.append(len(prompt) - compartido)
+            anterior = prompt
+
+            if i == 0:
+                primeros.append(prompt)
+                total_con_contexto += len(prompt)
+            else:
+                total_con_contexto += len(seguimiento(mensaje, intent, nivel, sesion,
+                                                      intent not in intenciones, sesion_enviada))
+            intenciones.add(intent)
+            sesion_enviada = sesion
+
+    # Cada primer turno reutiliza el prefijo más largo que comparte con otra sesión
+    nuevos_primeros = [len(a) - max(prefijo_comun(a, b) for j, b in enumerate(primeros) if j != i)
+                       for i, a in enumerate(primeros)]
+
+    return {
+        "primeros": primeros,
+        "entre_sesiones": [prefijo_comun(a, b) for i, a in enumerate(primeros) for b in primeros[i + 1:]],
+        "nuevos_primeros": nuevos_primeros,
+        "sucesivos": sucesivos,
+        "nuevos_sucesivos": nuevos_sucesivos,
+        "total_completo": total_completo,
+        "total_con_contexto": total_con_contexto
+    }
+
+def promedio(valores):
+    return sum(valores) // len(valores)
+
+def main():
+    anterior = medir(prompt_anterior, seguimiento_anterior)
+    actual = medir(prompt_actual, seguimiento_actual)
+
+    print(f"[INFO] Prefijo estático: {len(STATIC_PROMPT_PREFIX)} caracteres (~{len(STATIC_PROMPT_PREFIX) // 4} tokens)")
+    print(f"{'':50}{'anterior':>10}{'actual':>10}")
+    filas = [
+        ("Primer turno promedio", promedio([len(p) for p in anterior["primeros"]]),
+         promedio([len(p) for p in actual["primeros"]])),
+        ("Prefijo entre sesiones (mín)", min(anterior["entre_sesiones"]), min(actual["entre_sesiones"])),
+        ("Prefijo entre sesiones (máx)", max(anterior["entre_sesiones"]), max(actual["entre_sesiones"])),
+        ("Por evaluar en el primer turno (promedio)", promedio(anterior["nuevos_primeros"]),
+         promedio(actual["nuevos_primeros"])),
+        ("Prefijo entre turnos sucesivos (mín)", min(anterior["sucesivos"]), min(actual["sucesivos"])),
+        ("Por evaluar en turnos sucesivos (promedio)", promedio(anterior["nuevos_sucesivos"]),
+         promedio(actual["nuevos_sucesivos"])),
+        ("Total con prompt completo en cada turno", anterior["total_completo"], actual["total_completo"]),
+        ("Total reutilizando contexto de Ollama", anterior["total_con_contexto"], actual["total_con_contexto"]),
+    ]
+    for nombre, valor_anterior, valor_actual in filas:
+        print(f"[INFO] {nombre:43}{valor_anterior:>10}{valor_actual:>10}")
+
+    if promedio(actual["nuevos_primeros"]) > promedio(anterior["nuevos_primeros"]) or \
+            promedio(actual["nuevos_sucesivos"]) > promedio(anterior["nuevos_sucesivos"]):
+        print("[❌] El armado actual deja más caracteres sin prefijo compartido que la línea base")
+        sys.exit(1)
+    print("[✅] Layout de prompt estable")
+
+if __name__ == "__main__":
+    main()
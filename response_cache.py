@@ -0,0 +1,135 @@
+"""
+response_cache.py - Caché de respuestas de Llama3 para mensajes repetidos
+
+Muchos visitantes abren con los mismos mensajes ("hola", "cuánto cuesta una
+página web"). Este caché guarda la respuesta generada por Llama3 con una
+clave formada por el mensaje normalizado, la intención, el pilar, el nivel y
+los datos de sesión del prompt, para no volver a generarla a través del túnel.
+
+- Las entradas expiran tras un TTL y se expulsan en orden LRU al superar el máximo
+- Los mensajes con datos personales (correo o teléfono) no se consultan ni se guardan
+
+Autor: Antares Innovate
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+PHONE_PATTERN = re.compile(r'(?:\+?[0-9]{1,3}[-.\s]?)?[0-9]{2,3}[-.\s]?[0-9]{3,4}[-.\s]?[0-9]{4}')
+
+
+def normalize_message(message):
+    """Minúsculas, sin acentos, sin signos de puntuación y con espacios simples."""
+    text = unicodedata.normalize("NFKD", message.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return " ".join(text.split())
+
+
+def contains_personal_data(message):
+    """Indica si el mensaje incluye un correo o un teléfono."""
+    return bool(EMAIL_PATTERN.search(message) or PHONE_PATTERN.search(message))
+
+
+class ResponseCache:
+    """Caché LRU con expiración de respuestas generadas."""
+
+    def __init__(self, max_entries=1000, ttl=3600):
+        """
+        Inicializa el caché.
+
+        Args:
+            max_entries: Número máximo de respuestas guardadas
+            ttl: Segundos que una respuesta sigue siendo válida
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # clave -> (respuesta, momento de guardado)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(message, intent, pillar, level, context=""):
+        """
+        Construye la clave del caché, o None si el mensaje no debe cachearse.
+
+        Args:
+            message: Mensaje original del usuario
+            intent, pillar, level: Clasificación del mensaje
+            context: Datos de sesión incluidos en el prompt (la respuesta depende de ellos)
+
+        Returns:
+            Tupla clave, o None si el mensaje contiene datos personales o queda vacío
+        """
+        if contains_personal_data(message):
+            return None
+        normalized = normalize_message(message)
+        if not normalized:
+            return None
+        return (normalized, intent, pillar, level, context)
+
+    def get(self, key):
+        """Devuelve la respuesta guardada para la clave, o None."""
+        with self._lock:
+            if key is None:
+                self.bypassed += 1
+                return None
+
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] >= self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, response):
+        """Guarda una respuesta; ignora claves nulas y respuestas vacías."""
+        if key is None or not response:
+            return
+        with self._lock:
+            self._entries[key] = (response, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Vacía el caché (por ejemplo, al cambiar precios o plantillas)."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Devuelve los contadores del caché."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
@@ -0,0 +1,209 @@
+"""
+semantic_cache.py - Caché semántico de respuestas de Llama3
+
+Complementa al caché exacto (response_cache.py): las preguntas sobre precios
+y servicios suelen ser paráfrasis unas de otras ("cuánto sale una web",
+"precio de una página"). Cada mensaje se convierte en un vector (con el
+endpoint de embeddings de Ollama o con un embedding local determinista) y se
+busca por similitud coseno entre las respuestas guardadas de la misma
+intención, pilar, nivel y datos de sesión del prompt (las mismas dimensiones
+que la clave del caché exacto). Si la similitud supera el umbral de la
+intención, se reutiliza la respuesta sin generar.
+
+Los vectores viven en una matriz de NumPy de tamaño fijo que se recorre como
+un buffer circular: al llenarse, la entrada más antigua se reemplaza.
+Sin NumPy el caché queda desactivado.
+
+Autor: Antares Innovate
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from response_cache import contains_personal_data, normalize_message
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+def hashing_embedding(text, dim=256):
+    """
+    Embedding local determinista (hashing de palabras y trigramas de caracteres).
+
+    No entiende sinónimos como un modelo de embeddings, pero reconoce
+    paráfrasis con las mismas palabras y sirve para pruebas sin Ollama.
+    """
+    normalized = normalize_message(text)
+    features = normalized.split()
+    padded = f" {normalized} "
+    features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    vector = [0.0] * dim
+    for feature in features:
+        digest = hashlib.md5(feature.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    return vector
+
+
+class SemanticCache:
+    """Caché de respuestas por similitud coseno de embeddings."""
+
+    def __init__(self, embed_fn, thresholds=None, default_threshold=0.92,
+                 max_entries=500, ttl=3600, max_words=20):
+        """
+        Inicializa el caché.
+
+        Args:
+            embed_fn: Función texto -> lista de floats (o None si falla)
+            thresholds: Umbral de similitud por intención
+            default_threshold: Umbral para intenciones sin entrada en `thresholds`
+            max_entries: Número máximo de respuestas guardadas
+            ttl: Segundos que una respuesta sigue siendo válida
+            max_words: Los mensajes más largos no se consultan (casi nunca se repiten)
+        """
+        self.embed_fn = embed_fn
+        self.thresholds = thresholds or {}
+        self.default_threshold = default_threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_words = max_words
+        self.enabled = NUMPY_AVAILABLE and embed_fn is not None
+
+        self._matrix = None            # max_entries x dim, filas normalizadas
+        self._intents = [None] * max_entries
+        self._pillars = [None] * max_entries
+        self._levels = [None] * max_entries
+        self._contexts = [None] * max_entries
+        self._responses = [None] * max_entries
+        self._stored_at = [0.0] * max_entries
+        self._count = 0
+        self._next = 0                 # Próxima fila a escribir (buffer circular)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.embed_errors = 0
+
+    def threshold(self, intent):
+        """Umbral de similitud para la intención."""
+        return self.thresholds.get(intent, self.default_threshold)
+
+    def embed(self, message):
+        """
+        Devuelve el vector normalizado del mensaje, o None si el mensaje no debe
+        cachearse o el embedding falla.
+        """
+        if not self.enabled or contains_personal_data(message):
+            return None
+        if self.max_words and len(message.split()) > self.max_words:
+            return None
+        try:
+            embedding = self.embed_fn(message)
+        except Exception as e:
+            print(f"[ERROR] al calcular embedding: {str(e)}")
+            embedding = None
+        if not embedding:
+            with self._lock:
+                self.embed_errors += 1
+            return None
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0 or math.isnan(norm):
+            return None
+        return vector / norm
+
+    def get(self, vector, intent, pillar, level, context=""):
+        """
+        Busca la respuesta más parecida de la misma intención, pilar, nivel y
+        datos de sesión.
+
+        Args:
+            vector: Resultado de embed() (None = no consultar)
+            intent, pillar, level: Clasificación del mensaje
+            context: Datos de sesión incluidos en el prompt (la respuesta depende de ellos)
+
+        Returns:
+            Respuesta guardada si supera el umbral de la intención, o None
+        """
+        with self._lock:
+            if vector is None:
+                self.bypassed += 1
+                return None
+            if self._count == 0 or self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+
+            # Recorrer de mayor a menor similitud hasta caer bajo el umbral
+            similarities = self._matrix[:self._count] @ vector
+            threshold = self.threshold(intent)
+            now = time.monotonic()
+            best_index = None
+            for index in np.argsort(similarities)[::-1]:
+                if similarities[index] < threshold:
+                    break
+                if (self._intents[index] != intent or self._pillars[index] != pillar
+                        or self._levels[index] != level or self._contexts[index] != context):
+                    continue
+                if self.ttl and now - self._stored_at[index] >= self.ttl:
+                    continue
+                best_index = index
+                break
+
+            if best_index is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._responses[best_index]
+
+    def put(self, vector, intent, pillar, level, response, context=""):
+        """Guarda una respuesta junto con el vector de su mensaje y sus datos de sesión."""
+        if vector is None or not response:
+            return
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                # Primer vector (o cambio de modelo de embeddings): se dimensiona la matriz
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._count = 0
+                self._next = 0
+
+            index = self._next
+            self._matrix[index] = vector
+            self._intents[index] = intent
+            self._pillars[index] = pillar
+            self._levels[index] = level
+            self._contexts[index] = context
+            self._responses[index] = response
+            self._stored_at[index] = time.monotonic()
+            self._next = (self._next + 1) % self.max_entries
+            self._count = min(self._count + 1, self.max_entries)
+
+    def clear(self):
+        """Vacía el caché."""
+        with self._lock:
+            self._matrix = None
+            self._count = 0
+            self._next = 0
+
+    def stats(self):
+        """Devuelve los contadores del caché."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "embed_errors": self.embed_errors
+            }
@@ -1,46 +1,63 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-from eva_llama_14 import EvaAssistant, CONFIG
+from eva_llama_14 import EvaAssistant, CONFIG, analyze_message, get_engine, write_ollama_urls_file
+from admission import AdmissionRejected
 from db import guardar_conversacion
+from session_store import SessionStore
+import metrics
+import hmac
+import json
 import os
 import re
+import threading
+import time
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["Server-Timing", "Retry-After"])
 
-# Diccionario para mantener instancias por sesión
-eva_instances = {}
+# Métricas del servidor para /metrics (por proceso de gunicorn)
+solicitudes_http = metrics.Counter()        # (ruta, método, código) -> total
+latencia_http = metrics.HistogramVec()      # (ruta,) -> duración
+latencia_db = metrics.HistogramVec()        # (rol,) -> duración de la escritura
+errores_db = metrics.Counter()              # (rol,) -> escrituras fallidas
 
-# Almacén simple para datos de usuario por sesión
-user_sessions = {}
+def estimar_tamano_sesion(sesion):
+    """Estima los bytes que ocupa una sesión (instancia de Eva + perfil)"""
+    eva = sesion["eva"]
+    # Base aproximada de una instancia (estado del usuario; los clientes son compartidos)
+    tamano = 8 * 1024
+    for mensaje in eva.conversation_history:
+        tamano += 256 + len(mensaje.get("contenido", "")) * 2
+    return tamano
 
-def extraer_info_usuario(mensaje):
-    """Extrae información relevante del usuario del mensaje"""
+# Sesiones activas: instancia de Eva y perfil del usuario, con límite LRU e inactividad
+sesiones = SessionStore(
+    max_sessions=CONFIG["session_max_count"],
+    idle_ttl=CONFIG["session_idle_ttl"],
+    memory_budget_mb=CONFIG["session_memory_budget_mb"],
+    size_estimator=estimar_tamano_sesion
+)
+
+def crear_sesion():
+    """Crea una sesión nueva con su instancia de Eva y el candado de su turno en curso"""
+    return {"eva": EvaAssistant(typing_simulation=False), "perfil": {}, "turno": threading.Lock()}
+
+class TurnoEnCurso(Exception):
+    """La sesión ya tiene un turno en curso (doble envío o /chat con un stream abierto)"""
+
+def extraer_info_usuario(mensaje, analisis=None):
+    """Extrae información relevante del usuario del mensaje (analisis: resultado de analyze_message)"""
+    if analisis is None:
+        analisis = analyze_message(mensaje)
     info = {}
     
-    # Extraer nombre - evitar extraer "Eva" como nombre del cliente
-    nombre_match = re.search(r'(?:me llamo|soy|mi nombre es) ([A-Za-záéíóúÁÉÍÓÚñÑ]+)', mensaje.lower())
-    if nombre_match:
-        nombre = nombre_match.group(1).strip().capitalize()
-        # Verificar que no sea "Eva" para evitar confusiones
-        if nombre.lower() != "eva":
-            info['nombre'] = nombre
+    # Nombre del cliente (analyze_message descarta "Eva")
+    if analisis.profile_name:
+        info['nombre'] = analisis.profile_name
     
-    # Detectar servicio de interés
-    if any(s in mensaje.lower() for s in ["landing page", "landing"]):
-        info['servicio'] = "landing"
-    elif any(s in mensaje.lower() for s in ["tienda", "ecommerce", "vender"]):
-        info['servicio'] = "ecommerce"
-    elif any(s in mensaje.lower() for s in ["web", "sitio", "página", "pagina"]):
-        info['servicio'] = "web"
-    elif any(s in mensaje.lower() for s in ["app", "aplicación", "aplicacion", "móvil"]):
-        info['servicio'] = "app"
-    elif any(s in mensaje.lower() for s in ["marca", "logo", "branding"]):
-        info['servicio'] = "branding"
-    elif any(s in mensaje.lower() for s in ["automatizar", "automatización", "proceso", "negocio"]):
-        info['servicio'] = "automatizacion"
-    elif any(s in mensaje.lower() for s in ["instagram", "redes", "social", "facebook"]):
-        info['servicio'] = "marketing"
+    # Servicio de interés (el primero en orden de prioridad)
+    if analisis.service:
+        info['servicio'] = analisis.service
     
     return info
 
@@ -70,43 +87,130 @@ def limpiar_mensaje(mensaje):
     
     return mensaje_limpio
 
-def crear_prompt_optimizado(mensaje, session_id):
-    """Crea un prompt optimizado con instrucciones claras"""
-    # Inicializar o actualizar sesión
-    if session_id not in user_sessions:
-        user_sessions[session_id] = {}
+def actualizar_perfil(mensaje, perfil, analisis=None):
+    """Actualiza el perfil del cliente con la información del mensaje"""
+    perfil.update(extraer_info_usuario(mensaje, analisis))
+    return perfil
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio_solicitud = time.perf_counter()
+
+@app.after_request
+def registrar_solicitud(respuesta):
+    """Cuenta la solicitud y su latencia por ruta (en streaming, hasta abrir el stream)"""
+    ruta = request.url_rule.rule if request.url_rule is not None else "desconocida"
+    solicitudes_http.inc((ruta, request.method, str(respuesta.status_code)))
+    inicio = g.get("inicio_solicitud")
+    if inicio is not None:
+        latencia_http.labels(ruta).observe(time.perf_counter() - inicio)
+    return respuesta
+
+@app.route("/", methods=["GET"])
+def home():
+    return "EVA está corriendo en Render 🚀"
+
+def preparar_turno(data):
+    """
+    Limpia el mensaje, recupera la sesión de Eva y actualiza el perfil del cliente.
+
+    El mensaje se analiza una sola vez (analyze_message); el mismo análisis
+    sirve para el perfil y se pasa a Eva para clasificar el turno.
+
+    Toma el candado del turno de la sesión: el llamador debe liberarlo con
+    terminar_turno cuando termine la respuesta.
+
+    Raises:
+        TurnoEnCurso: Si la sesión ya está respondiendo otro mensaje
+    """
+    # Obtener y limpiar mensaje del usuario
+    mensaje_original = data["message"]
+    user_message = limpiar_mensaje(mensaje_original)
+    analisis = analyze_message(user_message)
     
-    # Actualizar información del usuario
-    info_usuario = extraer_info_usuario(mensaje)
-    user_sessions[session_id].update(info_usuario)
+    session_id = data.get("sessionId", "default")
     
-    # Preparar prompt con instrucciones específicas
-    instrucciones = []
+    # Crear instancia de Eva o recuperar la existente
+    sesion = sesiones.get_or_create(session_id, crear_sesion)
+    eva = sesion["eva"]
+
+    # Un turno a la vez por sesión: dos turnos simultáneos modificarían el mismo
+    # historial y el mismo contexto de Ollama
+    if not sesion["turno"].acquire(blocking=False):
+        raise TurnoEnCurso(session_id)
     
-    # Añadir nombre si existe
-    if user_sessions[session_id].get('nombre'):
-        instrucciones.append(f"El cliente se llama {user_sessions[session_id]['nombre']}. Dirígete a él/ella por su nombre.")
+    # Optimizar historial para evitar sobrecarga de tokens
+    eva.trim_history(6)
     
-    # Añadir servicio si existe
-    if user_sessions[session_id].get('servicio'):
-        servicio = user_sessions[session_id]['servicio']
-        instrucciones.append(f"Está interesado en nuestro servicio de {servicio}.")
+    # Actualizar perfil; Eva lo incluye al final del prompt
+    perfil = actualizar_perfil(user_message, sesion["perfil"], analisis)
     
-    # Añadir instrucciones generales
-    instrucciones.append("Identifícate como Eva de Antares Innovate.")
-    instrucciones.append("Mantén un tono profesional pero cercano.")
+    # Modificar CONFIG para asegurar respuestas completas
+    # Establecer límites más altos para no truncar las respuestas
+    CONFIG["max_response_length"] = 1000
+    CONFIG["short_response_length"] = 500
     
-    # Crear prompt final
-    if instrucciones:
-        prompt_optimizado = f"{mensaje} [INSTRUCCIONES: {'. '.join(instrucciones)}]"
+    return session_id, user_message, sesion, perfil, analisis
+
+def terminar_turno(sesion):
+    """Libera el candado del turno tomado por preparar_turno"""
+    sesion["turno"].release()
+
+def guardar_turno(user_message, response, session_id):
+    """Guarda el mensaje del usuario y la respuesta de Eva en la base de datos"""
+    try:
+        with metrics.stage("db_usuario"):
+            escribir_db("usuario", user_message, session_id)
+        with metrics.stage("db_asistente"):
+            escribir_db("asistente", response, session_id)
+    except Exception as db_error:
+        print(f"[ERROR DB] {db_error}")
+
+def escribir_db(rol, mensaje, session_id):
+    """Escribe un mensaje en Postgres registrando la latencia y los fallos"""
+    inicio = time.perf_counter()
+    try:
+        guardado = guardar_conversacion(rol, mensaje, session_id)
+    except Exception:
+        guardado = False
+        raise
+    finally:
+        latencia_db.labels(rol).observe(time.perf_counter() - inicio)
+        if not guardado:
+            errores_db.inc((rol,))
+
+def respuesta_saturado(error):
+    """Respuesta 503 con Retry-After cuando Ollama no tiene turno disponible"""
+    respuesta = jsonify({"error": "EVA está atendiendo muchas conversaciones. Intenta de nuevo en unos segundos.",
+                         "motivo": error.reason})
+    respuesta.status_code = 503
+    respuesta.headers["Retry-After"] = str(int(error.retry_after))
+    return respuesta
+
+def respuesta_turno_en_curso():
+    """Respuesta 409 cuando la sesión todavía está respondiendo un mensaje anterior"""
+    respuesta = jsonify({"error": "EVA todavía está respondiendo tu mensaje anterior. Espera la respuesta e intenta de nuevo."})
+    respuesta.status_code = 409
+    return respuesta
+
+def iniciar_cronometro():
+    """Abre el cronómetro de etapas del turno si está activado"""
+    if CONFIG["stage_timing"]:
+        metrics.start_turn()
     else:
-        prompt_optimizado = mensaje
-    
-    return prompt_optimizado
+        metrics.discard_turn()
 
-@app.route("/", methods=["GET"])
-def home():
-    return "EVA está corriendo en Render 🚀"
+def cerrar_cronometro(respuesta=None):
+    """Acumula los tiempos del turno y, en depuración, los agrega como cabecera Server-Timing"""
+    cronometro = metrics.finish_turn()
+    if respuesta is not None and cronometro is not None and (CONFIG["timing_header"] or CONFIG["debug"]):
+        respuesta.headers["Server-Timing"] = cronometro.server_timing()
+    return respuesta
+
+def evento_sse(datos, evento=None):
+    """Formatea un evento Server-Sent Events"""
+    linea_evento = f"event: {evento}\n" if evento else ""
+    return f"{linea_evento}data: {json.dumps(datos, ensure_ascii=False)}\n\n"
 
 @app.route("/chat", methods=["POST"])
 def chat():
@@ -116,70 +220,254 @@ def chat():
         if not data or "message" not in data:
             return jsonify({"error": "Falta el campo 'message' en el JSON."}), 400
 
-        # Obtener y limpiar mensaje del usuario
-        mensaje_original = data["message"]
-        user_message = limpiar_mensaje(mensaje_original)
-        
-        session_id = data.get("sessionId", "default")
-        
-        # Crear instancia de Eva o recuperar la existente
-        if session_id not in eva_instances:
-            eva_instances[session_id] = EvaAssistant(typing_simulation=False)
-        
-        eva = eva_instances[session_id]
-        
-        # Optimizar historial para evitar sobrecarga de tokens
-        if len(eva.conversation_history) > 6:
-            eva.conversation_history = eva.conversation_history[-6:]
-        
-        # Crear prompt optimizado
-        prompt_optimizado = crear_prompt_optimizado(user_message, session_id)
-        
-        # Modificar CONFIG para asegurar respuestas completas
-        # Establecer límites más altos para no truncar las respuestas
-        CONFIG["max_response_length"] = 1000
-        CONFIG["short_response_length"] = 500
-        
-        # Generar respuesta
-        response = eva.get_response(prompt_optimizado)
-        
-        # NO modificar la respuesta generada
-        # Usamos la respuesta tal cual viene de Ollama
-        
-        # Guardar conversación
+        iniciar_cronometro()
+        with metrics.stage("preparacion"):
+            session_id, user_message, sesion, perfil, analisis = preparar_turno(data)
+
         try:
-            guardar_conversacion("usuario", user_message, session_id)
-            guardar_conversacion("asistente", response, session_id)
-        except Exception as db_error:
-            print(f"[ERROR DB] {db_error}")
+            # Generar respuesta
+            response = sesion["eva"].get_response(user_message, perfil_cliente=perfil, analysis=analisis)
+
+            # NO modificar la respuesta generada
+            # Usamos la respuesta tal cual viene de Ollama
 
-        return jsonify({
+            # Guardar conversación
+            guardar_turno(user_message, response, session_id)
+            sesiones.touch(session_id)
+        finally:
+            terminar_turno(sesion)
+
+        return cerrar_cronometro(jsonify({
             "message": user_message,
             "response": response,
             "sessionId": session_id
-        })
+        }))
 
+    except TurnoEnCurso:
+        metrics.discard_turn()
+        return respuesta_turno_en_curso()
+    except AdmissionRejected as e:
+        metrics.discard_turn()
+        return respuesta_saturado(e)
     except Exception as e:
+        metrics.discard_turn()
         print(f"[ERROR] {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Igual que /chat, pero responde con Server-Sent Events a medida que Ollama genera.
+
+    Eventos emitidos:
+        data: {"delta": "..."}                               fragmento de la respuesta
+        event: done / data: {"response": ..., "sessionId": ...}  respuesta completa
+        event: error / data: {"error": ...}                  error durante la generación
+    """
+    data = request.get_json()
+
+    if not data or "message" not in data:
+        return jsonify({"error": "Falta el campo 'message' en el JSON."}), 400
+
+    try:
+        iniciar_cronometro()
+        with metrics.stage("preparacion"):
+            session_id, user_message, sesion, perfil, analisis = preparar_turno(data)
+    except TurnoEnCurso:
+        metrics.discard_turn()
+        return respuesta_turno_en_curso()
+    except Exception as e:
+        metrics.discard_turn()
+        print(f"[ERROR] {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    try:
+        fragmentos = sesion["eva"].get_response_stream(user_message, perfil_cliente=perfil, analysis=analisis)
+        # El primer fragmento se pide antes de responder: si Ollama está saturado
+        # todavía se puede contestar 503 en lugar de abrir el stream
+        primero = next(fragmentos, None)
+    except AdmissionRejected as e:
+        terminar_turno(sesion)
+        metrics.discard_turn()
+        return respuesta_saturado(e)
+    except Exception as e:
+        terminar_turno(sesion)
+        metrics.discard_turn()
+        print(f"[ERROR] {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    def generar():
+        partes = []
+        try:
+            if primero is not None:
+                partes.append(primero)
+                yield evento_sse({"delta": primero})
+            for fragmento in fragmentos:
+                partes.append(fragmento)
+                yield evento_sse({"delta": fragmento})
+        except Exception as e:
+            metrics.discard_turn()
+            print(f"[ERROR] {str(e)}")
+            yield evento_sse({"error": str(e)}, evento="error")
+            return
+
+        response = "".join(partes)
+        guardar_turno(user_message, response, session_id)
+        sesiones.touch(session_id)
+        # En streaming los encabezados ya se enviaron: los tiempos solo van a los histogramas
+        cerrar_cronometro()
+        yield evento_sse({
+            "message": user_message,
+            "response": response,
+            "sessionId": session_id
+        }, evento="done")
+
+    def cerrar():
+        # Se llama al cerrar la respuesta, aunque el cliente se haya desconectado:
+        # cierra el turno de Eva si quedó a medias y libera la sesión
+        try:
+            fragmentos.close()
+        finally:
+            terminar_turno(sesion)
+
+    respuesta = Response(
+        stream_with_context(generar()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    respuesta.call_on_close(cerrar)
+    return respuesta
+
 @app.route("/reiniciar", methods=["POST"])
 def reiniciar():
     try:
         data = request.get_json()
         session_id = data.get("sessionId", "default")
 
-        if session_id in eva_instances:
-            del eva_instances[session_id]
-        
-        if session_id in user_sessions:
-            del user_sessions[session_id]
+        sesiones.remove(session_id)
 
         return jsonify({"status": "ok", "message": "Eva reiniciada correctamente"})
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route("/health", methods=["GET"])
+def health():
+    # Siempre 200: Render reinicia la instancia si el health check falla, y con
+    # Ollama caído EVA sigue atendiendo con plantillas
+    motor = get_engine().get_stats()
+    circuito = motor["circuit"]
+    return jsonify({
+        "status": "ok" if circuito["state"] == "closed" else "degradado",
+        "ollama": circuito,
+        "sesiones": sesiones.stats(),
+        "motor": motor,
+        "tiempos": metrics.stage_stats()
+    })
+
+@app.route("/metrics", methods=["GET"])
+def metricas():
+    """Métricas del proceso en el formato de texto de Prometheus"""
+    motor = get_engine()
+    cliente = motor.ollama_client
+    ollama = cliente.get_stats()
+    estadisticas = motor.get_stats()
+    caches = [("exacto", estadisticas["response_cache"]), ("semantico", estadisticas["semantic_cache"]),
+              ("sesiones", sesiones.stats())]
+    admision = estadisticas["admission"]
+    circuito = {"closed": 0, "half_open": 1, "open": 2}[estadisticas["circuit"]["state"]]
+    plazo = estadisticas["deadline"]
+
+    bloques = [
+        metrics.format_metric("eva_http_requests_total", "counter", "Solicitudes HTTP por ruta, método y código",
+                              solicitudes_http.items(), ("route", "method", "status")),
+        metrics.format_histograms("eva_http_request_duration_seconds", "Latencia de las solicitudes HTTP por ruta",
+                                  latencia_http.items(), ("route",)),
+        metrics.format_metric("eva_ollama_calls_total", "counter", "Llamadas HTTP a Ollama", ollama["calls"]),
+        metrics.format_metric("eva_ollama_errors_total", "counter", "Llamadas a Ollama fallidas", ollama["errors"]),
+        metrics.format_metric("eva_ollama_retries_total", "counter", "Reintentos de llamadas a Ollama", ollama["retries"]),
+        metrics.format_histograms("eva_ollama_first_token_seconds", "Latencia hasta el primer token de Ollama",
+                                  cliente.first_token_latency),
+        metrics.format_histograms("eva_ollama_generation_seconds", "Duración de las generaciones de Ollama",
+                                  cliente.generation_latency),
+        metrics.format_metric("eva_ollama_tokens_total", "counter", "Tokens de Ollama por tipo",
+                              [(("prompt",), ollama["prompt_tokens"]), (("generated",), ollama["generated_tokens"]),
+                               (("context_saved",), ollama["context_tokens_saved"])], ("type",)),
+        metrics.format_metric("eva_ollama_backend_healthy", "gauge", "Servidores de Ollama sanos",
+                              [((b["url"],), b["healthy"]) for b in ollama["backends"]], ("backend",)),
+        metrics.format_metric("eva_ollama_circuit_state", "gauge", "Cortacircuitos (0 cerrado, 1 semiabierto, 2 abierto)",
+                              circuito),
+        metrics.format_metric("eva_ollama_concurrency_limit", "gauge", "Generaciones simultáneas permitidas",
+                              admision["limit"]),
+        metrics.format_metric("eva_ollama_in_flight", "gauge", "Generaciones en curso", admision["in_flight"]),
+        metrics.format_metric("eva_ollama_queue_depth", "gauge", "Solicitudes esperando turno", admision["queue_depth"]),
+        metrics.format_metric("eva_ollama_rejected_total", "counter", "Solicitudes rechazadas por saturación",
+                              [(("queue_full",), admision["rejected_full"]), (("timeout",), admision["timed_out"])],
+                              ("reason",)),
+        metrics.format_metric("eva_llm_turns_total", "counter", "Turnos por intención y si usaron Llama3",
+                              [((intent, "true"), n) for intent, n in estadisticas["llm_calls"].items()] +
+                              [((intent, "false"), n) for intent, n in estadisticas["llm_calls_avoided"].items()],
+                              ("intent", "used_llm")),
+        metrics.format_metric("eva_response_deadline_total", "counter", "Plazos de respuesta cumplidos y vencidos",
+                              [((evento,), plazo[evento]) for evento in ("met", "fired", "late_cached", "late_discarded", "late_cancelled")],
+                              ("event",)),
+        metrics.format_metric("eva_sessions_active", "gauge", "Sesiones activas", sesiones.stats()["sessions"]),
+        metrics.format_metric("eva_cache_hits_total", "counter", "Aciertos de caché",
+                              [((nombre,), datos["hits"]) for nombre, datos in caches], ("cache",)),
+        metrics.format_metric("eva_cache_misses_total", "counter", "Fallos de caché",
+                              [((nombre,), datos["misses"]) for nombre, datos in caches], ("cache",)),
+        metrics.format_metric("eva_cache_hit_ratio", "gauge", "Tasa de aciertos de caché",
+                              [((nombre,), datos["hit_rate"]) for nombre, datos in caches], ("cache",)),
+        metrics.format_histograms("eva_db_write_duration_seconds", "Latencia de las escrituras en Postgres",
+                                  latencia_db.items(), ("role",)),
+        metrics.format_metric("eva_db_write_errors_total", "counter", "Escrituras en Postgres fallidas",
+                              errores_db.items(), ("role",)),
+        metrics.format_histograms("eva_stage_duration_seconds", "Duración de cada etapa del turno",
+                                  [((nombre,), h) for nombre, h in sorted(metrics.stage_histograms().items())],
+                                  ("stage",)),
+    ]
+    return Response("\n".join(bloques) + "\n", mimetype="text/plain; version=0.0.4")
+
+def token_admin_valido():
+    """Compara el token de la cabecera X-Admin-Token con ADMIN_TOKEN en tiempo constante"""
+    token_esperado = os.environ.get("ADMIN_TOKEN", "")
+    token_recibido = request.headers.get("X-Admin-Token", "")
+    if not token_esperado:
+        return False
+    return hmac.compare_digest(token_recibido.encode("utf-8"), token_esperado.encode("utf-8"))
+
+@app.route("/admin/ollama", methods=["GET", "POST"])
+def admin_ollama():
+    """
+    Consulta o cambia en caliente los servidores de Ollama sin reiniciar el proceso.
+
+    POST body: {"urls": ["https://nuevo.loca.lt"]} o {"url": "https://nuevo.loca.lt"}
+    Requiere la cabecera X-Admin-Token igual a la variable de entorno ADMIN_TOKEN.
+    """
+    if not token_admin_valido():
+        return jsonify({"error": "No autorizado"}), 401
+
+    cliente = get_engine().ollama_client
+    if request.method == "GET":
+        return jsonify({"backends": cliente.get_backends_status()})
+
+    data = request.get_json(silent=True) or {}
+    urls = data.get("urls") or ([data["url"]] if data.get("url") else [])
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    if not urls or not all(isinstance(u, str) and re.match(r'^https?://', u.strip()) for u in urls):
+        return jsonify({"error": "Se esperaba 'urls' con una o más URLs http(s)."}), 400
+
+    try:
+        activas = cliente.set_backends(urls)
+        # El archivo vigilado propaga el cambio al resto de workers en su próximo chequeo
+        write_ollama_urls_file(activas, CONFIG["ollama_urls_file"])
+    except Exception as e:
+        print(f"[ERROR] {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"status": "ok", "backends": activas})
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     app.run(host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""
+session_store.py - Almacén de sesiones acotado para el servidor de Eva
+
+Reemplaza los diccionarios globales sin límite de server.py. Cada sesión se
+guarda junto con su último acceso y se expulsa cuando:
+1. Supera el tiempo de inactividad configurado (TTL)
+2. Se excede el número máximo de sesiones (se expulsa la menos usada, LRU)
+3. Se excede el presupuesto de memoria estimado (también en orden LRU)
+
+Autor: Antares Innovate
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class SessionStore:
+    """Almacén LRU con expiración por inactividad y presupuesto de memoria."""
+
+    def __init__(self, max_sessions=500, idle_ttl=1800, memory_budget_mb=256,
+                 size_estimator=None, on_evict=None):
+        """
+        Inicializa el almacén.
+
+        Args:
+            max_sessions: Número máximo de sesiones simultáneas
+            idle_ttl: Segundos de inactividad tras los cuales se expulsa una sesión
+            memory_budget_mb: Memoria estimada máxima para todas las sesiones
+            size_estimator: Función que estima los bytes de una sesión
+            on_evict: Función llamada con (session_id, valor) al expulsar una sesión
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.size_estimator = size_estimator or sys.getsizeof
+        self.on_evict = on_evict
+
+        self._sessions = OrderedDict()  # session_id -> [valor, último acceso, tamaño estimado]
+        self._total_size = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_or_create(self, session_id, factory):
+        """
+        Devuelve la sesión existente o crea una nueva con `factory()`.
+
+        `factory()` se llama sin tomar el candado del almacén (puede ser lenta),
+        así no bloquea las búsquedas de otras sesiones. Si dos hilos crean la
+        misma sesión a la vez, se queda la primera en guardarse y la otra se
+        descarta con `on_evict`.
+
+        Args:
+            session_id: Identificador de la sesión
+            factory: Función sin argumentos que crea el valor de la sesión
+
+        Returns:
+            Valor asociado a la sesión
+        """
+        with self._lock:
+            self._purge_expired()
+            value = self._lookup(session_id)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        created = factory()
+
+        with self._lock:
+            value = self._lookup(session_id)
+            if value is None:
+                self._sessions[session_id] = [created, time.monotonic(), 0]
+                self._update_size(session_id)
+                self._enforce_limits(keep=session_id)
+                return created
+        # Otro hilo creó la sesión mientras tanto
+        self._close(session_id, created)
+        return value
+
+    def touch(self, session_id):
+        """Actualiza el tamaño estimado de una sesión tras modificarla."""
+        with self._lock:
+            if session_id in self._sessions:
+                self._update_size(session_id)
+                self._enforce_limits(keep=session_id)
+
+    def remove(self, session_id):
+        """Elimina una sesión sin contarla como expulsión. Devuelve True si existía."""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return False
+            self._total_size -= entry[2]
+        self._close(session_id, entry[0])
+        return True
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        """Devuelve los contadores del almacén."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "estimated_bytes": self._total_size,
+                "memory_budget_bytes": self.memory_budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def _lookup(self, session_id):
+        """Devuelve el valor de la sesión y actualiza su último acceso, o None si no existe."""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        entry[1] = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return entry[0]
+
+    def _update_size(self, session_id):
+        entry = self._sessions[session_id]
+        new_size = self.size_estimator(entry[0])
+        self._total_size += new_size - entry[2]
+        entry[2] = new_size
+
+    def _purge_expired(self):
+        """Expulsa las sesiones inactivas; las más antiguas están al principio."""
+        if not self.idle_ttl:
+            return
+        now = time.monotonic()
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if now - entry[1] < self.idle_ttl:
+                break
+            self._evict(session_id)
+            self.expirations += 1
+
+    def _enforce_limits(self, keep=None):
+        """Expulsa sesiones LRU mientras se excedan el máximo o el presupuesto de memoria."""
+        while self._sessions and (
+                len(self._sessions) > self.max_sessions or
+                (self.memory_budget and self._total_size > self.memory_budget)):
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                # Nunca expulsar la sesión que se está usando en este momento
+                break
+            self._evict(session_id)
+            self.evictions += 1
+
+    def _evict(self, session_id):
+        entry = self._sessions.pop(session_id)
+        self._total_size -= entry[2]
+        self._close(session_id, entry[0])
+
+    def _close(self, session_id, value):
+        if self.on_evict is None:
+            return
+        try:
+            self.on_evict(session_id, value)
+        except Exception as e:
+            print(f"[ERROR] al cerrar la sesión {session_id}: {e}")